@@ -0,0 +1,92 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.batch
+===========
+Fan-out bakes: many packages against one base AMI, in parallel, from a manifest
+
+    environment: ec2_yum_linux
+    args: [-B, ami-12345678, --vm-type, hvm]
+    packages:
+      - mypkg
+      - name: otherpkg
+        args: [-n, otherpkg-custom-name]
+"""
+import logging
+from copy import deepcopy
+
+import yaml
+
+from gator.config import init_parser
+from gator.daemon import BakeRunner
+from gator.plugins import PluginManager
+
+
+__all__ = ('BatchBake', 'load_manifest')
+log = logging.getLogger(__name__)
+
+
+def load_manifest(filename):
+    with open(filename) as f:
+        manifest = yaml.safe_load(f) or {}
+    if not manifest.get('packages'):
+        raise ValueError('Manifest {0} lists no packages'.format(filename))
+    return manifest
+
+
+class BatchBake(object):
+    """
+    Bakes every package in a manifest through one BakeRunner: configuration and the AWS
+    session are loaded once and each bake runs in a forked worker with its own EC2
+    connection. Parallelism defaults to the number of free block devices
+    """
+    def __init__(self, config, manifest, concurrency=None):
+        self._config = config
+        self._environment = manifest.get('environment') or config.environments.default
+        common = [str(arg) for arg in manifest.get('args', [])]
+        self._bakes = []
+        for package in manifest['packages']:
+            if isinstance(package, dict):
+                name, extra = package['name'], [str(arg) for arg in package.get('args', [])]
+            else:
+                name, extra = package, []
+            self._bakes.append((name, common + extra + [name]))
+        self._concurrency = concurrency
+        self.jobs = []
+
+    def _free_slots(self):
+        config = deepcopy(self._config)
+        parser = init_parser(config, argv=self._bakes[0][1])
+        plugins = config.environments[self._environment]
+        plugin_manager = PluginManager(config, parser, plugins=plugins)
+        blockdevice = plugin_manager.find_by_kind('blockdevice', plugins.blockdevice).obj
+        return blockdevice.available_devices()
+
+    def run(self):
+        concurrency = self._concurrency or self._free_slots()
+        if concurrency is None:
+            concurrency = self._config.daemon.get('max_concurrent_bakes', 4)
+        concurrency = max(1, min(concurrency, len(self._bakes)))
+        log.info('Baking {0} packages, {1} at a time'.format(len(self._bakes), concurrency))
+
+        runner = BakeRunner(self._config, concurrency=concurrency).start()
+        try:
+            self.jobs = [(name, runner.submit(argv, self._environment)) for name, argv in self._bakes]
+            for _, job in self.jobs:
+                job.wait()
+        finally:
+            runner.stop()
+        return all(job.returncode == 0 for _, job in self.jobs)
+
+    def report(self):
+        rows = [('PACKAGE', 'STATUS', 'RC', 'SECONDS', 'AMI')]
+        for name, job in self.jobs:
+            duration = '{0:.1f}'.format(job.duration) if job.duration is not None else '-'
+            ami = ' '.join(x for x in (job.ami_id, job.ami_name) if x) or '-'
+            rows.append((name, job.status, str(job.returncode), duration, ami))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join('  '.join(col.ljust(width) for col, width in zip(row, widths)).rstrip() for row in rows)
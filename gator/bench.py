@@ -0,0 +1,236 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.bench
+===========
+End-to-end bake benchmark: repeated full bakes of a generated fixture package, usually
+against the local cloud and loop devices, timed per stage from the bake timeline and
+compared against a stored baseline
+"""
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+from copy import deepcopy
+from datetime import datetime
+from fnmatch import fnmatch
+from glob import glob
+
+import gator
+from gator.daemon import BakeRunner
+from gator.util.linux import mkdir_p, monitor_command
+
+
+__all__ = ('Benchmark', 'build_fixture', 'compare', 'report', 'stage_durations')
+log = logging.getLogger(__name__)
+
+# benchmark stage -> timeline span(s) measuring it
+STAGES = (
+    ('attach', 'gator.volume.linux.attach.duration'),
+    ('resize', 'gator.volume.linux.resize.duration'),
+    ('chroot', 'gator.distro.linux.configure_chroot.duration'),
+    ('install', 'gator.provisioner.*.provision_package.duration'),
+    ('provision_scripts', 'gator.provisioner.provision_scripts.duration'),
+    ('snapshot', 'gator.finalizer.tagging_ebs.snapshot_volume.duration'),
+    ('register', 'gator.finalizer.tagging_ebs.register_image.duration'),
+)
+
+FIXTURE_NAME = 'gator-bench-fixture'
+
+_PROVISION_SCRIPT = """#!/bin/sh
+# gator bench provision script: touch every payload file
+find /opt/{name} -type f -exec cat {{}} + > /dev/null
+"""
+
+_RPM_SPEC = """Name: {name}
+Version: {version}
+Release: 1
+Summary: gator benchmark fixture
+License: Proprietary
+BuildArch: noarch
+AutoReqProv: no
+
+%description
+gator benchmark fixture: {files} files, {size} bytes
+
+%install
+cp -a {payload}/. %{{buildroot}}/
+
+%files
+/opt/{name}
+/var/local/{name}.sh
+"""
+
+
+def _write_payload(root, name, size, files):
+    data_dir = os.path.join(root, 'opt', name)
+    mkdir_p(data_dir)
+    files = max(1, int(files))
+    chunk = size // files
+    for i in range(files):
+        with open(os.path.join(data_dir, 'data-{0:06d}'.format(i)), 'wb') as f:
+            # incompressible, so package and snapshot sizes match the requested size
+            f.write(os.urandom(chunk + (size % files if i == 0 else 0)))
+    scripts_dir = os.path.join(root, 'var', 'local')
+    mkdir_p(scripts_dir)
+    script = os.path.join(scripts_dir, '{0}.sh'.format(name))
+    with open(script, 'w') as f:
+        f.write(_PROVISION_SCRIPT.format(name=name))
+    os.chmod(script, 0o755)
+
+
+def build_fixture(kind, directory, size, files, name=FIXTURE_NAME, version='1.0'):
+    """
+    Build a deb or rpm of size bytes spread over files payload files, plus a provision
+    script in /var/local. Returns the package path
+    """
+    mkdir_p(directory)
+    workdir = tempfile.mkdtemp(dir=directory)
+    try:
+        payload = os.path.join(workdir, 'payload')
+        _write_payload(payload, name, size, files)
+        if kind == 'deb':
+            control_dir = os.path.join(payload, 'DEBIAN')
+            mkdir_p(control_dir)
+            with open(os.path.join(control_dir, 'control'), 'w') as f:
+                f.write('Package: {0}\nVersion: {1}\nArchitecture: all\nMaintainer: gator bench\n'
+                        'Description: gator benchmark fixture\n'.format(name, version))
+            package = os.path.join(directory, '{0}_{1}_all.deb'.format(name, version))
+            result = monitor_command(['dpkg-deb', '--build', payload, package])
+        elif kind == 'rpm':
+            spec = os.path.join(workdir, '{0}.spec'.format(name))
+            with open(spec, 'w') as f:
+                f.write(_RPM_SPEC.format(name=name, version=version, files=files, size=size, payload=payload))
+            result = monitor_command(['rpmbuild', '-bb', '--define', '_topdir {0}'.format(os.path.join(workdir, 'rpmbuild')),
+                                      '--define', '_rpmdir {0}'.format(directory), '--define', '_build_name_fmt %%{NAME}-%%{VERSION}-%%{RELEASE}.%%{ARCH}.rpm',
+                                      spec])
+            package = os.path.join(directory, '{0}-{1}-1.noarch.rpm'.format(name, version))
+        else:
+            raise ValueError('Unknown fixture package kind {0}'.format(kind))
+        if not result.success:
+            raise RuntimeError('Building {0} fixture failed: {1}'.format(kind, result.result.std_err))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    log.info('Built {0} fixture {1} ({2} bytes in {3} files)'.format(kind, package, size, files))
+    return package
+
+
+def stage_durations(trace):
+    """ benchmark stage -> seconds, plus the bake's total, from a Chrome trace dict """
+    events = [event for event in trace['traceEvents'] if event.get('ph') == 'X']
+    durations = {}
+    for stage, pattern in STAGES:
+        matched = [event['dur'] for event in events if fnmatch(event['name'], pattern)]
+        if matched:
+            durations[stage] = sum(matched) / 1e6
+    if events:
+        durations['total'] = max(event['ts'] + event['dur'] for event in events) / 1e6
+    return durations
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def compare(results, baseline, tolerance=0.1, noise=0.05):
+    """
+    Per-stage comparison of median timings. A stage regresses when it is slower than the
+    baseline by more than tolerance (a fraction) and by more than noise seconds.
+    Returns (rows, regressions)
+    """
+    rows = []
+    regressions = []
+    for stage in [name for name, _ in STAGES] + ['total']:
+        current = results['stages'].get(stage, {}).get('median')
+        previous = baseline['stages'].get(stage, {}).get('median')
+        if current is None or previous is None:
+            continue
+        change = (current - previous) / previous if previous else 0.0
+        regressed = change > tolerance and current - previous > noise
+        if regressed:
+            regressions.append(stage)
+        rows.append((stage, previous, current, change, regressed))
+    return rows, regressions
+
+
+class Benchmark(object):
+    """
+    Runs full bakes of a fixture package one after another through a BakeRunner, with
+    the bake timeline enabled, and collects per-stage timings
+    """
+    def __init__(self, config, environment, args, kind, size, files, runs, workdir):
+        self._config = deepcopy(config)
+        self._environment = environment
+        self._args = list(args)
+        self._kind = kind
+        self._size = size
+        self._files = files
+        self._runs = runs
+        self._workdir = workdir
+        self._trace_dir = os.path.join(workdir, 'traces')
+        self._config.trace.enabled = True
+        self._config.trace.directory = self._trace_dir
+
+    def run(self):
+        mkdir_p(self._trace_dir)
+        package = build_fixture(self._kind, os.path.join(self._workdir, 'fixtures'), self._size, self._files)
+        stamp = '{0:%Y%m%d%H%M%S}'.format(datetime.utcnow())
+        runs = []
+        runner = BakeRunner(self._config, concurrency=1).start()
+        try:
+            for i in range(self._runs):
+                seen = set(glob(os.path.join(self._trace_dir, '*.trace.json')))
+                # local installs move the package into the volume, so every bake gets a copy
+                run_package = os.path.join(self._workdir, 'run', os.path.basename(package))
+                mkdir_p(os.path.dirname(run_package))
+                shutil.copy(package, run_package)
+                argv = self._args + ['--trace', '-n', '{0}-{1}-{2}'.format(FIXTURE_NAME, stamp, i), run_package]
+                job = runner.submit(argv, self._environment)
+                job.wait()
+                run = {'returncode': job.returncode, 'ami_id': job.ami_id, 'stages': {}}
+                traces = set(glob(os.path.join(self._trace_dir, '*.trace.json'))) - seen
+                if traces:
+                    with open(traces.pop()) as f:
+                        run['stages'] = stage_durations(json.load(f))
+                log.info('Benchmark run {0}/{1}: rc {2}, {3:.3f}s'.format(i + 1, self._runs, job.returncode, run['stages'].get('total', 0.0)))
+                runs.append(run)
+        finally:
+            runner.stop()
+
+        stages = {}
+        for stage in [name for name, _ in STAGES] + ['total']:
+            values = [run['stages'][stage] for run in runs if run['returncode'] == 0 and stage in run['stages']]
+            if values:
+                stages[stage] = {'median': _median(values), 'min': min(values), 'max': max(values)}
+        return {
+            'gator_version': gator.__version__,
+            'timestamp': '{0:%F %T UTC}'.format(datetime.utcnow()),
+            'host': platform.node(),
+            'environment': self._environment,
+            'fixture': {'kind': self._kind, 'size': self._size, 'files': self._files},
+            'runs': runs,
+            'stages': stages,
+        }
+
+
+def report(results, comparison=None):
+    if comparison is None:
+        rows = [('STAGE', 'MEDIAN', 'MIN', 'MAX')]
+        for stage in [name for name, _ in STAGES] + ['total']:
+            if stage in results['stages']:
+                timing = results['stages'][stage]
+                rows.append((stage, '{0:.3f}'.format(timing['median']), '{0:.3f}'.format(timing['min']), '{0:.3f}'.format(timing['max'])))
+    else:
+        rows = [('STAGE', 'BASELINE', 'CURRENT', 'CHANGE', '')]
+        for stage, previous, current, change, regressed in comparison:
+            rows.append((stage, '{0:.3f}'.format(previous), '{0:.3f}'.format(current), '{0:+.1%}'.format(change), 'REGRESSION' if regressed else ''))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(col.ljust(width) for col, width in zip(row, widths)).rstrip() for row in rows)
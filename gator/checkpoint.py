@@ -0,0 +1,68 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.checkpoint
+================
+Per-bake record of finished stages, so a failed bake can be resumed with --resume
+"""
+import json
+import logging
+import os
+import uuid
+
+from gator.exceptions import CheckpointException
+from gator.util.linux import mkdir_p
+
+
+__all__ = ('Checkpoint',)
+log = logging.getLogger(__name__)
+
+
+class Checkpoint(object):
+    """
+    Stage names and the state needed to skip them (volume, snapshot and AMI ids, S3
+    bundle manifests, package attributes, AMI naming), written as JSON under
+    checkpoint_dir after every stage
+    """
+    def __init__(self, directory, bake_id=None):
+        self.bake_id = bake_id or uuid.uuid4().hex[:12]
+        self._path = os.path.join(directory, '{0}.json'.format(self.bake_id))
+        self.stages = []
+        self.state = {}
+
+    @classmethod
+    def load(cls, directory, bake_id):
+        checkpoint = cls(directory, bake_id)
+        if not os.path.isfile(checkpoint._path):
+            raise CheckpointException('No checkpoint found for bake {0} in {1}'.format(bake_id, directory))
+        with open(checkpoint._path) as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise CheckpointException('Checkpoint {0} for bake {1} is corrupt, start a new bake: {2}'.format(checkpoint._path, bake_id, e))
+        checkpoint.stages = data.get('stages', [])
+        checkpoint.state = data.get('state', {})
+        log.info('Loaded checkpoint for bake {0}, finished stages: {1}'.format(bake_id, ', '.join(checkpoint.stages) or 'none'))
+        return checkpoint
+
+    def done(self, stage):
+        return stage in self.stages
+
+    def record(self, stage, **state):
+        if stage not in self.stages:
+            self.stages.append(stage)
+        self.state.update((key, value) for key, value in state.items() if value is not None)
+        mkdir_p(os.path.dirname(self._path))
+        tmp_path = '{0}.tmp'.format(self._path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'bake_id': self.bake_id, 'stages': self.stages, 'state': self.state}, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self._path)
+        log.debug('Checkpoint {0}: {1} done'.format(self.bake_id, stage))
+
+    def discard(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
@@ -10,16 +10,27 @@
 import logging
 import sys
 
-from gator.config import Argparser
-from gator.core import Aminator
 
-
-__all__ = ('run',)
+__all__ = ('run', 'serve', 'batch', 'bench')
 log = logging.getLogger(__name__)
 
 
 def run():
     import os
+    profiler = None
+    if '--profile-startup' in sys.argv:
+        from gator.util.startup import StartupProfiler
+        sys.argv.remove('--profile-startup')
+        profiler = StartupProfiler().begin()
+    # imported here so --profile-startup sees them
+    from gator.config import Argparser
+    from gator.core import Aminator
+
+    commands = {'serve': serve, 'batch': batch, 'bench': bench}
+    if sys.argv[1:2] and sys.argv[1] in commands:
+        # these run for a long while (or forever), so report startup before handing over
+        _report_startup(profiler)
+        return commands[sys.argv[1]]()
     # we throw this one away, real parsing happens later
     # this is just for getting a debug flag for verbose logging.
     # to be extra sneaky, we add a --debug to the REAL parsers so it shows up in help
@@ -38,7 +49,123 @@ def run():
         logging.basicConfig(level=logging.DEBUG)
     else:
         logging.basicConfig()
-    sys.exit(Aminator(debug=args.debug, envname=args.env).aminate())
+    try:
+        aminator = Aminator(debug=args.debug, envname=args.env)
+    finally:
+        # also reached when argparse exits for --help or bad arguments
+        _report_startup(profiler)
+    sys.exit(aminator.aminate())
+
+
+def _report_startup(profiler):
+    if profiler is not None:
+        profiler.finish()
+        sys.stderr.write(profiler.report() + '\n')
+
+
+def serve():
+    import argparse
+    from gator.config import load_config
+    from gator.daemon import BakeRunner, BakeServer
+
+    parser = argparse.ArgumentParser(prog='gator serve', description='Run gator as a long-lived bake service')
+    parser.add_argument('--socket', dest='socket', help='Unix socket to accept bake jobs on (default from daemon.socket config)')
+    parser.add_argument('--listen', dest='listen', metavar='HOST:PORT', help='Accept bake jobs over HTTP on HOST:PORT instead of a Unix socket')
+    parser.add_argument('--allow-remote', dest='allow_remote', action='store_true',
+                        help='Allow --listen on a non-loopback address. The API is unauthenticated and bakes run as root')
+    parser.add_argument('-j', '--concurrency', dest='concurrency', type=int, help='Maximum number of concurrent bakes (default from daemon.max_concurrent_bakes config)')
+    parser.add_argument('--debug', action='store_true', help='Verbose debugging output')
+    args = parser.parse_args(sys.argv[2:])
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig()
+    config = load_config(debug=args.debug)
+    daemon_config = config.daemon
+    runner = BakeRunner(config, concurrency=args.concurrency)
+    server = BakeServer(runner, socket_path=args.socket or daemon_config.socket, listen=args.listen or daemon_config.get('listen'),
+                        allow_remote=args.allow_remote or daemon_config.get('allow_remote', False))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info('Gator bake service stopped')
+    return 0
+
+
+def batch():
+    import argparse
+    from gator.batch import BatchBake, load_manifest
+    from gator.config import load_config
+
+    parser = argparse.ArgumentParser(prog='gator batch', description='Bake every package in a manifest against one base AMI in parallel')
+    parser.add_argument('manifest', help='YAML manifest: environment, common args and a list of packages')
+    parser.add_argument('-j', '--concurrency', dest='concurrency', type=int, help='Maximum number of concurrent bakes (default: number of free block devices)')
+    parser.add_argument('--debug', action='store_true', help='Verbose debugging output')
+    args = parser.parse_args(sys.argv[2:])
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig()
+    config = load_config(debug=args.debug)
+    bake = BatchBake(config, load_manifest(args.manifest), concurrency=args.concurrency)
+    ok = bake.run()
+    print(bake.report())
+    return 0 if ok else 1
+
+
+def bench():
+    import argparse
+    import json
+    import os
+    from gator.bench import Benchmark, compare, report
+    from gator.config import load_config
+
+    parser = argparse.ArgumentParser(prog='gator bench', description='Time full bakes of a generated fixture package, stage by stage',
+                                     epilog='Arguments after -- are passed to every bake, e.g. -- -b my-base-image')
+    parser.add_argument('-e', '--environment', dest='env', help='Bake environment (default from bench.environment config)')
+    parser.add_argument('--kind', choices=['deb', 'rpm'], help='Fixture package type (default: rpm, or deb for apt environments)')
+    parser.add_argument('--size', type=int, help='Fixture payload size in bytes')
+    parser.add_argument('--files', type=int, help='Number of fixture payload files')
+    parser.add_argument('-n', '--runs', type=int, help='Number of bakes')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against results JSON from an earlier run; exits 1 on a regression')
+    parser.add_argument('--debug', action='store_true', help='Verbose debugging output')
+    parser.add_argument('bake_args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[2:])
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig()
+    config = load_config(debug=args.debug)
+    bench_config = config.bench
+    environment = args.env or bench_config.environment
+    kind = args.kind or ('deb' if 'apt' in config.environments[environment].provisioner else 'rpm')
+    bake_args = [arg for arg in args.bake_args if arg != '--']
+    workdir = os.path.join(config.aminator_root, bench_config.directory)
+
+    benchmark = Benchmark(config, environment, bake_args, kind,
+                          size=args.size or bench_config.fixture_size,
+                          files=args.files or bench_config.fixture_files,
+                          runs=args.runs or bench_config.runs,
+                          workdir=workdir)
+    results = benchmark.run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    failed = [run for run in results['runs'] if run['returncode'] != 0]
+    if failed:
+        print('{0} of {1} bakes failed'.format(len(failed), len(results['runs'])))
+    if not args.baseline:
+        print(report(results))
+        return 1 if failed else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(results, baseline, tolerance=bench_config.tolerance, noise=bench_config.noise)
+    print(report(results, rows))
+    return 1 if failed or regressions else 0
 
 
 def plugin_manager():
@@ -10,12 +10,14 @@ gator.config
 gator configuration, argument handling, and logging setup
 """
 import argparse
-from fileinput import filename
 import logging
 import os
+import pickle
+import stat
 import sys
-from copy import deepcopy
+import threading
 from datetime import datetime
+from importlib.resources import files
 
 from gator.util import randword
 try:
@@ -24,7 +26,6 @@ except ImportError:
     from logutils.dictconfig import dictConfig
 
 import bunch
-from pkg_resources import resource_string, resource_exists
 
 try:
     from yaml import CLoader as Loader
@@ -38,6 +39,21 @@ __all__ = ()
 log = logging.getLogger(__name__)
 _action_registries = argparse.ArgumentParser()._registries['action']
 
+
+# importlib.resources in place of pkg_resources, whose import scans every installed
+# distribution and dominated CLI startup
+def resource_string(namespace, name):
+    return files(namespace).joinpath(name).read_bytes()
+
+
+def resource_exists(namespace, name):
+    return files(namespace).joinpath(name).is_file()
+
+
+def resource_filename(namespace, name):
+    return str(files(namespace).joinpath(name))
+
+
 RSRC_PKG = 'gator'
 RSRC_DEFAULT_CONF_DIR = 'default_conf'
 RSRC_DEFAULT_CONFS = {
@@ -46,16 +62,23 @@ RSRC_DEFAULT_CONFS = {
     'environments': os.path.join(RSRC_DEFAULT_CONF_DIR, 'environments.yml'),
 }
 
-
 def init_defaults(argv=None, debug=False):
-    argv = argv or sys.argv[1:]
-    config = Config.from_defaults()
-    config = config.dict_merge(config, Config.from_files(config.config_files.main, config.config_root))
-    default_metrics = getattr(config.environments, "metrics", "logger")
-    for env in config.environments:
-        if isinstance(config.environments[env], dict):
-            if "metrics" not in config.environments[env]:
-                config.environments[env]["metrics"] = default_metrics
+    config = load_config(debug=debug)
+    plugin_parser = init_parser(config, argv=argv)
+    log.info('Gator {0} default configuration loaded'.format(gator.__version__))
+    return config, plugin_parser
+
+
+def load_config(debug=False):
+    defaults = Config.from_defaults()
+    # the main config can't be cached anywhere it decides itself, so its cache sits
+    # under the packaged default aminator_root
+    cache = config_cache(defaults)
+    config = cache.get('gator', main_sources(defaults))
+    if config is None:
+        config = build_config(cache, defaults)
+    else:
+        log.debug('Configuration loaded from {0}'.format(cache.filename))
 
     if config.logging.base.enabled:
         dictConfig(config.logging.base.config.toDict())
@@ -63,23 +86,75 @@ def init_defaults(argv=None, debug=False):
         logging.getLogger().setLevel(logging.DEBUG)
         for handler in logging.getLogger().handlers:
             handler.setLevel(logging.DEBUG)
+    return config
+
+
+def main_sources(defaults):
+    """ the files the main configuration is built from, in order """
+    sources = [resource_filename(RSRC_PKG, name) for name in RSRC_DEFAULT_CONFS.values()]
+    sources.extend(config_paths(defaults.config_files.main, defaults.config_root))
+    return sources
+
+
+def build_config(cache=None, defaults=None):
+    """ merge the packaged defaults with the configured files, caching the result """
+    config = defaults if defaults is not None else Config.from_defaults()
+    sources = main_sources(config)
+    fingerprint = cache.fingerprint(sources) if cache else None
+    config = config.dict_merge(config, Config.from_files(config.config_files.main, config.config_root))
+
+    # the main config may point logging and environments at other files
+    for key, config_cls in (('logging', LoggingConfig), ('environments', EnvironmentConfig)):
+        key_files = config.config_files.get(key, [])
+        if cache:
+            fingerprint += cache.fingerprint(config_paths(key_files, config.config_root))
+        config[key] = config_cls.dict_merge(config_cls.from_defaults(), config_cls.from_files(key_files, config.config_root))
+
+    default_metrics = getattr(config.environments, "metrics", "logger")
+    for env in config.environments:
+        if isinstance(config.environments[env], dict):
+            if "metrics" not in config.environments[env]:
+                config.environments[env]["metrics"] = default_metrics
+    if cache:
+        cache.put('gator', sources, fingerprint, config)
+    return config
 
+
+def init_parser(config, argv=None):
+    """
+    Build a fresh argument parser bound to config. Config actions capture the config
+    they write into, so every bake (see gator.daemon) needs its own parser
+    """
+    argv = argv if argv is not None else sys.argv[1:]
+    main_parser = Argparser(add_help=False)
     add_base_arguments(parser=main_parser, config=config)
-    plugin_parser = Argparser(argv=argv, add_help=True, argument_default=argparse.SUPPRESS, parents=[main_parser])
-    log.info('Gator {0} default configuration loaded'.format(gator.__version__))
-    return config, plugin_parser
+    return Argparser(argv=argv, add_help=True, argument_default=argparse.SUPPRESS, parents=[main_parser._parser])
+
+
+def _to_config(value):
+    """ nested mappings become Config nodes, like the root """
+    if isinstance(value, dict):
+        return Config((k, _to_config(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_to_config(v) for v in value]
+    return value
 
 
 class Config(bunch.Bunch):
     """
     Base config class
+
+    Merges share structure: only the nodes both sides define are copied, everything
+    else is referenced. Bakes sharing a process each take a deep copy of the tree
+    (see gator.daemon), so none of them reaches a node another one writes to
     """
     resource_package = RSRC_PKG
     resource_default = RSRC_DEFAULT_CONFS['main']
 
     @classmethod
     def from_yaml(cls, yaml_data, Loader=Loader, *args, **kwargs):
-        return cls(cls.fromYAML(yaml_data, Loader=Loader, *args, **kwargs))
+        data = cls.fromYAML(yaml_data, Loader=Loader, *args, **kwargs) or {}
+        return cls((k, _to_config(v)) for k, v in data.items())
 
     @classmethod
     def from_pkg_resource(cls, namespace, name, *args, **kwargs):
@@ -100,9 +175,7 @@ class Config(bunch.Bunch):
 
     @classmethod
     def from_files(cls, files, config_root="", *args, **kwargs):
-        _files = [os.path.expanduser(filename) for filename in files]
-        _files = [(x if x.startswith('/') else os.path.join(config_root, x)) for x in _files]
-        _files = [filename for filename in _files if os.path.exists(filename)]
+        _files = [filename for filename in config_paths(files, config_root) if os.path.exists(filename)]
         _config = cls()
         for filename in _files:
             _new = cls.from_file(filename, *args, **kwargs)
@@ -124,18 +197,131 @@ class Config(bunch.Bunch):
 
     @staticmethod
     def dict_merge(old, new):
-        res = deepcopy(old)
-        for k, v in new.iteritems():
-            if k in res and isinstance(res[k], dict):
-                res[k] = Config.dict_merge(res[k], v)
+        """
+        new layered over old. Neither is modified; the result references their subtrees
+        wherever only one side defines them
+        """
+        res = old.__class__(dict.items(old)) if isinstance(old, Config) else Config(old)
+        for k, v in dict.items(new):
+            current = dict.get(res, k)
+            if isinstance(current, dict) and isinstance(v, dict):
+                res[k] = Config.dict_merge(current, v)
             else:
-                res[k] = deepcopy(v)
+                res[k] = v
         return res
 
     def __call__(self):
         return
 
 
+def config_paths(files, config_root=""):
+    """ absolute paths of config files, relative ones taken from config_root """
+    _files = [os.path.expanduser(filename) for filename in files]
+    return [(x if x.startswith('/') else os.path.join(config_root, x)) for x in _files]
+
+
+def _private(path):
+    """ whether path belongs to this user and no one else may write to it """
+    st = os.stat(path)
+    return st.st_uid == os.geteuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+class ConfigCache(object):
+    """
+    Merged configuration trees, pickled into one file. Entries are keyed by name and the
+    ordered list of files the tree is built from, so a different config_root or home
+    directory never matches another's entry. An entry is reused while the path, mtime
+    and size of every file that contributed to it, and the gator version, are unchanged.
+    The file is only read when it and its directory belong to this user and no one else
+    may write to them
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(sources):
+        fingerprint = []
+        for source in sources:
+            try:
+                st = os.stat(source)
+            except OSError:
+                # a file that appears later must invalidate the entry as well
+                fingerprint.append((source, None, None))
+            else:
+                fingerprint.append((source, st.st_mtime_ns, st.st_size))
+        return fingerprint
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                if not (_private(os.path.dirname(self.filename)) and _private(self.filename)):
+                    log.warning('Ignoring configuration cache {0}: it may be written by other users'.format(self.filename))
+                    entries = {}
+                else:
+                    with open(self.filename, 'rb') as f:
+                        entries = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                entries = {}
+            if not isinstance(entries, dict) or entries.get('version') != gator.__version__:
+                entries = {'version': gator.__version__}
+            self._entries = entries
+        return self._entries
+
+    def get(self, name, sources):
+        """ the cached tree named name built from sources, None when missing or stale """
+        with self._lock:
+            entry = self._load().get((name, tuple(sources)))
+        if entry is None:
+            return None
+        fingerprint, data = entry
+        if self.fingerprint(source for source, _, _ in fingerprint) != fingerprint:
+            log.debug('Cached {0} configuration is stale'.format(name))
+            return None
+        # every caller gets its own tree
+        return pickle.loads(data)
+
+    def put(self, name, sources, fingerprint, config):
+        """ cache the tree named name built from sources, as of fingerprint """
+        with self._lock:
+            entries = self._load()
+            entries[(name, tuple(sources))] = (fingerprint, pickle.dumps(config, pickle.HIGHEST_PROTOCOL))
+            directory = os.path.dirname(self.filename)
+            tmp_filename = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+            try:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory, 0o700)
+                if not _private(directory):
+                    log.debug('Not writing configuration cache {0}: its directory may be written by other users'.format(self.filename))
+                    return
+                with os.fdopen(os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                    pickle.dump(entries, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_filename, self.filename)
+            except (IOError, OSError) as e:
+                log.debug('Unable to write configuration cache {0}: {1}'.format(self.filename, e))
+
+
+_config_caches = {}
+_config_caches_lock = threading.Lock()
+
+
+def config_cache_path(config):
+    """ the config cache file config names, relative to its aminator_root unless it starts with / or ~ """
+    if config.config_cache.startswith(('/', '~')):
+        return os.path.expanduser(config.config_cache)
+    return os.path.join(config.aminator_root, config.config_cache)
+
+
+def config_cache(config):
+    """ the process-wide cache kept in the file config names """
+    filename = config_cache_path(config)
+    with _config_caches_lock:
+        if filename not in _config_caches:
+            _config_caches[filename] = ConfigCache(filename)
+        return _config_caches[filename]
+
+
 class LoggingConfig(Config):
     """
     Logging config class
@@ -198,15 +384,22 @@ class PluginConfig(Config):
         resource_path = os.path.join(RSRC_DEFAULT_CONF_DIR, resource_file)
         return super(PluginConfig, cls).from_defaults(namespace=namespace, name=resource_path, *args, **kwargs)
 
+    @staticmethod
+    def default_path(namespace, name):
+        return resource_filename(namespace, os.path.join(RSRC_DEFAULT_CONF_DIR, '.'.join((namespace, name, 'yml'))))
+
 
 class Argparser(object):
     """
     Argument parser class. Holds the keys to argparse
     """
     def __init__(self, argv=None, *args, **kwargs):
-        self._argv = argv or sys.argv[1:]
+        self._argv = argv if argv is not None else sys.argv[1:]
         self._parser = argparse.ArgumentParser(*args, **kwargs)
 
+    def parse_args(self, args=None, namespace=None):
+        return self._parser.parse_args(self._argv if args is None else args, namespace)
+
     def add_config_arg(self, *args, **kwargs):
         config = kwargs.pop('config', Config())
         _action = kwargs.pop('action', None)
@@ -222,9 +415,13 @@ def add_base_arguments(parser, config):
     parser.add_config_arg('arg', metavar='package_spec', config=config.context.package, help='package to aminate. A string resolvable by the native package manager or a file system path or http url to the package file.')
     parser.add_config_arg('-e', '--environment', config=config.context, help='The environment configuration for amination')
     parser.add_config_arg('--preserve-on-error', action='store_true', config=config.context, help='For Debugging. Preserve build chroot on error')
+    parser.add_config_arg('--resume', metavar='BAKE_ID', config=config.context, help='Resume a failed bake from its last finished stage. Pass the same arguments as the failed bake')
+    parser.add_config_arg('--trace', action='store_true', config=config.context, help='Write a Chrome trace of the bake timeline and log a per-stage summary')
     parser.add_config_arg('--verify-https', action='store_true', config=config.context, help='Specify if one wishes for plugins to verify SSL certs when hitting https URLs')
-    parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(aminator.__version__))
+    parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(gator.__version__))
     parser.add_argument('--debug', action='store_true', help='Verbose debugging output')
+    # handled in gator.cli before anything is imported; listed here for --help
+    parser.add_argument('--profile-startup', action='store_true', help='Report import and initialization time per module on stderr')
 
 
 def conf_action(config, action=None):
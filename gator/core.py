@@ -14,6 +14,7 @@ from gator.config import init_defaults, configure_datetime_logfile
 from gator.environment import Environment
 from gator.plugins import PluginManager
 from gator.util.linux import mkdir_p
+from gator.util.trace import span
 
 __all__ = ('Gator',)
 log = logging.getLogger(__name__)
@@ -24,15 +25,18 @@ class Aminator(object):
         log.info('Gator starting...')
         if not all((config, parser)):
             log.debug('Loading default configuration')
-            config, parser = init_defaults(debug=debug)
+            with span('load configuration', 'init'):
+                config, parser = init_defaults(debug=debug)
         self.config = config
         self.parser = parser
         log.debug('Configuration loaded')
         if not envname:
             envname = self.config.environments.default
-        self.plugin_manager = plugin_manager(self.config, self.parser, plugins=self.config.environments[envname])
+        with span('load plugins', 'init'):
+            self.plugin_manager = plugin_manager(self.config, self.parser, plugins=self.config.environments[envname])
         log.debug('Plugins loaded')
-        self.parser.parse_args()
+        with span('parse arguments', 'init'):
+            self.parser.parse_args()
         log.debug('Args parsed')
 
         os.environ["GATOR_PACKAGE"] = self.config.context.package.arg
@@ -42,13 +46,15 @@ class Aminator(object):
         mkdir_p(os.path.join(self.config.aminator_root, self.config.lock_dir))
         mkdir_p(os.path.join(self.config.aminator_root, self.config.volume_dir))
 
+        self.environment = environment()
+
+    def aminate(self):
+        # per-package logging swaps handlers process-wide, so it happens here rather than in
+        # __init__: the bake daemon prepares jobs in its own process and aminates in a worker
         if self.config.logging.aminator.enabled:
             log.debug('Configuring per-package logging')
             configure_datetime_logfile(self.config, 'gator')
 
-        self.environment = environment()
-
-    def aminate(self):
         with self.environment(self.config, self.plugin_manager) as env:
             ok = env.provision()
             if ok:
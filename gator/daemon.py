@@ -0,0 +1,336 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.daemon
+============
+Long-running bake service. Configuration, the plugin registry, cloud sessions (resolved
+credentials and API models) and resolved base AMIs stay warm in the service process;
+each bake runs in a forked worker so chroots, mounts and environment variables never
+leak between concurrent bakes. Workers open their own cloud connections, since sockets
+cannot be shared across the fork.
+"""
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import uuid
+from copy import deepcopy
+from datetime import datetime, timedelta
+from queue import Queue
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from gator.config import init_parser
+from gator.core import Aminator
+from gator.util.linux import mkdir_p
+
+
+__all__ = ('BakeJob', 'BakeRunner', 'BakeServer')
+log = logging.getLogger(__name__)
+
+
+class BakeJob(object):
+    """
+    A single bake request and its outcome
+    """
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+    def __init__(self, argv, environment=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.argv = list(argv)
+        self.environment = environment
+        self.status = self.QUEUED
+        self.returncode = None
+        self.error = None
+        self.submitted = datetime.utcnow()
+        self.started = None
+        self.finished = None
+        self.ami_id = None
+        self.ami_name = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def finish(self, returncode, error=None):
+        self.returncode = returncode
+        self.error = error
+        self.status = self.SUCCEEDED if returncode == 0 else self.FAILED
+        self.finished = datetime.utcnow()
+        self._done.set()
+
+    def to_dict(self):
+        def _ts(value):
+            return '{0:%F %T UTC}'.format(value) if value else None
+        return {
+            'id': self.id,
+            'argv': self.argv,
+            'environment': self.environment,
+            'status': self.status,
+            'returncode': self.returncode,
+            'error': self.error,
+            'submitted': _ts(self.submitted),
+            'started': _ts(self.started),
+            'finished': _ts(self.finished),
+            'ami_id': self.ami_id,
+            'ami_name': self.ami_name,
+        }
+
+    @property
+    def duration(self):
+        if not all((self.started, self.finished)):
+            return None
+        return (self.finished - self.started).total_seconds()
+
+
+def _aminate(aminator, results):
+    returncode = aminator.aminate()
+    ami = aminator.config.context.ami
+    results.send({'ami_id': getattr(ami.get('image'), 'id', None), 'ami_name': ami.get('name')})
+    sys.exit(returncode)
+
+
+class BakeRunner(object):
+    """
+    Queue of bake jobs executed by a fixed number of workers against warm shared state
+    """
+    def __init__(self, config, concurrency=None, plugin_manager=None, aminator=Aminator):
+        self._config = config
+        self._plugin_manager = plugin_manager
+        self._aminator = aminator
+        self._concurrency = int(concurrency or config.daemon.get('max_concurrent_bakes', 4))
+        self._queue = Queue()
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        # finished jobs are kept for reporting, at most this many and for this long
+        self._finished_jobs = int(config.daemon.get('finished_jobs', 1000))
+        self._job_ttl = timedelta(seconds=int(config.daemon.get('finished_job_ttl', 86400)))
+        # job preparation reconfigures the shared plugin instances, so it is serialized
+        # and the worker is forked before the lock is released
+        self._prepare_lock = threading.Lock()
+        self._fork = multiprocessing.get_context('fork')
+        self._workers = []
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    def start(self):
+        log.info('Starting {0} bake workers'.format(self._concurrency))
+        for i in range(self._concurrency):
+            worker = threading.Thread(target=self._work, name='gator-bake-{0}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def stop(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def submit(self, argv, environment=None):
+        job = BakeJob(argv, environment)
+        with self._jobs_lock:
+            self._expire_jobs()
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        log.info('Bake {0} queued: {1}'.format(job.id, ' '.join(job.argv)))
+        return job
+
+    def _expire_jobs(self):
+        """ forget finished jobs past their ttl, and the oldest beyond the finished job limit """
+        expired = datetime.utcnow() - self._job_ttl
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished)
+        for i, job in enumerate(finished):
+            if job.finished < expired or i < len(finished) - self._finished_jobs:
+                del self._jobs[job.id]
+
+    def job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._jobs_lock:
+            self._expire_jobs()
+            return sorted(self._jobs.values(), key=lambda job: job.submitted)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            except Exception as e:
+                errstr = 'Bake {0} failed: {1}'.format(job.id, e)
+                log.error(errstr)
+                log.debug(errstr, exc_info=True)
+                job.finish(1, str(e))
+
+    def _prepare(self, job):
+        # stage threads read and write the bake's config concurrently, so it is a full copy
+        config = deepcopy(self._config)
+        argv = job.argv + (['-e', job.environment] if job.environment else [])
+        parser = init_parser(config, argv=argv)
+        kwargs = {'config': config, 'parser': parser, 'envname': job.environment}
+        if self._plugin_manager is not None:
+            kwargs['plugin_manager'] = self._plugin_manager
+        aminator = self._aminator(**kwargs)
+        environment = aminator.environment(aminator.config, aminator.plugin_manager)
+        environment.cloud.prewarm()
+        return aminator
+
+    def _run(self, job):
+        job.status = BakeJob.RUNNING
+        job.started = datetime.utcnow()
+        with self._prepare_lock:
+            try:
+                aminator = self._prepare(job)
+            except SystemExit as e:
+                # argparse reports bad arguments by exiting
+                job.finish(e.code or 2, 'invalid arguments')
+                return
+            results, worker_results = self._fork.Pipe(duplex=False)
+            worker = self._fork.Process(target=_aminate, args=(aminator, worker_results), name='gator-bake-{0}'.format(job.id))
+            worker.start()
+            worker_results.close()
+        log.info('Bake {0} running in pid {1}'.format(job.id, worker.pid))
+        try:
+            if results.poll(None):
+                summary = results.recv()
+                job.ami_id, job.ami_name = summary['ami_id'], summary['ami_name']
+        except EOFError:
+            # the worker died before reporting
+            pass
+        finally:
+            results.close()
+        worker.join()
+        job.finish(worker.exitcode)
+        log.info('Bake {0} {1} ({2})'.format(job.id, job.status, job.returncode))
+
+
+class _BakeRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs {"argv": [...], "environment": "..."} queues a bake
+    GET /jobs lists bakes, GET /jobs/<id> reports one
+    """
+    server_version = 'gator'
+
+    def log_message(self, format, *args):
+        log.debug('{0} {1}'.format(self.command, format % args))
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        runner = self.server.runner
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            return self._reply(200, [job.to_dict() for job in runner.jobs()])
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = runner.job(parts[1])
+            if job is not None:
+                return self._reply(200, job.to_dict())
+        return self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.strip('/') != 'jobs':
+            return self._reply(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            argv = request['argv']
+            if not isinstance(argv, list):
+                raise ValueError('argv must be a list')
+        except (KeyError, ValueError) as e:
+            return self._reply(400, {'error': 'invalid request: {0}'.format(e)})
+        job = self.server.runner.submit(argv, request.get('environment'))
+        return self._reply(202, job.to_dict())
+
+
+class _UnixBakeRequestHandler(_BakeRequestHandler):
+    def address_string(self):
+        return 'unix'
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _is_loopback(host, port):
+    try:
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(address[4][0].split('%')[0]).is_loopback for address in addresses)
+
+
+class BakeServer(object):
+    """
+    HTTP front end for a BakeRunner, listening on a Unix socket or host:port. The API is
+    unauthenticated and runs bakes as root, so host:port must be a loopback address
+    unless allow_remote is set
+    """
+    def __init__(self, runner, socket_path=None, listen=None, allow_remote=False):
+        self.runner = runner
+        self._socket_path = None
+        if listen:
+            host, _, port = listen.rpartition(':')
+            host = host.strip('[]') or 'localhost'
+            if not allow_remote and not _is_loopback(host, int(port)):
+                raise ValueError('Refusing to accept bake jobs on non-loopback address {0}; '
+                                 'use --allow-remote to serve it anyway'.format(listen))
+            self._server = _TCPHTTPServer((host, int(port)), _BakeRequestHandler)
+            self.address = listen
+        else:
+            mkdir_p(os.path.dirname(socket_path))
+            if os.path.exists(socket_path):
+                self._unlink_stale_socket(socket_path)
+            self._server = _UnixHTTPServer(socket_path, _UnixBakeRequestHandler)
+            self._socket_path = self.address = socket_path
+        self._server.runner = runner
+
+    @staticmethod
+    def _unlink_stale_socket(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error:
+            log.debug('Removing stale socket {0}'.format(socket_path))
+            os.unlink(socket_path)
+        else:
+            raise RuntimeError('Another gator service is listening on {0}'.format(socket_path))
+        finally:
+            probe.close()
+
+    def serve_forever(self):
+        self.runner.start()
+        log.info('Gator bake service listening on {0}'.format(self.address))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self._socket_path and os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            self.runner.stop()
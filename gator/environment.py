@@ -10,8 +10,15 @@ gator.environment
 The orchestrator
 """
 import logging
+import os
+from contextlib import contextmanager
+
 import yaml
 
+from gator.checkpoint import Checkpoint
+from gator.stages import StageGraph
+from gator.util import trace
+
 log = logging.getLogger(__name__)
 
 
@@ -21,7 +28,7 @@ class Environment(object):
     def _attach_plugins(self):
         log.debug('Attaching plugins to environment {0}'.format(self._name))
         env_config = self._config.environments[self._name]
-        for kind, name in env_config.iteritems():
+        for kind, name in env_config.items():
             log.debug('Attaching plugin {0} for {1}'.format(name, kind))
             plugin = self._plugin_manager.find_by_kind(kind, name)
             setattr(self, kind, plugin.obj)
@@ -39,21 +46,113 @@ class Environment(object):
 
     def provision(self):
         log.info('Beginning gator! Package: {0}'.format(self._config.context.package.arg))
-        with self.metrics:
-            with self.cloud as cloud:
-                with self.finalizer(cloud) as finalizer:
-                    with self.volume(self.cloud, self.blockdevice):
-                        with self.distro as distro:
-                            success = self.provisioner(distro).provision()
-                            if not success:
-                                log.critical('Provisioning failed!')
-                                return False
-                        success = finalizer.finalize()
-                        if not success:
-                            log.critical('Finalizing failed!')
-                            return False
+        checkpoint = self._checkpoint()
+        # the stages mirror the former nesting metrics > cloud > finalizer > volume > distro >
+        # provisioner; fetching the package only needs metrics, so it overlaps cloud and volume
+        # setup. The base AMI is resolved alongside entering the cloud, and the volume is
+        # allocated as soon as both are done, before a block device is picked for it
+        graph = StageGraph(workers=self._config.get('stage_workers', 4))
+        graph.add('metrics', lambda: self.metrics, context=True)
+        graph.add('cloud', lambda metrics: self.cloud, requires=('metrics',), context=True)
+        graph.add('base_ami', self._resolve_base_ami, requires=('metrics',))
+        if checkpoint.done('snapshot') or checkpoint.done('upload'):
+            # the image content already exists, as a snapshot or an S3 bundle: only
+            # finalizing remains
+            graph.add('restore', self._restore, requires=('cloud', 'base_ami'))
+            graph.add('finalizer', lambda cloud, restore: self.finalizer(cloud), requires=('cloud', 'restore'), context=True)
+            graph.add('finalize', self._finalize, requires=('finalizer',), check=True)
+        else:
+            graph.add('package', self._prefetch, requires=('metrics',), context=True, check=True)
+            graph.add('finalizer', lambda cloud: self.finalizer(cloud), requires=('cloud',), context=True)
+            # unwound after the volume stage, which deletes the volume once it has taken it
+            graph.add('allocate', lambda cloud, base_ami: cloud.allocated_volume(), requires=('cloud', 'base_ami'), context=True)
+            graph.add('volume', lambda cloud, finalizer, allocate: self.volume(cloud, self.blockdevice),
+                      requires=('cloud', 'finalizer', 'allocate'), context=True)
+            graph.add('distro', lambda volume: self.distro, requires=('volume',), context=True)
+            graph.add('provision', self._provision, requires=('cloud', 'distro', 'package'), check=True)
+            graph.add('finalize', self._finalize, requires=('finalizer', 'provision'), releases=('distro',), check=True)
+        timeline = trace.activate(trace.Timeline())
+        try:
+            success = graph.run()
+        except Exception:
+            log.critical('Bake {0} failed. Rerun with --resume {0} to continue from the last finished stage'.format(checkpoint.bake_id))
+            raise
+        finally:
+            trace.activate(None)
+            self._write_timeline(timeline, checkpoint.bake_id)
+        if success:
+            checkpoint.discard()
+        else:
+            log.critical('Bake {0} failed. Rerun with --resume {0} to continue from the last finished stage'.format(checkpoint.bake_id))
+        return success
+
+    def _checkpoint(self):
+        context = self._config.context
+        checkpoint_dir = os.path.join(self._config.aminator_root, self._config.get('checkpoint_dir', 'checkpoints'))
+        if context.get('resume'):
+            checkpoint = Checkpoint.load(checkpoint_dir, context.resume)
+        else:
+            checkpoint = Checkpoint(checkpoint_dir)
+            log.info('Bake id: {0}'.format(checkpoint.bake_id))
+        # plugins record their own stages (snapshot, registration) through the config,
+        # the same way the metrics plugin is reached
+        self._config.checkpoint = checkpoint
+        return checkpoint
+
+    def _write_timeline(self, timeline, bake_id):
+        trace_config = self._config.get('trace', {})
+        if not self._config.context.get('trace', trace_config.get('enabled', False)):
+            return
+        trace_dir = trace_config.get('directory') or self._config.log_root
+        filename = os.path.join(trace_dir, '{0}.trace.json'.format(bake_id))
+        try:
+            timeline.write_chrome_trace(filename)
+        except (IOError, OSError):
+            log.warning('Unable to write bake timeline to {0}'.format(filename), exc_info=True)
+        else:
+            log.info('Bake timeline written to {0}'.format(filename))
+        log.info('Bake timeline summary:\n{0}'.format(timeline.summary()))
+
+    def _resolve_base_ami(self, metrics):
+        self.cloud.resolve_base_ami()
+        return self._config.context.get('base_ami')
+
+    def _restore(self, cloud, **stages):
+        checkpoint = self._config.checkpoint
+        context = self._config.context
+        log.info('Resuming bake {0} after {1}'.format(checkpoint.bake_id, ', '.join(checkpoint.stages)))
+        context.package.attributes = checkpoint.state['package_attributes']
+        if not context.ami.get('suffix') and checkpoint.state.get('suffix'):
+            context.ami.suffix = checkpoint.state['suffix']
+        cloud.restore(checkpoint.state)
         return True
 
+    @contextmanager
+    def _prefetch(self, metrics):
+        # a context stage, so the download directory goes away when the bake unwinds
+        try:
+            success = self.provisioner.prefetch()
+            if not success:
+                log.critical('Fetching package failed!')
+            yield success
+        finally:
+            self.provisioner.discard_prefetch()
+
+    def _provision(self, cloud, distro, package):
+        success = self.provisioner(distro).provision()
+        if not success:
+            log.critical('Provisioning failed!')
+        else:
+            attributes = dict(self._config.context.package.attributes)
+            self._config.checkpoint.record('provision', package_attributes=attributes, **cloud.checkpoint_state())
+        return success
+
+    def _finalize(self, finalizer, **stages):
+        success = finalizer.finalize()
+        if not success:
+            log.critical('Finalizing failed!')
+        return success
+
     def __enter__(self):
         return self
 
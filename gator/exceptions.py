@@ -36,3 +36,7 @@ class ProvisionException(GatorException):
 
 class FinalizerException(GatorException):
     """ Errors during finalizing """
+
+
+class CheckpointException(GatorException):
+    """ Errors loading a bake checkpoint """
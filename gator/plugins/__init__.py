@@ -34,25 +34,41 @@ class PluginManager(object):
 
     def __init__(self, config, parser, plugins=None):
         """
-        config.plugins.managers is a map of entry points, their kinds, and the actual manager classes
-        this populates the registry dict, mapping kind and entry_point to an actual instance of the manager
+        config.plugins.entry_points is a map of kinds, their entry points, and the actual manager classes.
+        Only the plugins named by plugins (an environment) are imported, instantiated and configured;
+        without an environment every installed plugin is
         """
-        for kind, plugin_info in config.plugins.entry_points.iteritems():
+        self._kinds = {}
+        for kind, plugin_info in config.plugins.entry_points.items():
             entry_point = plugin_info.entry_point
-            classname = plugin_info['class']
-
-            manager_module = __import__(entry_point + '.manager', globals=globals(), locals=locals(), fromlist=(classname,))
-            manager = getattr(manager_module, classname)
-
-            self._registry[entry_point] = manager()
-            self._registry[kind] = self._registry[entry_point]
-
-            for name, plugin in self._registry[entry_point.split('.')[-1]] == name:
-                plugin.obj.configure(config, parser)
+            self._kinds[kind] = entry_point
+            loaded = self._registry.setdefault(entry_point, {})
+            for name in self._selected(config, plugins, kind, entry_point):
+                # plugins live in the class-level registry, so repeat constructions (one per
+                # bake in gator.daemon) skip discovery and instantiation
+                if name not in loaded:
+                    classname = plugin_info['class']
+                    manager_module = __import__(entry_point + '.manager', globals=globals(), locals=locals(), fromlist=(classname,))
+                    manager = getattr(manager_module, classname)(names=[name])
+                    if name not in manager.by_name:
+                        raise ValueError('No {0} plugin named {1} is installed'.format(kind, name))
+                    loaded[name] = manager.by_name[name]
+                loaded[name].obj.configure(config, parser)
                 log.debug('Loaded plugin {0}.{1}'.format(entry_point, name))
 
+    @staticmethod
+    def _selected(config, plugins, kind, entry_point):
+        if plugins is None:
+            return [ep.name for ep in entry_points(group=entry_point)]
+        if kind in plugins:
+            return [plugins[kind]]
+        if kind == 'metrics':
+            # see Environment._attach_plugins
+            return [config.environments.get(kind, 'logger')]
+        return []
+
     def find_by_entry_point(self, entry_point, name):
-        return self._registry[entry_point].by_name[name]
+        return self._registry[entry_point][name]
 
     def find_by_kind(self, kind, name):
-        return self._registry[kind].by_name[name]
+        return self._registry[self._kinds[kind]][name]
@@ -12,7 +12,7 @@ Base class(es) for plugin implementations
 import logging
 import os
 
-from gator.config import PluginConfig
+from gator.config import PluginConfig, config_cache
 
 
 __all__ = ()
@@ -82,9 +82,17 @@ class BasePlugin(object):
         pass
 
     def load_plugin_config(self):
-        entry_point = self.entry_point
-        name = self.name
         key = self.full_name
+        self._config.plugins[key] = self.resolve_plugin_config(self.name)
+        self.enabled = self._config.plugins[key].get('enabled', True)
+
+    def resolve_plugin_config(self, name):
+        """
+        The packaged defaults of the plugin called name under this plugin's entry point,
+        merged with the site's overrides from the plugin config root, through the config cache
+        """
+        entry_point = self.entry_point
+        key = '{0}.{1}'.format(entry_point, name)
 
         if self._config.plugins.config_root.startswith('~'):
             plugin_conf_dir = os.path.expanduser(self._config.plugins.config_root)
@@ -99,6 +107,12 @@ class BasePlugin(object):
             os.path.join(plugin_conf_dir, '.'.join((key, 'yml'))),
         )
 
-        self._config.plugins[key] = PluginConfig.from_defaults(entry_point, name)
-        self._config.plugins[key] = PluginConfig.dict_merge(self._config.plugins[key], PluginConfig.from_files(plugin_conf_files))
-        self.enabled = self._config.plugins[key].get('enabled', True)
+        cache = config_cache(self._config)
+        sources = (PluginConfig.default_path(entry_point, name),) + plugin_conf_files
+        plugin_config = cache.get(key, sources)
+        if plugin_config is None:
+            fingerprint = cache.fingerprint(sources)
+            plugin_config = PluginConfig.from_defaults(entry_point, name)
+            plugin_config = PluginConfig.dict_merge(plugin_config, PluginConfig.from_files(plugin_conf_files))
+            cache.put(key, sources, fingerprint, plugin_config)
+        return plugin_config
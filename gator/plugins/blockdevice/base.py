@@ -40,6 +40,13 @@ class BaseBlockDevicePlugin(BasePlugin):
             log.debug('Exception encountered in block device plugin', exc_info=(typ, val, trc))
         return False
 
+    def available_devices(self):
+        """
+        Number of block devices that could be allocated right now, or None when the
+        allocator has no fixed limit. Used to size parallel batch bakes
+        """
+        return None
+
     def __call__(self, cloud):
         """
         By default, BlockDevicePlugins are called using
@@ -36,7 +36,7 @@ class LinuxBlockDevicePlugin(BaseBlockDevicePlugin):
         if self._config.lock_dir.startswith(('/', '~')):
             self._lock_dir = os.path.expanduser(self._config.lock_dir)
         else:
-            self._lock_dir = os.path.join(self._config.gator_root, self._config.lock_dir)
+            self._lock_dir = os.path.join(self._config.aminator_root, self._config.lock_dir)
 
         self._lock_file = self.__class__.__name__
 
@@ -85,12 +85,21 @@ class LinuxBlockDevicePlugin(BaseBlockDevicePlugin):
             device_format = '/dev/{0}{1}{2}'
             self._allowed_devices = [device_format.format(self._device_prefix, major, minor)
                                     for major in majors
-                                    for minor in xrange(1, 16)]
+                                    for minor in range(1, 16)]
         else:
             device_format = '/dev/{0}{1}'
             self._allowed_devices = [device_format.format(self._device_prefix, major)
                                     for major in majors]
 
+    def available_devices(self):
+        if "block_device" in self._config.context.ami:
+            return 1
+        self._setup_allowed_devices()
+        free = [dev for dev in self._allowed_devices
+                if not os.path.exists(dev) and not locked(os.path.join(self._lock_dir, os.path.basename(dev)))]
+        log.debug('{0} of {1} block devices free'.format(len(free), len(self._allowed_devices)))
+        return len(free)
+
     def allocate_dev(self):
         context = self._config.context
         if "block_device" in context.ami:
@@ -0,0 +1,82 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.blockdevice.loop
+==============================
+loop device allocator, for clouds whose volumes are local image files
+"""
+import fcntl
+import logging
+import os
+import stat
+
+from gator.exceptions import DeviceException
+from gator.plugins.blockdevice.base import BaseBlockDevicePlugin
+from gator.plugins.blockdevice.linux import BlockDevice
+from gator.util.linux import flock, locked
+from gator.util.metrics import raises
+
+__all__ = ('LoopBlockDevicePlugin',)
+log = logging.getLogger(__name__)
+
+LOOP_MAJOR = 7
+
+
+class LoopBlockDevicePlugin(BaseBlockDevicePlugin):
+    _name = 'loop'
+
+    def configure(self, config, parser):
+        super(LoopBlockDevicePlugin, self).configure(config, parser)
+        self._lock_dir = os.path.join(self._config.aminator_root, self._config.lock_dir)
+        self._lock_file = os.path.join(self._lock_dir, self.__class__.__name__)
+
+    def __enter__(self):
+        self._dev = self.allocate_dev()
+        return self._dev.node
+
+    def __exit__(self, typ, val, trc):
+        if typ:
+            log.debug('Exception encountered in loop block device plugin context manager',
+                      exc_info=(typ, val, trc))
+        self.release_dev(self._dev)
+        return False
+
+    def _devices(self):
+        return ['/dev/loop{0}'.format(minor) for minor in range(int(self.plugin_config.get('max_devices', 64)))]
+
+    def _free(self, dev):
+        backing_file = '/sys/block/{0}/loop/backing_file'.format(os.path.basename(dev))
+        device_lock = os.path.join(self._lock_dir, os.path.basename(dev))
+        return not os.path.exists(backing_file) and not locked(device_lock)
+
+    def available_devices(self):
+        return len([dev for dev in self._devices() if self._free(dev)])
+
+    def allocate_dev(self):
+        with flock(self._lock_file):
+            return self.find_available_dev()
+
+    def release_dev(self, dev):
+        if dev.handle:
+            fcntl.flock(dev.handle, fcntl.LOCK_UN)
+            dev.handle.close()
+
+    @raises("gator.blockdevice.loop.find_available_dev.error")
+    def find_available_dev(self):
+        log.info('Searching for an available loop device')
+        for dev in self._devices():
+            if not self._free(dev):
+                log.debug('{0} is in use, skipping'.format(dev))
+                continue
+            if not os.path.exists(dev):
+                log.debug('Creating device node {0}'.format(dev))
+                os.mknod(dev, 0o660 | stat.S_IFBLK, os.makedev(LOOP_MAJOR, int(dev[len('/dev/loop'):])))
+            fh = open(os.path.join(self._lock_dir, os.path.basename(dev)), 'a')
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            log.info('Loop device {0} allocated'.format(dev))
+            return BlockDevice(dev, fh)
+        raise DeviceException('Exhausted all loop devices, none free')
@@ -10,9 +10,14 @@ gator.plugins.cloud.base
 Base class(es) for cloud plugins
 """
 import abc
+import asyncio
+import contextvars
+import functools
 import logging
+from contextlib import contextmanager
 
 from gator.plugins.base import BasePlugin
+from gator.plugins.cloud.instrumentation import bake_metrics
 
 
 __all__ = ('BaseCloudPlugin',)
@@ -40,6 +45,21 @@ class BaseCloudPlugin(BasePlugin):
         Create a volume object from the base/foundation volume
         """
 
+    def resolve_base_ami(self):
+        """
+        Look up the image the bake starts from into context.base_ami. The environment
+        runs this alongside entering the plugin, so it connects for itself
+        """
+
+    @contextmanager
+    def allocated_volume(self, tag=True):
+        """
+        Allocate the bake's volume ahead of attach_volume, which then attaches it instead
+        of allocating one; on exit the volume is deleted unless attach_volume took it.
+        Yields False, allocating nothing, for plugins that allocate while attaching
+        """
+        yield False
+
     @abc.abstractmethod
     def attach_volume(self, blockdevice, tag=True):
         """
@@ -84,9 +104,9 @@ class BaseCloudPlugin(BasePlugin):
         """
 
     @abc.abstractmethod
-    def add_tags(self, resource_type):
+    def add_tags(self, *resource_types):
         """
-        Consumes tags and applies them to objects
+        Consumes tags and applies them to the objects of each resource type
         """
 
     @abc.abstractmethod
@@ -95,6 +115,89 @@ class BaseCloudPlugin(BasePlugin):
         Instructs the cloud provider to register a finalized image for launching
         """
 
+    def replicate_image(self, regions):
+        """
+        Copy the registered image to regions, tagged like the original. Returns a dict
+        of region to replica image id, or False on failure
+        """
+        log.critical('The {0} cloud plugin does not support image replication'.format(self.name))
+        return False
+
+    # asyncio variants of the operations above, so one event loop can drive the cloud
+    # work of many bakes. Each bake works on its own instance, from for_bake(), as the
+    # plugin keeps the bake's volume, snapshot and image. These defaults run the blocking
+    # methods on the loop's default executor; plugins override them with coroutines that
+    # hold no thread while waiting
+
+    def for_bake(self, config):
+        """
+        a new instance of the plugin for the bake configured by config (a snapshot of
+        the configuration, with its arguments parsed). Process-wide state, such as
+        pooled clients, stays shared
+        """
+        plugin = self.__class__()
+        plugin._config = config
+        plugin._parser = self._parser
+        plugin.enabled = self.enabled
+        return plugin
+
+    def _in_bake(self, func, *args, **kwargs):
+        """ func(*args, **kwargs) bound to the current context, with API metrics going to this bake """
+        context = contextvars.copy_context()
+        context.run(bake_metrics.set, self._config.get('metrics'))
+        return functools.partial(context.run, func, *args, **kwargs)
+
+    async def _run(self, func, *args, **kwargs):
+        """ func(*args, **kwargs) on the running loop's executor, as part of this bake """
+        return await asyncio.get_running_loop().run_in_executor(None, self._in_bake(func, *args, **kwargs))
+
+    async def __aenter__(self):
+        # bakes driven from a loop have no base AMI stage: it is resolved alongside entering
+        plugin, _ = await asyncio.gather(self._run(self.__enter__), self._run(self.resolve_base_ami))
+        return plugin
+
+    async def __aexit__(self, typ, val, trc):
+        return await self._run(self.__exit__, typ, val, trc)
+
+    async def attach_volume_async(self, blockdevice, tag=True):
+        return await self._run(self.attach_volume, blockdevice, tag=tag)
+
+    async def detach_volume_async(self, blockdevice):
+        return await self._run(self.detach_volume, blockdevice)
+
+    async def delete_volume_async(self):
+        return await self._run(self.delete_volume)
+
+    async def snapshot_volume_async(self, description=None):
+        return await self._run(self.snapshot_volume, description=description)
+
+    async def add_tags_async(self, *resource_types):
+        return await self._run(self.add_tags, *resource_types)
+
+    async def register_image_async(self, *args, **kwargs):
+        return await self._run(self.register_image, *args, **kwargs)
+
+    async def replicate_image_async(self, regions):
+        return await self._run(self.replicate_image, regions)
+
+    def checkpoint_state(self):
+        """
+        Ids of the cloud resources created so far, persisted so a failed bake can resume
+        """
+        return {}
+
+    def restore(self, state):
+        """
+        Reload resources recorded by checkpoint_state when resuming a bake
+        """
+
+    def prewarm(self):
+        """
+        Warm long-lived state (credentials, API models, base image lookups) ahead of a
+        bake. The bake daemon calls this in its own process so forked workers inherit
+        it; connections are opened by each worker
+        """
+
     def __enter__(self):
         self.connect()
         return self
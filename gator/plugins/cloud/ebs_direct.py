@@ -0,0 +1,457 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.ebs_direct
+==============================
+EC2 cloud without volumes: the base AMI's root snapshot is read into a local sparse
+image file through the EBS direct APIs, provisioned on a loop device, and only the
+blocks that differ from it are written to a new child snapshot, which is registered as
+usual. Pair it with the loop blockdevice. EBSDirectStub serves the EBS direct APIs
+locally, for exercising the block transfer without AWS
+"""
+import base64
+import errno
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from time import time
+from urllib.parse import parse_qs, urlparse
+
+from bunch import Bunch
+
+from gator.config import PluginConfig, conf_action
+from gator.exceptions import VolumeException
+from gator.plugins.cloud.base import BaseCloudPlugin
+from gator.plugins.cloud.ec2 import EC2CloudPlugin, _tag_list
+from gator.util.linux import mkdir_p, monitor_command, os_node_exists
+from gator.util.metrics import timer
+
+
+__all__ = ('EBSDirectCloudPlugin', 'EBSDirectStub', 'changed_blocks', 'linear_checksum')
+log = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+# the EBS direct APIs' only block size
+BLOCK_SIZE = 512 * 1024
+
+
+def _checksum(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+
+
+def linear_checksum(checksums):
+    """ the LINEAR aggregate of per-block checksums listed in block index order """
+    digest = hashlib.sha256()
+    for checksum in checksums:
+        digest.update(base64.b64decode(checksum))
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+def _data_blocks(fd, size, block_size):
+    """ indices of the blocks of a sparse file that hold data, skipping its holes """
+    blocks = set()
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                break
+            # no hole reporting on this filesystem: every block is a candidate
+            return set(range(-(-size // block_size)))
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        blocks.update(range(start // block_size, -(-end // block_size)))
+        offset = end
+    return blocks
+
+
+def changed_blocks(fd, size, parent, block_size=BLOCK_SIZE):
+    """
+    (index, checksum) of every block of the volume image open as fd that differs from
+    the parent snapshot, given as index -> checksum of its blocks. Zero blocks the parent
+    never had are skipped; blocks the parent had and that are now holes count as changed
+    """
+    zero = bytes(block_size)
+    changed = []
+    for index in sorted(_data_blocks(fd, size, block_size) | set(parent)):
+        data = os.pread(fd, block_size, index * block_size).ljust(block_size, b'\0')
+        if index not in parent and data == zero:
+            continue
+        checksum = _checksum(data)
+        if parent.get(index) != checksum:
+            changed.append((index, checksum))
+    return changed
+
+
+class EBSDirectCloudPlugin(EC2CloudPlugin):
+    _name = 'ebs_direct'
+
+    def load_plugin_config(self):
+        super(EBSDirectCloudPlugin, self).load_plugin_config()
+        # the site's resolved EC2 settings (client, polling, image cache, base AMI owners)
+        # apply unless overridden here
+        key = self.full_name
+        ec2_config = self.resolve_plugin_config('ec2')
+        self._config.plugins[key] = PluginConfig.dict_merge(ec2_config, self._config.plugins[key])
+
+    def add_plugin_args(self, *args, **kwargs):
+        super(EBSDirectCloudPlugin, self).add_plugin_args(*args, **kwargs)
+        context = self._config.context
+        direct = self._parser.add_argument_group(
+            title='EBS direct options', description='Snapshots written block by block, without volumes')
+        direct.add_argument(
+            '--ebs-direct-volume-dir', dest='ebs_direct_volume_dir',
+            action=conf_action(config=context.cloud),
+            help='Directory for the local volume image files')
+        direct.add_argument(
+            '--ebs-direct-endpoint', dest='ebs_direct_endpoint',
+            action=conf_action(config=context.cloud),
+            help='EBS direct API endpoint, such as an EBSDirectStub')
+
+    @property
+    def volume_dir(self):
+        return self._config.context.cloud.get('ebs_direct_volume_dir', self.plugin_config.get('volume_dir', '/var/gator/ebs-direct'))
+
+    def _ebs(self, operation, **params):
+        """ one EBS direct API call on the pooled client, measured by its event hooks """
+        endpoint = self._config.context.cloud.get('ebs_direct_endpoint', self.plugin_config.get('endpoint', None))
+        return getattr(self._client(self._region, service='ebs', endpoint_url=endpoint), operation)(**params)
+
+    def _executor(self):
+        return ThreadPoolExecutor(max_workers=int(self.plugin_config.get('workers', 16)))
+
+    def allocate_base_volume(self, tag=True):
+        cloud_config = self.plugin_config
+        context = self._config.context
+
+        rootdev = context.base_ami.block_device_mapping[context.base_ami.root_device_name]
+        volume_size = context.ami.get('root_volume_size', None) or cloud_config.get('root_volume_size', None) or rootdev.size
+        volume_size = int(volume_size)
+        if volume_size < rootdev.size:
+            raise VolumeException(
+                'root_volume_size ({}) must be at least as large as the root '
+                'volume of the base AMI ({})'.format(volume_size, rootdev.size))
+        mkdir_p(self.volume_dir)
+        self._volume = Bunch(id='vol-direct{0}'.format(uuid.uuid4().hex[:12]), size=volume_size,
+                             snapshot_id=rootdev.snapshot_id, tags={})
+        self._volume.path = os.path.join(self.volume_dir, '{0}.img'.format(self._volume.id))
+        with open(self._volume.path, 'wb') as f:
+            f.truncate(volume_size * GB)
+        self._parent = self._read_snapshot(rootdev.snapshot_id, self._volume.path)
+        log.debug('Volume {0} created from {1} ({2} blocks)'.format(self._volume.id, rootdev.snapshot_id, len(self._parent)))
+
+    @timer("gator.cloud.ebs_direct.read_snapshot.duration")
+    def _read_snapshot(self, snapshot_id, path):
+        """ write the blocks of snapshot_id into the image file at path; returns index -> checksum """
+        blocks = []
+        params = {'SnapshotId': snapshot_id, 'MaxResults': 10000}
+        while True:
+            response = self._ebs('list_snapshot_blocks', **params)
+            if response.get('BlockSize', BLOCK_SIZE) != BLOCK_SIZE:
+                raise VolumeException('Snapshot {0} has {1} byte blocks, expected {2}'.format(snapshot_id, response['BlockSize'], BLOCK_SIZE))
+            blocks.extend((block['BlockIndex'], block['BlockToken']) for block in response.get('Blocks', []))
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            def read_block(block):
+                index, token = block
+                response = self._ebs('get_snapshot_block', SnapshotId=snapshot_id, BlockIndex=index, BlockToken=token)
+                data = response['BlockData'].read()
+                if _checksum(data) != response['Checksum']:
+                    raise VolumeException('Block {0} of {1} failed its checksum'.format(index, snapshot_id))
+                os.pwrite(fd, data, index * BLOCK_SIZE)
+                return index, response['Checksum']
+
+            with self._executor() as executor:
+                return dict(executor.map(read_block, blocks))
+        finally:
+            os.close(fd)
+
+    def attach_volume(self, blockdevice, tag=True):
+        allocated, self._allocated = self._allocated, None
+        if allocated is None:
+            self.allocate_base_volume(tag=tag)
+        else:
+            self._volume = allocated
+        log.debug('Attaching volume {0} to {1}'.format(self._volume.id, blockdevice))
+        result = monitor_command(['losetup', blockdevice, self._volume.path])
+        if not result.success or not self.is_volume_attached(blockdevice):
+            raise VolumeException('Attaching {0} to {1} failed: {2}'.format(self._volume.id, blockdevice, result.result.std_err))
+        log.debug('Volume {0} attached to {1}'.format(self._volume.id, blockdevice))
+
+    def is_volume_attached(self, blockdevice):
+        backing_file = '/sys/block/{0}/loop/backing_file'.format(os.path.basename(blockdevice))
+        if not os_node_exists(blockdevice) or not os.path.isfile(backing_file):
+            return False
+        with open(backing_file) as f:
+            return f.read().strip() == os.path.realpath(self._volume.path)
+
+    def detach_volume(self, blockdevice):
+        log.debug('Detaching volume {0} from {1}'.format(self._volume.id, blockdevice))
+        result = monitor_command(['losetup', '-d', blockdevice])
+        if not result.success:
+            raise VolumeException('Detaching {0} from {1} failed: {2}'.format(self._volume.id, blockdevice, result.result.std_err))
+
+    def delete_volume(self):
+        log.debug('Deleting volume {0}'.format(self._volume.id))
+        if os.path.exists(self._volume.path):
+            os.remove(self._volume.path)
+        return True
+
+    def snapshot_volume(self, description=None):
+        context = self._config.context
+        if not description:
+            description = context.snapshot.get('description', '')
+        log.debug('Creating snapshot of {0} with description {1}'.format(self._volume.id, description))
+        self._snapshot = self._write_snapshot(description)
+        if self._snapshot.status != 'completed' and not self._snapshot_complete():
+            log.critical('Failed to create snapshot')
+            return False
+        log.debug('Snapshot complete. id: {0}'.format(self._snapshot.id))
+        return True
+
+    @timer("gator.cloud.ebs_direct.write_snapshot.duration")
+    def _write_snapshot(self, description):
+        """ a child snapshot of the volume's base snapshot holding the blocks that changed """
+        tags = self._config.context.snapshot.get('tags', {})
+        response = self._ebs('start_snapshot', VolumeSize=self._volume.size, ParentSnapshotId=self._volume.snapshot_id,
+                             Description=description, ClientToken=uuid.uuid4().hex, Tags=_tag_list(tags),
+                             Timeout=int(self.plugin_config.get('snapshot_timeout', 60)))
+        snapshot_id = response['SnapshotId']
+        fd = os.open(self._volume.path, os.O_RDONLY)
+        try:
+            changed = changed_blocks(fd, self._volume.size * GB, self._parent)
+            log.debug('Writing {0} changed blocks of {1} to {2}'.format(len(changed), self._volume.id, snapshot_id))
+
+            def write_block(block):
+                index, checksum = block
+                self._ebs('put_snapshot_block', SnapshotId=snapshot_id, BlockIndex=index,
+                          BlockData=os.pread(fd, BLOCK_SIZE, index * BLOCK_SIZE).ljust(BLOCK_SIZE, b'\0'),
+                          DataLength=BLOCK_SIZE, Checksum=checksum, ChecksumAlgorithm='SHA256')
+
+            with self._executor() as executor:
+                list(executor.map(write_block, changed))
+        finally:
+            os.close(fd)
+        self._config.metrics.increment('gator.cloud.ebs_direct.changed_blocks', len(changed))
+        response = self._ebs('complete_snapshot', SnapshotId=snapshot_id, ChangedBlocksCount=len(changed),
+                             Checksum=linear_checksum(checksum for _, checksum in changed),
+                             ChecksumAlgorithm='SHA256', ChecksumAggregationMethod='LINEAR')
+        return Bunch(id=snapshot_id, volume_id=None, volume_size=self._volume.size, status=response['Status'],
+                     progress='', description=description, tags=dict((key, str(value)) for key, value in tags.items()))
+
+    def is_stale_attachment(self, dev, prefix):
+        return False
+
+    def attached_block_devices(self, prefix):
+        return {}
+
+    # volumes are local files and block transfers run on their own worker pool: the
+    # coroutines run the blocking methods, not the EC2 volume coroutines
+    attach_volume_async = BaseCloudPlugin.attach_volume_async
+    detach_volume_async = BaseCloudPlugin.detach_volume_async
+    delete_volume_async = BaseCloudPlugin.delete_volume_async
+    snapshot_volume_async = BaseCloudPlugin.snapshot_volume_async
+
+    def __enter__(self):
+        # no instance to describe: volumes are attached as loop devices
+        self.connect()
+        return self
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug('ebs direct stub: ' + format % args)
+
+    def _reply(self, status, body=b'', headers=None, content_type='application/json'):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, error_type, message):
+        self._reply(status, {'Message': message}, headers={'x-amzn-ErrorType': error_type})
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _route(self):
+        url = urlparse(self.path)
+        self.server.stub.requests.append((self.command, url.path))
+        return url.path.strip('/').split('/'), dict((key, values[0]) for key, values in parse_qs(url.query).items())
+
+    def _snapshot(self, snapshot_id):
+        snapshot = self.server.stub.snapshots.get(snapshot_id)
+        if snapshot is None:
+            self._error(404, 'ResourceNotFoundException', 'Snapshot {0} not found'.format(snapshot_id))
+        return snapshot
+
+    def do_POST(self):
+        parts, _ = self._route()
+        stub = self.server.stub
+        if parts == ['snapshots']:
+            request = json.loads(self._body() or b'{}')
+            parent = request.get('ParentSnapshotId')
+            if parent and self._snapshot(parent) is None:
+                return
+            snapshot_id = stub.add_snapshot(request['VolumeSize'], parent=parent, description=request.get('Description', ''),
+                                            status='pending')
+            return self._reply(201, {'SnapshotId': snapshot_id, 'Status': 'pending', 'VolumeSize': request['VolumeSize'],
+                                     'BlockSize': BLOCK_SIZE, 'ParentSnapshotId': parent,
+                                     'Description': request.get('Description', ''), 'StartTime': time()})
+        if len(parts) == 3 and parts[:2] == ['snapshots', 'completion']:
+            self._body()
+            snapshot = self._snapshot(parts[2])
+            if snapshot is None:
+                return
+            changed = sorted(snapshot['changed'])
+            if int(self.headers.get('x-amz-ChangedBlocksCount', -1)) != len(changed):
+                return self._error(400, 'ValidationException', 'Changed block count mismatch')
+            checksum = self.headers.get('x-amz-Checksum')
+            if checksum and checksum != linear_checksum(_checksum(snapshot['blocks'][index]) for index in changed):
+                return self._error(400, 'ValidationException', 'Aggregate checksum mismatch')
+            snapshot['status'] = 'completed'
+            return self._reply(202, {'Status': 'completed'})
+        self._error(404, 'ResourceNotFoundException', 'No such operation')
+
+    def do_PUT(self):
+        parts, _ = self._route()
+        if len(parts) != 4 or parts[0] != 'snapshots' or parts[2] != 'blocks':
+            self._body()
+            return self._error(404, 'ResourceNotFoundException', 'No such operation')
+        data = self._body()
+        snapshot = self._snapshot(parts[1])
+        if snapshot is None:
+            return
+        if snapshot['status'] != 'pending':
+            return self._error(400, 'ValidationException', 'Snapshot {0} is {1}'.format(parts[1], snapshot['status']))
+        checksum = _checksum(data)
+        if len(data) != BLOCK_SIZE or checksum != self.headers.get('x-amz-Checksum'):
+            return self._error(400, 'ValidationException', 'Block {0} failed validation'.format(parts[3]))
+        index = int(parts[3])
+        snapshot['blocks'][index] = data
+        snapshot['changed'].add(index)
+        self._reply(201, {}, headers={'x-amz-Checksum': checksum, 'x-amz-Checksum-Algorithm': 'SHA256'})
+
+    def do_GET(self):
+        parts, query = self._route()
+        stub = self.server.stub
+        if len(parts) < 3 or parts[0] != 'snapshots' or parts[2] != 'blocks':
+            return self._error(404, 'ResourceNotFoundException', 'No such operation')
+        snapshot = self._snapshot(parts[1])
+        if snapshot is None:
+            return
+        blocks = stub.blocks(parts[1])
+        if len(parts) == 4:
+            index = int(parts[3])
+            if index not in blocks or query.get('blockToken') != '{0}.{1}'.format(parts[1], index):
+                return self._error(400, 'ValidationException', 'Invalid block token')
+            data = blocks[index]
+            return self._reply(200, data, content_type='application/octet-stream', headers={
+                'x-amz-Data-Length': len(data), 'x-amz-Checksum': _checksum(data), 'x-amz-Checksum-Algorithm': 'SHA256'})
+        start = int(query.get('pageToken', query.get('startingBlockIndex', 0)))
+        indices = [index for index in sorted(blocks) if index >= start][:int(query.get('maxResults', 10000))]
+        response = {'Blocks': [{'BlockIndex': index, 'BlockToken': '{0}.{1}'.format(parts[1], index)} for index in indices],
+                    'VolumeSize': snapshot['volume_size'], 'BlockSize': BLOCK_SIZE, 'ExpiryTime': time() + 3600}
+        if indices and indices[-1] < max(blocks):
+            response['NextToken'] = str(indices[-1] + 1)
+        self._reply(200, response)
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EBSDirectStub(object):
+    """
+    Local stand-in for the EBS direct APIs (list and get snapshot blocks, start, put
+    blocks, complete), keeping snapshots in memory. Children read through to their
+    parent's blocks; put blocks and aggregate checksums are verified. seed() adds a
+    completed snapshot from a raw image file. Point the ebs_direct plugin's endpoint at
+    its endpoint; requests records every (method, path)
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        self.snapshots = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _StubServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://{0}:{1}'.format(*self._server.server_address[:2])
+
+    def add_snapshot(self, volume_size, parent=None, description='', status='completed'):
+        snapshot_id = 'snap-stub{0}'.format(uuid.uuid4().hex[:12])
+        with self._lock:
+            self.snapshots[snapshot_id] = {'volume_size': volume_size, 'parent': parent, 'description': description,
+                                           'status': status, 'blocks': {}, 'changed': set()}
+        return snapshot_id
+
+    def seed(self, image_file, volume_size=None):
+        """ a completed snapshot of the raw image file's non-zero blocks; returns its id """
+        volume_size = volume_size or -(-os.path.getsize(image_file) // GB)
+        snapshot_id = self.add_snapshot(volume_size, description='seeded from {0}'.format(image_file))
+        zero = bytes(BLOCK_SIZE)
+        blocks = self.snapshots[snapshot_id]['blocks']
+        with open(image_file, 'rb') as f:
+            index = 0
+            while True:
+                data = f.read(BLOCK_SIZE)
+                if not data:
+                    break
+                data = data.ljust(BLOCK_SIZE, b'\0')
+                if data != zero:
+                    blocks[index] = data
+                index += 1
+        return snapshot_id
+
+    def blocks(self, snapshot_id):
+        """ index -> data of every block of the snapshot, including those it inherits """
+        chain = []
+        while snapshot_id:
+            chain.append(self.snapshots[snapshot_id])
+            snapshot_id = chain[-1]['parent']
+        blocks = {}
+        for snapshot in reversed(chain):
+            blocks.update(snapshot['blocks'])
+        return blocks
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='gator-ebs-direct-stub')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, val, trc):
+        self.stop()
+        return False
@@ -9,61 +9,231 @@ gator.plugins.cloud.ec2
 =======================
 ec2 cloud provider
 """
+import asyncio
 import logging
-from time import sleep
-
-from boto.ec2 import connect_to_region, EC2Connection
-from boto.ec2.image import Image
-from boto.ec2.instance import Instance
-from boto.ec2.volume import Volume
-from boto.exception import EC2ResponseError
-from boto.utils import get_instance_metadata
-from botocore.exceptions import ClientError
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+from time import sleep, time
+
+from bunch import Bunch
 from decorator import decorator
 from os import environ
-import boto3
-import os.path
-import dill
 
 from gator.config import conf_action
 from gator.exceptions import FinalizerException, VolumeException
 from gator.plugins.cloud.base import BaseCloudPlugin
-from gator.util import retry
-from gator.util.linux import device_prefix, native_block_device, os_node_exists, mkdir_p
-from gator.util.metrics import timer, raises, succeeds, lapse
+from gator.plugins.cloud.image_cache import ImageCache
+from gator.plugins.cloud.instrumentation import THROTTLE_CODES, ClientInstrumentation, ClientRateLimit
+from gator.plugins.cloud.state_poller import StatePoller
+from gator.plugins.cloud.volume_pool import VolumePool
+from gator.util import backoff_delays, retry, retry_async
+from gator.util.imds import instance_metadata
+from gator.util.linux import device_prefix, native_block_device, os_node_exists
+from gator.util.metrics import timer, lapse
+from gator.util.polling import PollHistory
+from gator.util.ratelimit import RateLimiter
+from gator.util.trace import WAIT, span
 
 
 __all__ = ('EC2CloudPlugin',)
 log = logging.getLogger(__name__)
 
+# process-wide warm state shared by every plugin instance. The bake daemon fills these
+# through prewarm() so forked workers skip credential resolution, service model loading
+# and base AMI lookups. Clients hold sockets and are reopened in every worker
+_session = None
+_clients = {}
+_image_caches = {}
+_warm_lock = threading.Lock()
+# region -> StatePoller shared by every bake in this process. gator serve, batch and
+# bench run each bake in a forked worker with a poller of its own, so waits are batched
+# across bakes only when one process drives them, as the async operations do
+_pollers = {}
+# host-wide EC2 rate limiter, see gator.util.ratelimit
+_rate_limiter = None
+# runs the blocking API calls of every bake's coroutines in this process
+_api_executor = None
+
+
+# boto3 is imported where it is used: importing it costs more than the rest of gator's
+# startup, and it is not needed to parse arguments
+def _get_session():
+    global _session
+    if _session is None:
+        import boto3
+        _session = boto3.session.Session()
+    return _session
+
+
+def _get_client(region, is_secure=True, max_pool_connections=10, max_attempts=10, service='ec2', endpoint_url=None,
+                rate_limiter=None, metrics=None):
+    """
+    the process-wide client of service (EC2 unless given) for region. Clients are
+    thread-safe and keep their connections alive, so every bake, poller and replication
+    thread shares one pool and one set of resolved credentials and endpoints. EC2 calls
+    go through rate_limiter, when given. API metrics go to metrics, the metrics plugin
+    of the bake that created the client: bakes run in forked workers, which create their
+    own clients
+    """
+    key = (service, region, is_secure, endpoint_url)
+    with _warm_lock:
+        if key not in _clients:
+            from botocore.config import Config
+            client = _get_session().client(service, region_name=region, use_ssl=is_secure, endpoint_url=endpoint_url, config=Config(
+                max_pool_connections=max_pool_connections, tcp_keepalive=True,
+                retries={'mode': 'adaptive', 'max_attempts': max_attempts}))
+            ClientInstrumentation(metrics).register(client)
+            if rate_limiter is not None and service == 'ec2':
+                ClientRateLimit(rate_limiter).register(client)
+            _clients[key] = client
+        return _clients[key]
+
+
+def _reset_clients():
+    """ forked workers keep the warm session, with its credentials and loaded service
+    models, so a new client costs a connection and no more; they must not share the
+    parent's sockets, nor its poller and executor threads, which do not survive the
+    fork, nor the rate limiter's lock """
+    global _rate_limiter, _api_executor
+    _clients.clear()
+    _pollers.clear()
+    _rate_limiter = None
+    _api_executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+# lightweight records for EC2 responses, with the attribute names the rest of gator
+# (and the local cloud) use
+def _tags(resource):
+    return dict((tag['Key'], tag['Value']) for tag in resource.get('Tags', []))
+
+
+def _tag_list(tags):
+    return [{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+
+
+def _tag_specifications(resource_type, tags):
+    """ TagSpecifications tagging a resource as it is created, empty without tags """
+    return [{'ResourceType': resource_type, 'Tags': _tag_list(tags)}] if tags else []
+
+
+# the DescribeImages fields gator reads, and caches
+_IMAGE_FIELDS = ('ImageId', 'Name', 'Description', 'Architecture', 'VirtualizationType', 'RootDeviceName', 'KernelId',
+                 'RamdiskId', 'State', 'OwnerId', 'CreationDate', 'StateReason', 'BlockDeviceMappings', 'Tags')
+
+
+def _is_pattern(name):
+    return '*' in name or '?' in name
+
+
+def _image_fields(image):
+    return dict((field, image[field]) for field in _IMAGE_FIELDS if field in image)
+
+
+def _image_record(image):
+    mapping = {}
+    for device in image.get('BlockDeviceMappings', []):
+        ebs = device.get('Ebs', {})
+        mapping[device['DeviceName']] = Bunch(snapshot_id=ebs.get('SnapshotId'), size=ebs.get('VolumeSize'),
+                                              volume_type=ebs.get('VolumeType'), ephemeral_name=device.get('VirtualName'),
+                                              delete_on_termination=ebs.get('DeleteOnTermination'))
+    return Bunch(id=image['ImageId'], name=image.get('Name'), description=image.get('Description'),
+                 architecture=image.get('Architecture'), virtualization_type=image.get('VirtualizationType'),
+                 root_device_name=image.get('RootDeviceName'), kernel_id=image.get('KernelId'),
+                 ramdisk_id=image.get('RamdiskId'), state=image.get('State'), owner_id=image.get('OwnerId'),
+                 creation_date=image.get('CreationDate'), state_reason=image.get('StateReason', {}).get('Message'),
+                 block_device_mapping=mapping, tags=_tags(image))
+
+
+def _volume_record(volume):
+    return Bunch(id=volume['VolumeId'], size=volume.get('Size'), status=volume.get('State'),
+                 zone=volume.get('AvailabilityZone'), snapshot_id=volume.get('SnapshotId'), type=volume.get('VolumeType'),
+                 attachments=volume.get('Attachments', []), tags=_tags(volume))
+
 
-def registration_retry(ExceptionToCheck=(ClientError,), tries=3, delay=1, backoff=1, logger=None):
+def _snapshot_record(snapshot):
+    return Bunch(id=snapshot['SnapshotId'], volume_id=snapshot.get('VolumeId'), volume_size=snapshot.get('VolumeSize'),
+                 status=snapshot.get('State'), progress=snapshot.get('Progress', ''),
+                 description=snapshot.get('Description'), tags=_tags(snapshot))
+
+
+def _instance_record(instance):
+    mapping = dict((device['DeviceName'], Bunch(volume_id=device.get('Ebs', {}).get('VolumeId'), status=device.get('Ebs', {}).get('Status')))
+                   for device in instance.get('BlockDeviceMappings', []))
+    return Bunch(id=instance['InstanceId'], placement=instance['Placement']['AvailabilityZone'],
+                 state=instance.get('State', {}).get('Name'), block_device_mapping=mapping, tags=_tags(instance))
+
+
+# kind -> (describe operation, id filter, response key, record, request parameters)
+_DESCRIBE = {
+    'volume': ('describe_volumes', 'volume-id', 'Volumes', _volume_record, {}),
+    'snapshot': ('describe_snapshots', 'snapshot-id', 'Snapshots', _snapshot_record, {}),
+    # gator only waits on images it registered or copied
+    'image': ('describe_images', 'image-id', 'Images', _image_record, {'Owners': ['self']}),
+}
+
+
+def _describe_retryable(e):
+    """ whether a state poller describe that raised e is worth repeating on the next poll """
+    from botocore.exceptions import ClientError
+    if not isinstance(e, ClientError):
+        # connection trouble
+        return True
+    return e.response['Error']['Code'] in THROTTLE_CODES or e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+
+def _registration_retryable(e, kwargs, attempt):
+    """
+    whether a registration that failed with ClientError e should be retried. Duplicate
+    names are retried under a new name (kwargs['name'] gets the attempt number)
+    """
+    code = e.response['Error']['Code']
+    if code in THROTTLE_CODES:
+        log.debug('Registration of {0} throttled, retrying'.format(kwargs['name']))
+        return True
+    if code == 'InvalidAMIName.Duplicate':
+        log.debug('Duplicate AMI name {0}, retrying'.format(kwargs['name']))
+        kwargs['name'] = kwargs.pop('name') + str(attempt)
+        log.debug('Trying name {0}'.format(kwargs['name']))
+        return True
+    log.critical("Unable to retry register_image due to ClientError: %s", e)
+    return False
+
+
+def registration_retry(ExceptionToCheck=None, tries=3, delay=1, backoff=1, logger=None, maxdelay=30):
     """
-    a slightly tweaked form of aminator.util.retry for handling retries on image registration
+    a slightly tweaked form of aminator.util.retry for handling retries on image registration.
+    Delays are jittered so concurrent bakes don't retry in lockstep, and throttled
+    registrations are retried under the same name
     """
     if logger is None:
         logger = log
 
     @decorator
     def _retry(f, *args, **kwargs):
-        _tries, _delay = tries, delay
-        total_tries = _tries
-        args, kwargs = args, kwargs
-        while _tries > 0:
+        from botocore.exceptions import ClientError
+        exceptions = ExceptionToCheck or (ClientError,)
+        delays = backoff_delays(tries - 1, delay, backoff, maxdelay, jitter=True)
+        attempt = 1
+        while True:
             try:
                 return f(*args, **kwargs)
-            except ExceptionToCheck, e:
-                if e.response['Error']['Code'] == 'InvalidAMIName.Duplicate':
-                    log.debug('Duplicate AMI name {0}, retrying'.format(kwargs['name']))
-                    attempt = abs(_tries - (total_tries + 1))
-                    kwargs['name'] = kwargs.pop('name') + str(attempt)
-                    log.debug('Trying name {0}'.format(kwargs['name']))
-                    sleep(_delay)
-                    _tries -= 1
-                    _delay *= backoff
-                else:
-                    log.critical("Unable to retry register_image due to ClientError: %s", e)
+            except exceptions as e:
+                if not _registration_retryable(e, kwargs, attempt):
                     return False
+                _delay = next(delays, None)
+                if _delay is None:
+                    break
+                with span('retry {0}'.format(f.__name__), WAIT, delay=_delay):
+                    sleep(_delay)
+                attempt += 1
         log.critical('Failed to register AMI')
         return False
     return _retry
@@ -72,21 +242,58 @@ def registration_retry(ExceptionToCheck=(ClientError,), tries=3, delay=1, backof
 class EC2CloudPlugin(BaseCloudPlugin):
     _name = 'ec2'
 
-    def add_metrics(self, metric_base_name, cls, func_name):
-        newfunc = succeeds("{0}.count".format(metric_base_name), self)(raises("{0}.error".format(metric_base_name), self)(timer("{0}.duration".format(metric_base_name), self)(getattr(cls, func_name))))
-        setattr(cls, func_name, newfunc)
-
     def __init__(self):
         super(EC2CloudPlugin, self).__init__()
-        # wrap each of the functions so we can get timer and error metrics
-        for ec2func in ["create_volume", "create_tags", "register_image", "get_all_images"]:
-            self.add_metrics("gator.cloud.ec2.connection.{0}".format(ec2func), EC2Connection, ec2func)
-        for volfunc in ["add_tag", "attach", "create_snapshot", "delete", "detach", "update"]:
-            self.add_metrics("gator.cloud.ec2.volume.{0}".format(volfunc), Volume, volfunc)
-        for imgfunc in ["update"]:
-            self.add_metrics("gator.cloud.ec2.image.{0}".format(imgfunc), Image, imgfunc)
-        for insfunc in ["update"]:
-            self.add_metrics("gator.cloud.ec2.instance.{0}".format(insfunc), Instance, insfunc)
+        self._pool = None
+        self._region = None
+        self._is_secure = True
+        self._allocated = None
+        # the base AMI stage connects alongside __enter__
+        self._connect_lock = threading.Lock()
+
+    def _api(self, operation, region=None, **params):
+        """ one EC2 API call on the pooled client, measured by its event hooks """
+        return getattr(self._client(region or self._region), operation)(**params)
+
+    @property
+    def _connection(self):
+        """ the pooled client for the plugin's region, looked up per use so that forked
+        workers holding a prewarmed plugin open their own connections """
+        return self._client(self._region) if self._region else None
+
+    def credentials(self):
+        """ the session's resolved credentials, for the bundle tools that take them as arguments """
+        with _warm_lock:
+            return _get_session().get_credentials().get_frozen_credentials()
+
+    def _client(self, region, service='ec2', endpoint_url=None):
+        client_config = self.plugin_config.get('client', {})
+        # no metrics plugin has been entered while the daemon prewarms
+        return _get_client(region, is_secure=self._is_secure,
+                           max_pool_connections=int(client_config.get('max_pool_connections', 10)),
+                           max_attempts=int(client_config.get('max_attempts', 10)),
+                           service=service, endpoint_url=endpoint_url, rate_limiter=self._rate_limiter(),
+                           metrics=self._config.get('metrics'))
+
+    def _rate_limiter(self):
+        """ the process-wide rate limiter, None when disabled """
+        global _rate_limiter
+        limit_config = self.plugin_config.get('rate_limit', {})
+        if not limit_config.get('enabled', True):
+            return None
+        with _warm_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(os.path.join(self._config.aminator_root, limit_config.get('filename', 'rate-limit.json')),
+                                            families=limit_config.get('families'), base=limit_config.get('backoff', {}).get('base', 1),
+                                            cap=limit_config.get('backoff', {}).get('cap', 30), metrics=self._config.get('metrics'),
+                                            lease=limit_config.get('lease', 10))
+            return _rate_limiter
+
+    def _describe(self, kind, resource_ids, region=None):
+        """ id -> record for the resources of kind among resource_ids that are visible """
+        operation, key, response_key, record, params = _DESCRIBE[kind]
+        response = self._api(operation, region=region, Filters=[{'Name': key, 'Values': list(resource_ids)}], **params)
+        return dict((resource.id, resource) for resource in map(record, response[response_key]))
 
     def add_plugin_args(self, *args, **kwargs):
         context = self._config.context
@@ -101,6 +308,10 @@ class EC2CloudPlugin(BaseCloudPlugin):
             '-B', '--base-ami-id', dest='base_ami_id',
             action=conf_action(config=context.ami),
             help='The id of the base AMI used in provisioning')
+        base_ami.add_argument(
+            '--base-ami-latest', dest='base_ami_latest',
+            action=conf_action(config=context.ami, action='store_true'),
+            help='Use the newest AMI whose name matches --base-ami-name, which may contain * and ? wildcards')
         cloud = self._parser.add_argument_group(
             title='EC2 Options', description='EC2 Connection Information')
         cloud.add_argument(
@@ -130,49 +341,60 @@ class EC2CloudPlugin(BaseCloudPlugin):
             '--root-volume-size', dest='root_volume_size',
             action=conf_action(config=context.ami),
             help='Root volume size (in GB). The default is to inherit from the base AMI.')
+        cloud.add_argument(
+            '--volume-pool', dest='volume_pool',
+            action=conf_action(config=context.cloud, action='store_true'),
+            help='Take the provisioning volume from a pool of pre-created volumes and refill it')
 
     def configure(self, config, parser):
         super(EC2CloudPlugin, self).configure(config, parser)
-        host = config.context.web_log.get('host', False)
-        if not host:
-            md = get_instance_metadata()
-            pub, ipv4 = 'public-hostname', 'local-ipv4'
-            config.context.web_log['host'] = md[pub] if pub in md else md[ipv4]
+        # instance metadata is only needed to fill web log urls; don't query it at startup otherwise
+        needs_host = any(handler.get('web_log_url_template') for handler in config.logging.values() if isinstance(handler, dict))
+        if needs_host and not config.context.web_log.get('host', False):
+            config.context.web_log['host'] = instance_metadata().hostname
 
     def connect(self, **kwargs):
-        if self._connection:
-            log.warn('Already connected to EC2')
-        else:
-            log.info('Connecting to EC2')
-            self._connect(**kwargs)
+        # the plugin instance outlives a bake in the daemon, so the region and transport are
+        # resolved for every bake rather than kept from the first one
+        region, is_secure = self._endpoint(**kwargs)
+        with self._connect_lock:
+            if self._connection and (region, is_secure) == (self._region, self._is_secure):
+                log.debug('Already connected to EC2 in {0}'.format(region))
+            else:
+                log.info('Connecting to EC2')
+                self._connect(region=region, is_secure=is_secure)
 
-    def _connect(self, **kwargs):
+    def _endpoint(self, **kwargs):
+        """ (region, is_secure) of the current bake """
         cloud_config = self._config.plugins[self.full_name]
         context = self._config.context
-        self._instance_metadata = get_instance_metadata()
-        instance_region = self._instance_metadata['placement']['availability-zone'][:-1]
-        region = kwargs.pop('region', context.get('region', cloud_config.get('region', instance_region)))
+        region = (kwargs.get('region', None) or context.cloud.get('region', None) or context.get('region', None) or
+                  cloud_config.get('region', None) or instance_metadata().region)
+        is_secure = kwargs.get('is_secure', context.cloud.get('is_secure', context.get('is_secure', cloud_config.get('is_secure', True))))
+        return region, is_secure
+
+    def _connect(self, **kwargs):
+        context = self._config.context
+        region, is_secure = self._endpoint(**kwargs)
         log.debug('Establishing connection to region: {0}'.format(region))
 
         context.cloud.setdefault('boto_debug', False)
         if context.cloud.boto_debug:
-            from aminator.config import configure_datetime_logfile
+            from gator.config import configure_datetime_logfile
             configure_datetime_logfile(self._config, 'boto')
-            kwargs['debug'] = 1
+            logging.getLogger('botocore').setLevel(logging.DEBUG)
             log.debug('Boto debug logging enabled')
         else:
-            logging.getLogger('boto').setLevel(logging.INFO)
-        if 'is_secure' not in kwargs:
-            kwargs['is_secure'] = context.get('is_secure', cloud_config.get('is_secure', True))
-        self._connection = connect_to_region(region, **kwargs)
+            logging.getLogger('botocore').setLevel(logging.INFO)
+        self._is_secure = is_secure
+        self._region = region
         log.info('Gatoring in region {0}'.format(region))
 
-    def allocate_base_volume(self, tag=True):
+    def _volume_spec(self):
+        """ (root device mapping of the base AMI, volume type, size) of the provisioning volume """
         cloud_config = self._config.plugins[self.full_name]
         context = self._config.context
 
-        self._volume = Volume(connection=self._connection)
-
         rootdev = context.base_ami.block_device_mapping[context.base_ami.root_device_name]
         volume_type = context.cloud.get('provisioner_ebs_type', cloud_config.get('provisioner_ebs_type', 'standard'))
         volume_size = context.ami.get('root_volume_size', None)
@@ -187,44 +409,114 @@ class EC2CloudPlugin(BaseCloudPlugin):
             raise VolumeException(
                 'root_volume_size ({}) must be at least as large as the root '
                 'volume of the base AMI ({})'.format(volume_size, rootdev.size))
-        self._volume.id = self._connection.create_volume(
-            size=volume_size, zone=self._instance.placement,
-            volume_type=volume_type, snapshot=rootdev.snapshot_id).id
+        return rootdev, volume_type, volume_size
+
+    def _volume_tags(self):
+        cloud_config = self._config.plugins[self.full_name]
+        context = self._config.context
+        return {
+            'purpose': cloud_config.get('tag_ami_purpose', 'amination'),
+            'status': 'busy',
+            'ami': context.base_ami.id,
+            'ami-name': context.base_ami.name,
+            'arch': context.base_ami.architecture,
+        }
+
+    def allocate_base_volume(self, tag=True):
+        rootdev, volume_type, volume_size = self._volume_spec()
+        tags = self._volume_tags() if tag else {}
+        self._volume = _volume_record(self._api(
+            'create_volume', Size=volume_size, AvailabilityZone=self._instance.placement,
+            VolumeType=volume_type, SnapshotId=rootdev.snapshot_id,
+            TagSpecifications=_tag_specifications('volume', tags)))
+        self._volume.tags.update(tags)
         if not self._volume_available():
             log.critical('{0}: unavailable.')
             return False
-
-        if tag:
-            tags = {
-                'purpose': cloud_config.get('tag_ami_purpose', 'amination'),
-                'status': 'busy',
-                'ami': context.base_ami.id,
-                'ami-name': context.base_ami.name,
-                'arch': context.base_ami.architecture,
-            }
-            self._connection.create_tags([self._volume.id], tags)
-        self._volume.update()
         log.debug('Volume {0} created'.format(self._volume.id))
 
-    @retry(VolumeException, tries=2, delay=1, backoff=2, logger=log)
+    def _take_pooled_volume(self, device):
+        """ claim a pooled volume by attaching it at device; False when the pool is disabled or empty """
+        pool = self._volume_pool()
+        if pool is None:
+            return False
+        context = self._config.context
+        rootdev, volume_type, volume_size = self._volume_spec()
+        zone = self._instance.placement
+        pool.expire(context.base_ami)
+        volume_id = pool.take(context.base_ami, volume_type, volume_size, zone, partial(self._claim_volume, device))
+        pool.refill(context.base_ami, volume_type, volume_size, zone, rootdev.snapshot_id)
+        if volume_id is None:
+            return False
+        self._volume = self._describe('volume', [volume_id])[volume_id]
+        log.debug('Volume {0} taken from pool'.format(self._volume.id))
+        return True
+
+    def _claim_volume(self, device, volume_id):
+        """ attach volume_id at device, False if another builder attached it first """
+        from botocore.exceptions import ClientError
+        log.debug('Attaching pooled volume {0} to {1}:{2}'.format(volume_id, self._instance.id, device))
+        try:
+            self._api('attach_volume', VolumeId=volume_id, InstanceId=self._instance.id, Device=device)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('IncorrectState', 'VolumeInUse'):
+                return False
+            raise
+        return True
+
+    @contextmanager
+    def allocated_volume(self, tag=True):
+        if "volume_id" in self._config.context.ami or self._volume_pool() is not None:
+            # pooled volumes are claimed by attaching them
+            yield False
+            return
+        self.allocate_base_volume(tag=tag)
+        self._allocated = self._volume
+        try:
+            yield True
+        finally:
+            if self._allocated is not None:
+                # never attached, so the volume plugin won't delete it
+                self._allocated = None
+                self.delete_volume()
+
+    def _volume_pool(self):
+        cloud_config = self._config.plugins[self.full_name]
+        pool_config = cloud_config.get('volume_pool', {})
+        if not self._config.context.cloud.get('volume_pool', pool_config.get('enabled', False)):
+            return None
+        if self._pool is None:
+            lock_dir = os.path.join(self._config.aminator_root, self._config.lock_dir)
+            self._pool = VolumePool(self._api, size=pool_config.get('size', 2),
+                                    lock_file=os.path.join(lock_dir, 'volume-pool'),
+                                    purpose=cloud_config.get('tag_ami_purpose', 'amination'))
+        return self._pool
+
+    @retry(VolumeException, tries=2, delay=1, backoff=2, logger=log, jitter=True)
     def attach_volume(self, blockdevice, tag=True):
 
         context = self._config.context
         if "volume_id" in context.ami:
-            volumes = self._connection.get_all_volumes(volume_ids=[context.ami.volume_id])
+            volumes = self._describe('volume', [context.ami.volume_id])
             if not volumes:
                 raise VolumeException('Failed to find volume: {0}'.format(context.ami.volume_id))
-            self._volume = volumes[0]
+            self._volume = volumes[context.ami.volume_id]
             return
 
-        self.allocate_base_volume(tag=tag)
         # must do this as amazon still wants /dev/sd*
         ec2_device_name = blockdevice.replace('xvd', 'sd')
-        log.debug('Attaching volume {0} to {1}:{2}({3})'.format(self._volume.id, self._instance.id, ec2_device_name, blockdevice))
-        self._volume.attach(self._instance.id, ec2_device_name)
+        # a volume from allocated_volume is taken once; a retry allocates afresh
+        allocated, self._allocated = self._allocated, None
+        if allocated is not None or not self._take_pooled_volume(ec2_device_name):
+            if allocated is None:
+                self.allocate_base_volume(tag=tag)
+            else:
+                self._volume = allocated
+            log.debug('Attaching volume {0} to {1}:{2}({3})'.format(self._volume.id, self._instance.id, ec2_device_name, blockdevice))
+            self._api('attach_volume', VolumeId=self._volume.id, InstanceId=self._instance.id, Device=ec2_device_name)
         if not self.is_volume_attached(blockdevice):
             log.debug('{0} attachment to {1}:{2}({3}) timed out'.format(self._volume.id, self._instance.id, ec2_device_name, blockdevice))
-            self._volume.add_tag('status', 'used')
+            self._api('create_tags', Resources=[self._volume.id], Tags=_tag_list({'status': 'used'}))
             # trigger a retry
             raise VolumeException('Timed out waiting for {0} to attach to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
         log.debug('Volume {0} attached to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
@@ -241,22 +533,31 @@ class EC2CloudPlugin(BaseCloudPlugin):
             return False
         return True
 
-    @retry(VolumeException, tries=10, delay=1, backoff=2, logger=log)
+    @staticmethod
+    def _attached_check(blockdevice):
+        return lambda volume: (volume is not None and volume.status == 'in-use' and os_node_exists(blockdevice), None)
+
+    @staticmethod
+    def _detached_check(blockdevice):
+        return lambda volume: (volume is not None and volume.status == 'available' and not os_node_exists(blockdevice), None)
+
     def _volume_attached(self, blockdevice):
-        status = self._volume.update()
-        if status != 'in-use':
-            raise VolumeException('Volume {0} not yet attached to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
-        elif not os_node_exists(blockdevice):
-            raise VolumeException('{0} does not exist yet.'.format(blockdevice))
-        else:
-            return True
+        volume = self._wait('volume', self._volume.id, self._attached_check(blockdevice), 'volume_attached',
+                            timeout=self.plugin_config.get('polling', {}).get('attach_timeout', 600))
+        if volume is None:
+            raise VolumeException('Volume {0} not attached to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
+        self._volume.update(volume)
+        return True
 
     def snapshot_volume(self, description=None):
         context = self._config.context
         if not description:
             description = context.snapshot.get('description', '')
+        tags = context.snapshot.get('tags', {})
         log.debug('Creating snapshot with description {0}'.format(description))
-        self._snapshot = self._volume.create_snapshot(description)
+        self._snapshot = _snapshot_record(self._api('create_snapshot', VolumeId=self._volume.id, Description=description,
+                                                    TagSpecifications=_tag_specifications('snapshot', tags)))
+        self._snapshot.tags.update(tags)
         if not self._snapshot_complete():
             log.critical('Failed to create snapshot')
             return False
@@ -264,35 +565,65 @@ class EC2CloudPlugin(BaseCloudPlugin):
             log.debug('Snapshot complete. id: {0}'.format(self._snapshot.id))
             return True
 
-    def _state_check(self, obj, state):
-        obj.update()
-        classname = obj.__class__.__name__
-        if classname in ('Snapshot', 'Volume'):
-            if classname == 'Snapshot':
-                log.debug("Snapshot {0} state: {1}, progress: {2}".format(obj.id, obj.status, obj.progress))
-            return obj.status == state
-        else:
-            return obj.state == state
-
-    @retry(VolumeException, tries=600, delay=0.5, backoff=1.5, logger=log, maxdelay=10)
-    def _wait_for_state(self, resource, state):
-        if self._state_check(resource, state):
-            log.debug('{0} reached state {1}'.format(resource.__class__.__name__, state))
-            return True
-        else:
-            raise VolumeException('Timed out waiting for {0} to get to {1}({2})'.format(resource.id, state, resource.status))
+    def _state_check(self, record, state):
+        """ (reached state, progress percentage or None) for a record from the state poller """
+        if record is None:
+            return False, None
+        if 'progress' in record:
+            log.debug("Snapshot {0} state: {1}, progress: {2}".format(record.id, record.status, record.progress))
+            try:
+                progress = float(str(record.progress).rstrip('%'))
+            except ValueError:
+                progress = None
+            return record.status == state, progress
+        return record.get('status', record.get('state')) == state, None
+
+    def _state_poller(self, region=None):
+        """ the process-wide poller for region, shared by the waits of every bake in this process """
+        region = region or self._region
+        with _warm_lock:
+            poller = _pollers.get(region)
+            if poller is None:
+                polling = self.plugin_config.get('polling', {})
+                history = PollHistory(os.path.join(self._config.aminator_root, polling.get('history', 'poll-history.json')))
+                poller = _pollers[region] = StatePoller(
+                    history=history, timeout=polling.get('timeout', 3600), min_interval=polling.get('min_interval', 0.5),
+                    max_interval=polling.get('max_interval', 15), retryable=_describe_retryable)
+            return poller
+
+    def _poll(self, kind, resource_id, check, operation, size=None, timeout=None, region=None):
+        """ future of the resource's record once check passes, None on timeout. The shared
+        poller describes the resource through this plugin, as this bake """
+        region = region or self._region
+        return self._state_poller(region).watch(kind, resource_id, check, operation, partial(self._describe, region=region),
+                                                size=size, timeout=timeout)
+
+    def _wait(self, kind, resource_id, check, operation, size=None, timeout=None, region=None):
+        """ block until check passes on the resource's record; None on timeout. The shared
+        poller describes the resource through this plugin, as this bake """
+        region = region or self._region
+        return self._state_poller(region).wait(kind, resource_id, check, operation, partial(self._describe, region=region),
+                                               size=size, timeout=timeout)
+
+    def _wait_for_state(self, kind, resource, state, operation, size=None):
+        record = self._wait(kind, resource.id, lambda record: self._state_check(record, state), operation, size=size)
+        if record is None:
+            raise VolumeException('Timed out waiting for {0} to get to {1}'.format(resource.id, state))
+        resource.update(record)
+        log.debug('{0} {1} reached state {2}'.format(kind, resource.id, state))
+        return True
 
     @lapse("gator.cloud.ec2.ami_available.duration")
     def _ami_available(self):
-        return self._wait_for_state(self._ami, 'available')
+        return self._wait_for_state('image', self._ami, 'available', 'ami_available')
 
     @lapse("gator.cloud.ec2.snapshot_completed.duration")
     def _snapshot_complete(self):
-        return self._wait_for_state(self._snapshot, 'completed')
+        return self._wait_for_state('snapshot', self._snapshot, 'completed', 'snapshot_completed', size=self._snapshot.volume_size)
 
     @lapse("gator.cloud.ec2.volume_available.duration")
     def _volume_available(self):
-        return self._wait_for_state(self._volume, 'available')
+        return self._wait_for_state('volume', self._volume, 'available', 'volume_available', size=self._volume.size)
 
     def detach_volume(self, blockdevice):
         context = self._config.context
@@ -300,20 +631,18 @@ class EC2CloudPlugin(BaseCloudPlugin):
             return
 
         log.debug('Detaching volume {0} from {1}'.format(self._volume.id, self._instance.id))
-        self._volume.detach()
+        self._api('detach_volume', VolumeId=self._volume.id)
         if not self._volume_detached(blockdevice):
             raise VolumeException('Time out waiting for {0} to detach from {1}'.format(self._volume.id, self._instance.id))
         log.debug('Successfully detached volume {0} from {1}'.format(self._volume.id, self._instance.id))
 
-    @retry(VolumeException, tries=7, delay=1, backoff=2, logger=log)
     def _volume_detached(self, blockdevice):
-        status = self._volume.update()
-        if status != 'available':
-            raise VolumeException('Volume {0} not yet detached from {1}'.format(self._volume.id, self._instance.id))
-        elif os_node_exists(blockdevice):
-            raise VolumeException('Device node {0} still exists'.format(blockdevice))
-        else:
-            return True
+        volume = self._wait('volume', self._volume.id, self._detached_check(blockdevice), 'volume_detached',
+                            timeout=self.plugin_config.get('polling', {}).get('attach_timeout', 600))
+        if volume is None:
+            return False
+        self._volume.update(volume)
+        return True
 
     def delete_volume(self):
         context = self._config.context
@@ -321,12 +650,14 @@ class EC2CloudPlugin(BaseCloudPlugin):
             return True
 
         log.debug('Deleting volume {0}'.format(self._volume.id))
-        result = self._volume.delete()
-        if not result:
-            log.debug('Volume {0} delete returned False, may require manual cleanup'.format(self._volume.id))
-        else:
-            log.debug('Volume {0} successfully deleted'.format(self._volume.id))
-        return result
+        from botocore.exceptions import ClientError
+        try:
+            self._api('delete_volume', VolumeId=self._volume.id)
+        except ClientError as e:
+            log.debug('Volume {0} delete failed, may require manual cleanup: {1}'.format(self._volume.id, e))
+            return False
+        log.debug('Volume {0} successfully deleted'.format(self._volume.id))
+        return True
 
     def is_stale_attachment(self, dev, prefix):
         log.debug('Checking for stale attachment. dev: {0}, prefix: {1}'.format(dev, prefix))
@@ -336,12 +667,8 @@ class EC2CloudPlugin(BaseCloudPlugin):
         log.debug('{0} not stale, using'.format(dev))
         return False
 
-    @registration_retry(tries=3, delay=1, backoff=1)
-    def _register_image(self, **ami_metadata):
-        """Register the AMI using boto3/botocore components which supports ENA
-           This is the only use of boto3 in gator currently"""
-
-        # construct AMI registration payload boto3 style
+    def _registration_request(self, ami_metadata):
+        """ the RegisterImage request for ami_metadata, boto3 style """
         request = {}
         request['Name'] = ami_metadata.get('name', None)
         request['Description'] = ami_metadata.get('description', None)
@@ -359,6 +686,9 @@ class EC2CloudPlugin(BaseCloudPlugin):
         if ami_metadata.get('image_location') is not None:
             request['ImageLocation'] = ami_metadata.get('image_location')
 
+        if ami_metadata.get('tags'):
+            request['TagSpecifications'] = _tag_specifications('image', ami_metadata['tags'])
+
         # can only be set to 'simple' for hvm.  don't include otherwise
         if ami_metadata.get('sriov_net_support') is not None:
             request['SriovNetSupport'] = ami_metadata.get('sriov_net_support')
@@ -375,10 +705,17 @@ class EC2CloudPlugin(BaseCloudPlugin):
                 raise FinalizerException('{} cannot be None'.format(key))
 
         log.debug('Boto3 registration request data [{}]'.format(request))
+        return request
+
+    @registration_retry(tries=3, delay=1, backoff=1)
+    def _register_image(self, **ami_metadata):
+        """Register the AMI through the pooled client, which supports ENA"""
+        request = self._registration_request(ami_metadata)
 
+        from botocore.exceptions import ClientError
+        region = ami_metadata.get('region')
         try:
-            client = boto3.client('ec2', region_name=ami_metadata.get('region'))
-            response = client.register_image(**request)
+            response = self._api('register_image', region=region, **request)
             log.debug('Registration response data [{}]'.format(response))
 
             ami_id = response['ImageId']
@@ -386,15 +723,12 @@ class EC2CloudPlugin(BaseCloudPlugin):
                 return False
 
             log.info('Waiting for [{}] to become available'.format(ami_id))
-            waiter = client.get_waiter('image_available')
-            wait_request = {}
-            wait_request['ImageIds'] = []
-            wait_request['ImageIds'].append(ami_id)
-            waiter.wait(**wait_request)
-            # Now, using boto2, load the Image so downstream tagging operations work
-            # using boto2 classes
-            log.debug('Image available!  Loading boto2.Image for [{}]'.format(ami_id))
-            self._ami = self._connection.get_image(ami_id)
+            # the record the poller last described is the registered image, no reload needed
+            self._ami = self._wait('image', ami_id, self._image_state, 'image_available', region=region)
+            if self._ami is None:
+                raise FinalizerException('Timed out waiting for {0} to become available'.format(ami_id))
+            # replicas are copied from, and a resumed bake finds the image in, this region
+            self._ami.region = region
         except ClientError as e:
             if e.response['Error']['Code'] == 'InvalidAMIID.NotFound':
                 log.debug('{0} was not found while waiting for it to become available'.format(ami_id))
@@ -409,14 +743,66 @@ class EC2CloudPlugin(BaseCloudPlugin):
 
         return True
 
-    def register_image(self, *args, **kwargs):
+    def _image_state(self, image):
+        """ (available, None) for a freshly registered image, which may not be visible yet """
+        if image is None:
+            return False, None
+        if image.state == 'failed':
+            raise FinalizerException('Registration of {0} failed: {1}'.format(image.id, image.state_reason))
+        return image.state == 'available', None
+
+    @timer("gator.cloud.ec2.replicate_image.duration")
+    def replicate_image(self, regions):
+        """
+        start CopyImage in every region at once, then wait on all copies with one poller,
+        so the wait is that of the slowest region rather than the sum
+        """
+        from botocore.exceptions import ClientError
+        context = self._config.context
+        replicas = {}
+        with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+            copies = dict((region, pool.submit(self._api, 'copy_image', region=region, SourceRegion=self._ami.region,
+                                               SourceImageId=self._ami.id, Name=self._ami.name,
+                                               Description=self._ami.description or '',
+                                               TagSpecifications=_tag_specifications('image', context.ami.get('tags', {}))))
+                          for region in regions)
+        for region, copy in copies.items():
+            try:
+                replicas[region] = copy.result()['ImageId']
+            except ClientError as e:
+                log.critical('Unable to copy {0} to {1}: {2}'.format(self._ami.id, region, e))
+                return False
+            log.info('Copying {0} to {1} as {2}'.format(self._ami.id, region, replicas[region]))
+
+        if not self._wait_for_replicas(replicas):
+            return False
+        return replicas
+
+    def _wait_for_replicas(self, replicas):
+        """ wait on every copy at once, each through its region's shared poller """
+        timeout = self.plugin_config.get('replicate_timeout', 3600)
+        copies = dict((region, self._poll('image', image_id, self._image_state, 'replica_available', timeout=timeout, region=region))
+                      for region, image_id in replicas.items())
+        with span('replicas pending', WAIT, regions=sorted(replicas)):
+            for region, image_id in replicas.items():
+                try:
+                    image = copies[region].result()
+                except Exception as e:
+                    log.critical('Replica {0} in {1} not available: {2}'.format(image_id, region, e))
+                    return False
+                if image is None:
+                    log.critical('Replica {0} in {1} not available: timed out'.format(image_id, region))
+                    return False
+                log.info('Replica {0} available in {1}'.format(image_id, region))
+        return True
+
+    def _ami_metadata(self, *args, **kwargs):
+        """ registration details of the image, from register_image's arguments """
         context = self._config.context
         vm_type = context.ami.get("vm_type", "paravirtual")
         architecture = context.ami.get("architecture", "x86_64")
         cloud_config = self._config.plugins[self.full_name]
-        self._instance_metadata = get_instance_metadata()
-        instance_region = self._instance_metadata['placement']['availability-zone'][:-1]
-        region = kwargs.pop('region', context.get('region', cloud_config.get('region', instance_region)))
+        region = kwargs.pop('region', None) or context.get('region', cloud_config.get('region', None)) or self._region
 
         ami_metadata = {
             'name': context.ami.name,
@@ -425,7 +811,8 @@ class EC2CloudPlugin(BaseCloudPlugin):
             'architecture': architecture,
             'kernel_id': context.base_ami.kernel_id,
             'ramdisk_id': context.base_ami.ramdisk_id,
-            'region': region
+            'region': region,
+            'tags': context.ami.get('tags', {}),
         }
 
         if 'manifest' in kwargs:
@@ -445,8 +832,10 @@ class EC2CloudPlugin(BaseCloudPlugin):
             if context.ami.get("enhanced_networking", False):
                 ami_metadata['sriov_net_support'] = 'simple'
             ami_metadata['ena_networking'] = context.ami.get('ena_networking', False)
+        return ami_metadata
 
-        if not self._register_image(**ami_metadata):
+    def register_image(self, *args, **kwargs):
+        if not self._register_image(**self._ami_metadata(*args, **kwargs)):
             return False
 
         return True
@@ -487,46 +876,55 @@ class EC2CloudPlugin(BaseCloudPlugin):
         log.debug('Created BlockDeviceMapping [{}]'.format(bdm))
         return bdm
 
-    @retry(FinalizerException, tries=3, delay=1, backoff=2, logger=log)
-    def add_tags(self, resource_type):
+    @retry(FinalizerException, tries=3, delay=1, backoff=2, logger=log, jitter=True)
+    def add_tags(self, *resource_types):
+        """
+        apply the context's tags for each resource type to its resource. Tags a resource
+        already carries, usually from its creation, are skipped; the rest go out in one
+        create_tags call per distinct set of tags
+        """
         context = self._config.context
+        pending = {}
+        for resource_type in resource_types:
+            tags = context[resource_type].get('tags', None)
+            if not tags:
+                log.critical('Unable to locate tags for {0}'.format(resource_type))
+                return False
+            resource = getattr(self, '_' + resource_type, None)
+            if resource is None:
+                log.critical('Tagging failed: Unable to find local instance var _{0}'.format(resource_type))
+                return False
+            missing = tuple(sorted((key, str(value)) for key, value in tags.items() if resource.tags.get(key) != str(value)))
+            if missing:
+                pending.setdefault(missing, []).append((resource_type, resource))
+            else:
+                log.debug('{0}({1}) already tagged'.format(resource_type, resource.id))
 
-        log.debug('Adding tags for resource type {0}'.format(resource_type))
-
-        tags = context[resource_type].get('tags', None)
-        if not tags:
-            log.critical('Unable to locate tags for {0}'.format(resource_type))
-            return False
-
-        instance_var = '_' + resource_type
-        try:
-            instance = getattr(self, instance_var)
-        except Exception:
-            errstr = 'Tagging failed: Unable to find local instance var {0}'.format(instance_var)
-            log.debug(errstr, exc_info=True)
-            log.critical(errstr)
-            return False
-        else:
+        from botocore.exceptions import ClientError
+        for tags, resources in pending.items():
             try:
-                self._connection.create_tags([instance.id], tags)
-            except EC2ResponseError:
-                errstr = 'Error creating tags for resource type {0}, id {1}'
-                errstr = errstr.format(resource_type, instance.id)
+                self._api('create_tags', Resources=[resource.id for _, resource in resources], Tags=_tag_list(dict(tags)))
+            except ClientError:
+                errstr = 'Error creating tags for {0}'.format(', '.join('{0} {1}'.format(*pair) for pair in resources))
                 log.critical(errstr)
                 raise FinalizerException(errstr)
-            else:
-                log.debug('Successfully tagged {0}({1})'.format(resource_type, instance.id))
-                instance.update()
-                tagstring = '\n'.join('='.join((key, val)) for (key, val) in tags.iteritems())
-                log.debug('Tags: \n{0}'.format(tagstring))
-                return True
+            for resource_type, resource in resources:
+                resource.tags.update(tags)
+                log.debug('Successfully tagged {0}({1})'.format(resource_type, resource.id))
+            log.debug('Tags: \n{0}'.format('\n'.join('='.join(tag) for tag in tags)))
+        return True
 
     def attached_block_devices(self, prefix):
         log.debug('Checking for currently attached block devices. prefix: {0}'.format(prefix))
-        self._instance.update()
-        if device_prefix(self._instance.block_device_mapping.keys()[0]) != prefix:
-            return dict((native_block_device(dev, prefix), mapping) for (dev, mapping) in self._instance.block_device_mapping.iteritems())
-        return self._instance.block_device_mapping
+        self._instance = self._describe_instance(self._instance.id)
+        mapping = self._instance.block_device_mapping
+        if mapping and device_prefix(next(iter(mapping))) != prefix:
+            return dict((native_block_device(dev, prefix), device) for (dev, device) in mapping.items())
+        return mapping
+
+    def _describe_instance(self, instance_id):
+        reservations = self._api('describe_instances', InstanceIds=[instance_id])['Reservations']
+        return _instance_record(reservations[0]['Instances'][0])
 
     def _resolve_baseami(self):
         log.info('Resolving base AMI')
@@ -548,48 +946,295 @@ class EC2CloudPlugin(BaseCloudPlugin):
         log.info('Successfully resolved {0.name}({0.id})'.format(baseami))
         context['base_ami'] = baseami
 
+    def _image_cache(self):
+        cache_config = self.plugin_config.get('image_cache', {})
+        filename = os.path.join(self._config.aminator_root, cache_config.get('filename', 'image-cache.db'))
+        with _warm_lock:
+            if filename not in _image_caches:
+                _image_caches[filename] = ImageCache(filename, ttl=cache_config.get('ttl', 3600), refresh=cache_config.get('refresh', 300))
+            return _image_caches[filename]
+
     def _lookup_ami_by_name(self, ami_name):
-        ami_details = self._lookup_image_cache(ami_name)
-        if ami_details:
-            return ami_details
-        log.info('looking up base AMI with name {0}'.format(ami_name))
-        ami_details = self._connection.get_all_images(filters={'name': ami_name})[0]
-        self._save_image_cache(ami_name, ami_details)
-        return ami_details
+        """
+        resolve a base AMI name or pattern. With base_ami_owners configured, the name is
+        looked up in the local catalog of those owners' images; otherwise in EC2
+        """
+        context = self._config.context
+        latest = context.ami.get('base_ami_latest', self.plugin_config.get('base_ami_latest', False))
+        owners = self._base_ami_owners()
+        if owners:
+            self._refresh_catalog()
+            images = self._image_cache().find(self._region, ','.join(owners), ami_name)
+            if not images:
+                # registered since the last refresh, perhaps
+                self._refresh_catalog(force=True)
+                images = self._image_cache().find(self._region, ','.join(owners), ami_name)
+        else:
+            image = None if _is_pattern(ami_name) else self._image_cache().get_by_name(self._region, ami_name)
+            if image is not None:
+                return _image_record(image)
+            log.info('looking up base AMI with name {0}'.format(ami_name))
+            response = self._api('describe_images', Filters=[{'Name': 'name', 'Values': [ami_name]}])
+            images = sorted((_image_fields(image) for image in response['Images']),
+                            key=lambda image: image.get('CreationDate') or '', reverse=True)
+            self._image_cache().put(self._region, images)
+        names = set(image['Name'] for image in images)
+        if len(names) > 1 and not latest:
+            raise RuntimeError('{0} matches {1} AMI names; use --base-ami-latest for the newest'.format(ami_name, len(names)))
+        return _image_record(images[0])
 
     def _lookup_ami_by_id(self, ami_id):
-        ami_details = self._lookup_image_cache(ami_id)
-        if ami_details:
-            return ami_details
-        log.info('looking up base AMI with ID {0}'.format(ami_id))
-        ami_details = self._connection.get_all_images(image_ids=[ami_id])[0]
-        self._save_image_cache(ami_id, ami_details)
-        return ami_details
-
-    def _lookup_image_cache(self, filename):
-        cache_file = os.path.join(self._config.aminator_root, "image-cache", filename)
-        if os.path.isfile(cache_file):
+        image = self._image_cache().get_by_id(self._region, ami_id)
+        if image is None:
+            log.info('looking up base AMI with ID {0}'.format(ami_id))
+            image = _image_fields(self._api('describe_images', ImageIds=[ami_id])['Images'][0])
+            self._image_cache().put(self._region, [image])
+        return _image_record(image)
+
+    def _base_ami_owners(self):
+        return sorted(str(owner) for owner in self.plugin_config.get('base_ami_owners', None) or [])
+
+    def _refresh_catalog(self, force=False):
+        """
+        bring the catalog of base_ami_owners' images up to date. A full listing is taken
+        every full_refresh seconds; in between, every refresh seconds (or when forced), only
+        images created since the newest one indexed are fetched
+        """
+        owners = self._base_ami_owners()
+        cache_config = self.plugin_config.get('image_cache', {})
+        cache = self._image_cache()
+        status = cache.catalog_status(self._region, ','.join(owners))
+        now = time()
+        newest = None
+        if status is not None and status.newest:
+            newest = datetime.strptime(status.newest[:10], '%Y-%m-%d')
+        full = (status is None or newest is None or now - status.full_refreshed > cache_config.get('full_refresh', 86400)
+                or (datetime.utcnow() - newest).days > 30)
+        if not full and not force and now - status.refreshed < cache_config.get('refresh', 300):
+            return
+        filters = [{'Name': 'state', 'Values': ['available']}]
+        if not full:
+            days = (datetime.utcnow() - newest).days + 1
+            filters.append({'Name': 'creation-date',
+                            'Values': ['{0:%Y-%m-%d}T*'.format(newest + timedelta(days=day)) for day in range(days + 1)]})
+        images = []
+        params = {'Owners': owners, 'Filters': filters}
+        while True:
+            response = self._api('describe_images', **params)
+            images.extend(_image_fields(image) for image in response['Images'])
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+        cache.update_catalog(self._region, ','.join(owners), images, full=full)
+
+    # asyncio implementation. API calls, which are short and blocking in botocore, run on
+    # one small executor shared by every bake in the process; waits are futures resolved
+    # by the shared state poller, so a waiting bake holds no thread
+
+    def _get_api_executor(self):
+        global _api_executor
+        with _warm_lock:
+            if _api_executor is None:
+                _api_executor = ThreadPoolExecutor(
+                    max_workers=int(self.plugin_config.get('client', {}).get('max_pool_connections', 10)),
+                    thread_name_prefix='gator-ec2-api')
+            return _api_executor
+
+    async def _api_async(self, operation, region=None, **params):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_api_executor(), self._in_bake(self._api, operation, region=region, **params))
+
+    async def _watch(self, kind, resource_id, check, operation, size=None, timeout=None, region=None):
+        """ the resource's record once check passes, None on timeout """
+        region = region or self._region
+        future = self._poll(kind, resource_id, check, operation, size=size, timeout=timeout, region=region)
+        with span('poll {0}'.format(operation), WAIT, resource=resource_id):
+            return await asyncio.wrap_future(future)
+
+    async def _wait_for_state_async(self, kind, resource, state, operation, size=None):
+        record = await self._watch(kind, resource.id, lambda record: self._state_check(record, state), operation, size=size)
+        if record is None:
+            raise VolumeException('Timed out waiting for {0} to get to {1}'.format(resource.id, state))
+        resource.update(record)
+        log.debug('{0} {1} reached state {2}'.format(kind, resource.id, state))
+        return True
+
+    async def allocate_base_volume_async(self, tag=True):
+        context = self._config.context
+        rootdev, volume_type, volume_size = self._volume_spec()
+        tags = self._volume_tags() if tag else {}
+        self._volume = _volume_record(await self._api_async(
+            'create_volume', Size=volume_size, AvailabilityZone=self._instance.placement,
+            VolumeType=volume_type, SnapshotId=rootdev.snapshot_id,
+            TagSpecifications=_tag_specifications('volume', tags)))
+        self._volume.tags.update(tags)
+        await self._wait_for_state_async('volume', self._volume, 'available', 'volume_available', size=self._volume.size)
+        log.debug('Volume {0} created from {1}'.format(self._volume.id, context.base_ami.id))
+
+    @retry_async(VolumeException, tries=2, delay=1, backoff=2, logger=log, jitter=True)
+    async def attach_volume_async(self, blockdevice, tag=True):
+        context = self._config.context
+        if "volume_id" in context.ami:
+            volumes = await self._run(self._describe, 'volume', [context.ami.volume_id])
+            if not volumes:
+                raise VolumeException('Failed to find volume: {0}'.format(context.ami.volume_id))
+            self._volume = volumes[context.ami.volume_id]
+            return
+
+        # must do this as amazon still wants /dev/sd*
+        ec2_device_name = blockdevice.replace('xvd', 'sd')
+        allocated, self._allocated = self._allocated, None
+        # pool bookkeeping holds a host-wide lock
+        if allocated is not None or self._volume_pool() is None or not await self._run(self._take_pooled_volume, ec2_device_name):
+            if allocated is None:
+                await self.allocate_base_volume_async(tag=tag)
+            else:
+                self._volume = allocated
+            log.debug('Attaching volume {0} to {1}:{2}({3})'.format(self._volume.id, self._instance.id, ec2_device_name, blockdevice))
+            await self._api_async('attach_volume', VolumeId=self._volume.id, InstanceId=self._instance.id, Device=ec2_device_name)
+        volume = await self._watch('volume', self._volume.id, self._attached_check(blockdevice), 'volume_attached',
+                                   timeout=self.plugin_config.get('polling', {}).get('attach_timeout', 600))
+        if volume is None:
+            await self._api_async('create_tags', Resources=[self._volume.id], Tags=_tag_list({'status': 'used'}))
+            # trigger a retry
+            raise VolumeException('Timed out waiting for {0} to attach to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
+        self._volume.update(volume)
+        log.debug('Volume {0} attached to {1}:{2}'.format(self._volume.id, self._instance.id, blockdevice))
+
+    async def detach_volume_async(self, blockdevice):
+        if "volume_id" in self._config.context.ami:
+            return
+        log.debug('Detaching volume {0} from {1}'.format(self._volume.id, self._instance.id))
+        await self._api_async('detach_volume', VolumeId=self._volume.id)
+        volume = await self._watch('volume', self._volume.id, self._detached_check(blockdevice), 'volume_detached',
+                                   timeout=self.plugin_config.get('polling', {}).get('attach_timeout', 600))
+        if volume is None:
+            raise VolumeException('Time out waiting for {0} to detach from {1}'.format(self._volume.id, self._instance.id))
+        self._volume.update(volume)
+        log.debug('Successfully detached volume {0} from {1}'.format(self._volume.id, self._instance.id))
+
+    async def delete_volume_async(self):
+        if "volume_id" in self._config.context.ami:
+            return True
+        log.debug('Deleting volume {0}'.format(self._volume.id))
+        from botocore.exceptions import ClientError
+        try:
+            await self._api_async('delete_volume', VolumeId=self._volume.id)
+        except ClientError as e:
+            log.debug('Volume {0} delete failed, may require manual cleanup: {1}'.format(self._volume.id, e))
+            return False
+        log.debug('Volume {0} successfully deleted'.format(self._volume.id))
+        return True
+
+    async def snapshot_volume_async(self, description=None):
+        context = self._config.context
+        if not description:
+            description = context.snapshot.get('description', '')
+        tags = context.snapshot.get('tags', {})
+        log.debug('Creating snapshot with description {0}'.format(description))
+        self._snapshot = _snapshot_record(await self._api_async('create_snapshot', VolumeId=self._volume.id, Description=description,
+                                                                TagSpecifications=_tag_specifications('snapshot', tags)))
+        self._snapshot.tags.update(tags)
+        try:
+            await self._wait_for_state_async('snapshot', self._snapshot, 'completed', 'snapshot_completed', size=self._snapshot.volume_size)
+        except VolumeException:
+            log.critical('Failed to create snapshot')
+            return False
+        log.debug('Snapshot complete. id: {0}'.format(self._snapshot.id))
+        return True
+
+    async def register_image_async(self, *args, **kwargs):
+        from botocore.exceptions import ClientError
+        ami_metadata = self._ami_metadata(*args, **kwargs)
+        region = ami_metadata.get('region')
+        # registration_retry's schedule
+        delays = backoff_delays(2, 1, 1, 30, jitter=True)
+        attempt = 1
+        while True:
             try:
-                log.info("loading cached ami details for {0}".format(filename))
-                with open(cache_file, 'r') as f:
-                    return dill.load(f)
-            except Exception as e:
-                log.warning("Failed to parse {0}: {1}".format(cache_file, e))
-        return None
-
-    def _save_image_cache(self, filename, details):
-        cache_dir = os.path.join(self._config.aminator_root, "image-cache")
-        cache_file = os.path.join(cache_dir, filename)
-        mkdir_p(cache_dir)
-        with open(cache_file, 'w') as f:
-            dill.dump(details, f)
+                response = await self._api_async('register_image', region=region, **self._registration_request(ami_metadata))
+                break
+            except ClientError as e:
+                if not _registration_retryable(e, ami_metadata, attempt):
+                    return False
+                delay = next(delays, None)
+                if delay is None:
+                    log.critical('Failed to register AMI')
+                    return False
+                with span('retry register_image', WAIT, delay=delay):
+                    await asyncio.sleep(delay)
+                attempt += 1
+        ami_id = response['ImageId']
+        log.info('Waiting for [{}] to become available'.format(ami_id))
+        self._ami = await self._watch('image', ami_id, self._image_state, 'image_available', region=region)
+        if self._ami is None:
+            raise FinalizerException('Timed out waiting for {0} to become available'.format(ami_id))
+        self._ami.region = region
+        log.info('AMI registered: {0} {1}'.format(self._ami.id, self._ami.name))
+        self._config.context.ami.image = self._ami
+        return True
 
-    def __enter__(self):
+    async def replicate_image_async(self, regions):
+        from botocore.exceptions import ClientError
+        context = self._config.context
+        tags = _tag_specifications('image', context.ami.get('tags', {}))
+        copies = await asyncio.gather(*[
+            self._api_async('copy_image', region=region, SourceRegion=self._ami.region, SourceImageId=self._ami.id,
+                            Name=self._ami.name, Description=self._ami.description or '', TagSpecifications=tags)
+            for region in regions], return_exceptions=True)
+        replicas = {}
+        for region, copy in zip(regions, copies):
+            if isinstance(copy, ClientError):
+                log.critical('Unable to copy {0} to {1}: {2}'.format(self._ami.id, region, copy))
+                return False
+            if isinstance(copy, BaseException):
+                raise copy
+            replicas[region] = copy['ImageId']
+            log.info('Copying {0} to {1} as {2}'.format(self._ami.id, region, replicas[region]))
+
+        timeout = self.plugin_config.get('replicate_timeout', 3600)
+        images = await asyncio.gather(*[
+            self._watch('image', image_id, self._image_state, 'replica_available', timeout=timeout, region=region)
+            for region, image_id in replicas.items()], return_exceptions=True)
+        for (region, image_id), image in zip(replicas.items(), images):
+            if image is None or isinstance(image, BaseException):
+                log.critical('Replica {0} in {1} not available: {2}'.format(image_id, region, image or 'timed out'))
+                return False
+            log.info('Replica {0} available in {1}'.format(image_id, region))
+        return replicas
+
+    def checkpoint_state(self):
+        state = {}
+        # the volume is deleted when its bake unwinds, so only the snapshot and image are resumable
+        for key, attr in (('snapshot_id', '_snapshot'), ('ami_id', '_ami')):
+            resource = getattr(self, attr, None)
+            if resource is not None and resource.id:
+                state[key] = resource.id
+        if 'ami_id' in state and self._ami.get('region'):
+            state['ami_region'] = self._ami.region
+        return state
+
+    def restore(self, state):
+        if state.get('snapshot_id'):
+            log.info('Restoring snapshot {0}'.format(state['snapshot_id']))
+            self._snapshot = self._describe('snapshot', [state['snapshot_id']])[state['snapshot_id']]
+        if state.get('ami_id'):
+            log.info('Restoring image {0}'.format(state['ami_id']))
+            region = state.get('ami_region') or self._region
+            self._ami = self._describe('image', [state['ami_id']], region=region)[state['ami_id']]
+            self._ami.region = region
+            self._config.context.ami.image = self._ami
+
+    def resolve_base_ami(self):
         self.connect()
         self._resolve_baseami()
-        self._instance = Instance(connection=self._connection)
-        self._instance.id = get_instance_metadata()['instance-id']
-        self._instance.update()
+
+    def prewarm(self):
+        self.resolve_base_ami()
+
+    def __enter__(self):
+        self.connect()
+        self._instance = self._describe_instance(instance_metadata().instance_id)
 
         context = self._config.context
         if context.ami.get("base_ami_name", None):
@@ -600,4 +1245,12 @@ class EC2CloudPlugin(BaseCloudPlugin):
         if context.cloud.get("region", None):
             environ["GATOR_REGION"] = context.cloud.region
 
-        return self
\ No newline at end of file
+        return self
+
+    def __exit__(self, typ, val, trc):
+        if self._pool is not None:
+            self._pool.join()
+        if _rate_limiter is not None and _rate_limiter.waited:
+            log.info('Waited on the API rate limiter: {0}'.format(
+                ', '.join('{0} {1:.1f}s'.format(name, seconds) for name, seconds in sorted(_rate_limiter.waited.items()))))
+        return super(EC2CloudPlugin, self).__exit__(typ, val, trc)
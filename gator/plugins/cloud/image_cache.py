@@ -0,0 +1,245 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.image_cache
+===============================
+Base AMI details shared by every gator process on a host: single images looked up by
+id or name, and an owner-scoped catalog that name patterns are resolved against
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from time import time
+
+from gator.util.linux import mkdir_p
+
+
+__all__ = ('CatalogStatus', 'ImageCache')
+log = logging.getLogger(__name__)
+
+# bumped whenever the schema changes; older cache files are rebuilt
+_SCHEMA_VERSION = 2
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    region TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    name TEXT,
+    creation_date TEXT,
+    details TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (region, image_id)
+);
+CREATE INDEX IF NOT EXISTS images_by_name ON images (region, name, creation_date);
+CREATE TABLE IF NOT EXISTS catalog (
+    region TEXT NOT NULL,
+    owners TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    creation_date TEXT,
+    details TEXT NOT NULL,
+    PRIMARY KEY (region, owners, image_id)
+);
+CREATE INDEX IF NOT EXISTS catalog_by_name ON catalog (region, owners, name, creation_date);
+CREATE TABLE IF NOT EXISTS catalogs (
+    region TEXT NOT NULL,
+    owners TEXT NOT NULL,
+    newest TEXT,
+    refreshed REAL NOT NULL,
+    full_refreshed REAL NOT NULL,
+    PRIMARY KEY (region, owners)
+);
+"""
+
+# newest: creation date of the newest image indexed; refreshed, full_refreshed: times
+CatalogStatus = namedtuple('CatalogStatus', 'newest refreshed full_refreshed')
+
+
+class ImageCache(object):
+    """
+    One SQLite table of DescribeImages entries keyed by region and image id, indexed by
+    region and name, each valid for ttl seconds. Entries are written in WAL mode with a
+    busy timeout, so concurrent gator processes read while one writes. A per-process tier
+    in front of it is inherited by forked bake workers; its catalog statuses are re-read
+    once they are refresh seconds old, since another process may have refreshed the
+    catalog, and name matches are kept only as long as the status they were found under.
+    The cache is an optimization: database errors are logged and treated as misses
+    """
+    def __init__(self, filename, ttl=3600, refresh=300):
+        self._filename = filename
+        self._ttl = float(ttl)
+        self._refresh = float(refresh)
+        self._memory = {}
+        self._catalogs = {}
+        self._found = {}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            mkdir_p(os.path.dirname(self._filename))
+        connection = sqlite3.connect(self._filename, timeout=30)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            if connection.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+                with connection:
+                    for (table,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                        connection.execute('DROP TABLE {0}'.format(table))
+                    connection.executescript(_SCHEMA)
+                    connection.execute('PRAGMA user_version = {0}'.format(_SCHEMA_VERSION))
+            self._initialized = True
+        return connection
+
+    def _query(self, sql, *params):
+        connection = self._connect()
+        try:
+            return connection.execute(sql, params).fetchone()
+        finally:
+            connection.close()
+
+    def _query_all(self, sql, *params):
+        connection = self._connect()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def _lookup(self, key, sql, *params):
+        now = time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        try:
+            row = self._query(sql, *(params + (now - self._ttl,)))
+        except (sqlite3.Error, OSError) as e:
+            log.warning('Unable to read image cache {0}: {1}'.format(self._filename, e))
+            return None
+        if row is None:
+            return None
+        details = json.loads(row[0])
+        with self._lock:
+            self._memory[key] = (row[1] + self._ttl, details)
+        return details
+
+    def get_by_id(self, region, image_id):
+        """ the cached DescribeImages entry for image_id, None when missing or expired """
+        return self._lookup((region, 'id', image_id),
+                            'SELECT details, fetched FROM images WHERE region = ? AND image_id = ? AND fetched > ?',
+                            region, image_id)
+
+    def get_by_name(self, region, name):
+        """ the newest cached image named name, None when missing or expired """
+        return self._lookup((region, 'name', name),
+                            'SELECT details, fetched FROM images WHERE region = ? AND name = ? AND fetched > ? '
+                            'ORDER BY creation_date DESC LIMIT 1',
+                            region, name)
+
+    def put(self, region, images):
+        """
+        store DescribeImages entries. An image replaces any other entry under its name in
+        the region, so names re-pointed at a newer image resolve to it
+        """
+        now = time()
+        # oldest first, so that of several images sharing a name the newest is kept
+        images = sorted(images, key=lambda image: image.get('CreationDate') or '')
+        with self._lock:
+            for image in images:
+                self._memory[(region, 'id', image['ImageId'])] = (now + self._ttl, image)
+                if image.get('Name'):
+                    self._memory[(region, 'name', image['Name'])] = (now + self._ttl, image)
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute('DELETE FROM images WHERE fetched <= ?', (now - self._ttl,))
+                    for image in images:
+                        connection.execute('DELETE FROM images WHERE region = ? AND name = ? AND image_id != ?',
+                                           (region, image.get('Name'), image['ImageId']))
+                        connection.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)',
+                                           (region, image['ImageId'], image.get('Name'), image.get('CreationDate'),
+                                            json.dumps(image), now))
+            finally:
+                connection.close()
+        except (sqlite3.Error, OSError) as e:
+            log.warning('Unable to write image cache {0}: {1}'.format(self._filename, e))
+
+    def catalog_status(self, region, owners):
+        """ the CatalogStatus of the catalog of owners in region, None before its first refresh """
+        with self._lock:
+            status = self._catalogs.get((region, owners))
+        if status is not None and time() - status.refreshed < self._refresh:
+            return status
+        try:
+            row = self._query('SELECT newest, refreshed, full_refreshed FROM catalogs WHERE region = ? AND owners = ?', region, owners)
+        except (sqlite3.Error, OSError) as e:
+            log.warning('Unable to read image cache {0}: {1}'.format(self._filename, e))
+            return status
+        if row is None or (status is not None and row[1] <= status.refreshed):
+            return status
+        status = CatalogStatus(*row)
+        with self._lock:
+            self._catalogs[(region, owners)] = status
+        return status
+
+    def update_catalog(self, region, owners, images, full=False):
+        """
+        index DescribeImages entries in the catalog of owners. A full refresh replaces the
+        catalog, dropping deregistered images; otherwise images are added
+        """
+        now = time()
+        status = self.catalog_status(region, owners)
+        dates = [image.get('CreationDate') or '' for image in images]
+        if status is not None and not full:
+            dates.append(status.newest or '')
+        status = CatalogStatus(max(dates) if dates else None, now,
+                               now if full or status is None else status.full_refreshed)
+        with self._lock:
+            self._catalogs[(region, owners)] = status
+            for key in [key for key in self._found if key[:2] == (region, owners)]:
+                del self._found[key]
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    if full:
+                        connection.execute('DELETE FROM catalog WHERE region = ? AND owners = ?', (region, owners))
+                    connection.executemany('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?)',
+                                           [(region, owners, image['ImageId'], image.get('Name') or '',
+                                             image.get('CreationDate'), json.dumps(image)) for image in images])
+                    connection.execute('INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?, ?, ?)', (region, owners) + tuple(status))
+            finally:
+                connection.close()
+        except (sqlite3.Error, OSError) as e:
+            log.warning('Unable to write image cache {0}: {1}'.format(self._filename, e))
+        log.debug('{0} catalog of {1} in {2}: {3} images indexed'.format('Rebuilt' if full else 'Updated', owners, region, len(images)))
+
+    def find(self, region, owners, pattern):
+        """
+        catalog images whose name matches pattern, which may use * and ? wildcards,
+        newest first
+        """
+        key = (region, owners, pattern)
+        status = self.catalog_status(region, owners)
+        with self._lock:
+            found = self._found.get(key)
+            if found is not None and found[0] == status:
+                return found[1]
+        try:
+            # AMI names may contain [, which GLOB would take for a character class
+            rows = self._query_all('SELECT details FROM catalog WHERE region = ? AND owners = ? AND name GLOB ? '
+                                   'ORDER BY creation_date DESC', region, owners, pattern.replace('[', '[[]'))
+        except (sqlite3.Error, OSError) as e:
+            log.warning('Unable to read image cache {0}: {1}'.format(self._filename, e))
+            return []
+        images = [json.loads(row[0]) for row in rows]
+        if images:
+            with self._lock:
+                self._found[key] = (status, images)
+        return images
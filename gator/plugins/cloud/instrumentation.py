@@ -0,0 +1,131 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.instrumentation
+===================================
+Per-operation API metrics and rate limiting from botocore client events: registered
+once per pooled client, so every call is handled exactly once however many plugins
+share the client
+"""
+import contextvars
+import logging
+from time import time
+
+from gator.util import trace
+from gator.util.ratelimit import family
+
+
+__all__ = ('ClientInstrumentation', 'ClientRateLimit', 'THROTTLE_CODES', 'bake_metrics')
+log = logging.getLogger(__name__)
+
+# error codes AWS services use to signal throttling
+THROTTLE_CODES = frozenset((
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'RequestThrottled',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'ProvisionedThroughputExceededException', 'SlowDown',
+    'EC2ThrottledException', 'BandwidthLimitExceeded', 'PriorRequestNotComplete',
+))
+
+# request context key holding (metric name, start time) between before-call and after-call
+_CALL = 'gator_call'
+
+# the metrics plugin of the bake whose coroutine made a call, when bakes share a process
+bake_metrics = contextvars.ContextVar('gator_metrics', default=None)
+
+
+def _error_code(parsed):
+    return (parsed or {}).get('Error', {}).get('Code')
+
+
+class ClientInstrumentation(object):
+    """
+    before-call, needs-retry, after-call and after-call-error handlers reporting, per
+    operation under gator.cloud.<service>.client.<operation>: duration (all attempts),
+    count, error, retries and throttles, and a 'call' span on the bake timeline. Metrics
+    go to the calling bake's metrics plugin (bake_metrics) when set, otherwise to
+    metrics, that of the bake the client was created for
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+
+    def register(self, client):
+        events = client.meta.events
+        # unique ids keep registration idempotent per client. The timer starts ahead of
+        # any before-call handler that answers the call itself, such as a Stubber
+        events.register_first('before-call.*.*', self._before_call, unique_id='gator-before-call')
+        events.register('needs-retry', self._needs_retry, unique_id='gator-needs-retry')
+        events.register('after-call', self._after_call, unique_id='gator-after-call')
+        events.register('after-call-error', self._after_call_error, unique_id='gator-after-call-error')
+
+    @staticmethod
+    def _metric_name(model):
+        from botocore import xform_name
+        return 'gator.cloud.{0}.client.{1}'.format(model.service_model.service_name, xform_name(model.name))
+
+    def _before_call(self, model, context, **kwargs):
+        context[_CALL] = (self._metric_name(model), time())
+
+    def _metrics(self):
+        metrics = bake_metrics.get()
+        return self.metrics if metrics is None else metrics
+
+    def _needs_retry(self, response, operation, attempts, caught_exception=None, **kwargs):
+        # seen after every attempt; only observes, leaving the decision to the retry handler
+        metrics = self._metrics()
+        if response is not None and _error_code(response[1]) in THROTTLE_CODES and metrics is not None:
+            metrics.increment('{0}.throttles'.format(self._metric_name(operation)))
+        return None
+
+    def _finish(self, context, error, retries):
+        call = context.pop(_CALL, None)
+        if call is None:
+            return
+        metric_name, start = call
+        end = time()
+        timeline = trace.active()
+        if timeline is not None:
+            timeline.add(metric_name, 'call', start, end, retries=retries, error=error)
+        metrics = self._metrics()
+        if metrics is None:
+            return
+        metrics.timer('{0}.duration'.format(metric_name), end - start)
+        metrics.increment('{0}.{1}'.format(metric_name, 'error' if error else 'count'))
+        if retries:
+            metrics.increment('{0}.retries'.format(metric_name), retries)
+
+    def _after_call(self, http_response, parsed, context, **kwargs):
+        # also emitted for error responses, just before the client raises them
+        retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        self._finish(context, _error_code(parsed) if http_response.status_code >= 300 else None, retries)
+
+    def _after_call_error(self, exception, context, **kwargs):
+        # the request itself failed, after any retries
+        self._finish(context, type(exception).__name__, None)
+
+
+class ClientRateLimit(object):
+    """
+    before-send and needs-retry handlers putting every attempt of a client's calls,
+    retries included, through a RateLimiter, and pausing an operation's family when
+    the service throttles it
+    """
+    def __init__(self, limiter):
+        self._limiter = limiter
+
+    def register(self, client):
+        events = client.meta.events
+        events.register('before-send', self._before_send, unique_id='gator-rate-limit')
+        events.register('needs-retry', self._needs_retry, unique_id='gator-rate-limit-throttled')
+
+    def _before_send(self, event_name, **kwargs):
+        from botocore import xform_name
+        self._limiter.acquire(family(xform_name(event_name.rsplit('.', 1)[-1])))
+
+    def _needs_retry(self, response, operation, **kwargs):
+        if response is not None and _error_code(response[1]) in THROTTLE_CODES:
+            from botocore import xform_name
+            self._limiter.throttled(family(xform_name(operation.name)))
+        return None
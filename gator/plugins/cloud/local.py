@@ -0,0 +1,305 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.local
+=========================
+Local stand-in cloud: volumes and snapshots are sparse image files, attachment is a
+loop device and images are registered into a catalog directory. Lets the whole bake
+pipeline run, and be profiled, on a plain Linux box. Pair it with the loop blockdevice.
+
+Catalog layout under the plugin's root:
+
+    images/<ami id>.json
+    snapshots/<snapshot id>.img, snapshots/<snapshot id>.json
+    volumes/<volume id>.img
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from glob import glob
+from time import sleep
+
+from bunch import Bunch
+
+from gator.config import conf_action
+from gator.exceptions import FinalizerException, VolumeException
+from gator.plugins.cloud.base import BaseCloudPlugin
+from gator.util.linux import mkdir_p, monitor_command, os_node_exists
+from gator.util.trace import WAIT, span
+
+
+__all__ = ('LocalCloudPlugin', 'import_image')
+log = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+def _new_id(prefix):
+    return '{0}-local{1}'.format(prefix, uuid.uuid4().hex[:12])
+
+
+def _read_json(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def _write_json(filename, data):
+    tmp_filename = '{0}.tmp'.format(filename)
+    with open(tmp_filename, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_filename, filename)
+
+
+def _copy_image(src, dst):
+    """ reflink where the filesystem supports it, otherwise a sparse copy """
+    result = monitor_command(['cp', '--reflink=auto', '--sparse=always', src, dst])
+    if not result.success:
+        raise VolumeException('Copying {0} to {1} failed: {2}'.format(src, dst, result.result.std_err))
+
+
+def _image_record(image):
+    record = Bunch(image)
+    record.tags = dict(image.get('tags', {}))
+    return record
+
+
+def import_image(root, image_file, name, architecture='x86_64', root_device_name='/dev/sda1', virtualization_type='hvm'):
+    """
+    Seed the catalog with a base image built from a raw, unpartitioned filesystem image.
+    Returns the new image record
+    """
+    for subdir in ('images', 'snapshots', 'volumes'):
+        mkdir_p(os.path.join(root, subdir))
+    snapshot_id = _new_id('snap')
+    _copy_image(image_file, os.path.join(root, 'snapshots', '{0}.img'.format(snapshot_id)))
+    size = -(-os.path.getsize(image_file) // GB)
+    _write_json(os.path.join(root, 'snapshots', '{0}.json'.format(snapshot_id)),
+                {'id': snapshot_id, 'volume_size': size, 'description': 'imported from {0}'.format(image_file), 'tags': {}})
+    image = {
+        'id': _new_id('ami'),
+        'name': name,
+        'description': 'imported from {0}'.format(image_file),
+        'architecture': architecture,
+        'virtualization_type': virtualization_type,
+        'root_device_name': root_device_name,
+        'snapshot_id': snapshot_id,
+        'size': size,
+        'kernel_id': None,
+        'ramdisk_id': None,
+        'creation_date': '{0:%Y-%m-%dT%H:%M:%S.000Z}'.format(datetime.utcnow()),
+        'tags': {},
+    }
+    _write_json(os.path.join(root, 'images', '{0}.json'.format(image['id'])), image)
+    log.info('Imported {0} as {1} ({2})'.format(image_file, image['name'], image['id']))
+    return _image_record(image)
+
+
+class LocalCloudPlugin(BaseCloudPlugin):
+    _name = 'local'
+
+    def add_plugin_args(self, *args, **kwargs):
+        context = self._config.context
+        base_ami = self._parser.add_argument_group(
+            title='Base AMI', description='EITHER AMI id OR name, not both!')
+        base_ami_mutex = base_ami.add_mutually_exclusive_group(required=True)
+        base_ami_mutex.add_argument(
+            '-b', '--base-ami-name', dest='base_ami_name',
+            action=conf_action(config=context.ami),
+            help='The name of the base image in the local catalog. The newest image of that name is used')
+        base_ami_mutex.add_argument(
+            '-B', '--base-ami-id', dest='base_ami_id',
+            action=conf_action(config=context.ami),
+            help='The id of the base image in the local catalog')
+        cloud = self._parser.add_argument_group(
+            title='Local cloud options', description='Local stand-in cloud backed by image files')
+        cloud.add_argument(
+            '--local-cloud-root', dest='local_cloud_root',
+            action=conf_action(config=context.cloud),
+            help='Catalog directory for images, snapshots and volumes')
+        cloud.add_argument(
+            '--root-volume-size', dest='root_volume_size',
+            action=conf_action(config=context.ami),
+            help='Root volume size (in GB). The default is to inherit from the base image.')
+
+    @property
+    def root(self):
+        return self._config.context.cloud.get('local_cloud_root', self.plugin_config.get('root', '/var/gator/local-cloud'))
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _latency(self, operation):
+        """ injected delay standing in for cloud API and state-transition latency """
+        delay = float(self.plugin_config.get('latency', {}).get(operation, 0) or 0)
+        if delay:
+            with span('latency {0}'.format(operation), WAIT, delay=delay):
+                sleep(delay)
+
+    def connect(self):
+        if self._connection:
+            log.debug('Already connected to the local cloud')
+            return
+        for subdir in ('images', 'snapshots', 'volumes'):
+            mkdir_p(self._path(subdir))
+        self._connection = self.root
+        log.info('Gatoring in local cloud {0}'.format(self.root))
+
+    def _resolve_baseami(self):
+        log.info('Resolving base AMI')
+        context = self._config.context
+        cloud_config = self.plugin_config
+        ami_name = context.ami.get('base_ami_name', cloud_config.get('base_ami_name', None))
+        ami_id = context.ami.get('base_ami_id', cloud_config.get('base_ami_id', None))
+        if ami_id:
+            filename = self._path('images', '{0}.json'.format(ami_id))
+            if not os.path.isfile(filename):
+                raise RuntimeError('Could not locate base AMI with identifier: {0}'.format(ami_id))
+            image = _read_json(filename)
+        elif ami_name:
+            images = [_read_json(filename) for filename in glob(self._path('images', '*.json'))]
+            images = [image for image in images if image['name'] == ami_name]
+            if not images:
+                raise RuntimeError('Could not locate base AMI with identifier: {0}'.format(ami_name))
+            image = max(images, key=lambda image: image['creation_date'])
+        else:
+            raise RuntimeError('Must configure or provide either a base ami name or id')
+        context['base_ami'] = _image_record(image)
+        log.info('Successfully resolved {0.name}({0.id})'.format(context.base_ami))
+
+    def allocate_base_volume(self, tag=True):
+        context = self._config.context
+        base_ami = context.base_ami
+        volume_size = context.ami.get('root_volume_size', None) or self.plugin_config.get('root_volume_size', None) or base_ami.size
+        volume_size = int(volume_size)
+        if volume_size < base_ami.size:
+            raise VolumeException(
+                'root_volume_size ({}) must be at least as large as the root '
+                'volume of the base AMI ({})'.format(volume_size, base_ami.size))
+        self._volume = Bunch(id=_new_id('vol'), size=volume_size)
+        self._volume.path = self._path('volumes', '{0}.img'.format(self._volume.id))
+        self._latency('create_volume')
+        _copy_image(self._path('snapshots', '{0}.img'.format(base_ami.snapshot_id)), self._volume.path)
+        if volume_size * GB > os.path.getsize(self._volume.path):
+            os.truncate(self._volume.path, volume_size * GB)
+        log.debug('Volume {0} created'.format(self._volume.id))
+
+    def attach_volume(self, blockdevice, tag=True):
+        self.allocate_base_volume(tag=tag)
+        log.debug('Attaching volume {0} to {1}'.format(self._volume.id, blockdevice))
+        self._latency('attach_volume')
+        result = monitor_command(['losetup', blockdevice, self._volume.path])
+        if not result.success or not self.is_volume_attached(blockdevice):
+            raise VolumeException('Attaching {0} to {1} failed: {2}'.format(self._volume.id, blockdevice, result.result.std_err))
+        self._blockdevice = blockdevice
+        log.debug('Volume {0} attached to {1}'.format(self._volume.id, blockdevice))
+
+    def is_volume_attached(self, blockdevice):
+        backing_file = '/sys/block/{0}/loop/backing_file'.format(os.path.basename(blockdevice))
+        if not os_node_exists(blockdevice) or not os.path.isfile(backing_file):
+            return False
+        with open(backing_file) as f:
+            return f.read().strip() == os.path.realpath(self._volume.path)
+
+    def detach_volume(self, blockdevice):
+        log.debug('Detaching volume {0} from {1}'.format(self._volume.id, blockdevice))
+        self._latency('detach_volume')
+        result = monitor_command(['losetup', '-d', blockdevice])
+        if not result.success:
+            raise VolumeException('Detaching {0} from {1} failed: {2}'.format(self._volume.id, blockdevice, result.result.std_err))
+
+    def delete_volume(self):
+        log.debug('Deleting volume {0}'.format(self._volume.id))
+        if os.path.exists(self._volume.path):
+            os.remove(self._volume.path)
+        return True
+
+    def snapshot_volume(self, description=None):
+        context = self._config.context
+        if not description:
+            description = context.snapshot.get('description', '')
+        snapshot_id = _new_id('snap')
+        log.debug('Creating snapshot {0} with description {1}'.format(snapshot_id, description))
+        self._latency('snapshot_volume')
+        _copy_image(self._volume.path, self._path('snapshots', '{0}.img'.format(snapshot_id)))
+        self._snapshot = Bunch(id=snapshot_id, volume_size=self._volume.size, description=description, tags={})
+        _write_json(self._path('snapshots', '{0}.json'.format(snapshot_id)), dict(self._snapshot))
+        log.debug('Snapshot complete. id: {0}'.format(snapshot_id))
+        return True
+
+    def is_stale_attachment(self, dev, prefix):
+        return False
+
+    def attached_block_devices(self, prefix):
+        return {}
+
+    def register_image(self, *args, **kwargs):
+        context = self._config.context
+        if 'manifest' in kwargs:
+            log.critical('The local cloud only registers snapshot-backed images')
+            return False
+        block_device_map, root_block_device = args[:2]
+        self._latency('register_image')
+        image = {
+            'id': _new_id('ami'),
+            'name': context.ami.name,
+            'description': context.ami.description,
+            'architecture': context.ami.get('architecture', context.base_ami.architecture),
+            'virtualization_type': context.ami.get('vm_type', context.base_ami.virtualization_type),
+            'root_device_name': root_block_device,
+            'snapshot_id': self._snapshot.id,
+            'size': self._snapshot.volume_size,
+            'kernel_id': context.base_ami.get('kernel_id'),
+            'ramdisk_id': context.base_ami.get('ramdisk_id'),
+            'creation_date': '{0:%Y-%m-%dT%H:%M:%S.000Z}'.format(datetime.utcnow()),
+            'tags': {},
+        }
+        _write_json(self._path('images', '{0}.json'.format(image['id'])), image)
+        self._ami = _image_record(image)
+        context.ami.image = self._ami
+        log.info('AMI registered: {0} {1}'.format(self._ami.id, self._ami.name))
+        return True
+
+    def add_tags(self, *resource_types):
+        context = self._config.context
+        for resource_type in resource_types:
+            tags = context[resource_type].get('tags', None)
+            if not tags:
+                log.critical('Unable to locate tags for {0}'.format(resource_type))
+                return False
+            resource = getattr(self, '_' + resource_type, None)
+            if resource is None:
+                raise FinalizerException('Tagging failed: no {0} to tag'.format(resource_type))
+            directory = 'images' if resource_type == 'ami' else 'snapshots'
+            filename = self._path(directory, '{0}.json'.format(resource.id))
+            record = _read_json(filename)
+            record.setdefault('tags', {}).update(tags)
+            _write_json(filename, record)
+            resource.tags.update(tags)
+            log.debug('Successfully tagged {0}({1})'.format(resource_type, resource.id))
+        return True
+
+    def checkpoint_state(self):
+        state = {}
+        # the volume is deleted when its bake unwinds, so only the snapshot and image are resumable
+        for key, attr in (('snapshot_id', '_snapshot'), ('ami_id', '_ami')):
+            resource = getattr(self, attr, None)
+            if resource is not None:
+                state[key] = resource.id
+        return state
+
+    def restore(self, state):
+        if state.get('snapshot_id'):
+            self._snapshot = Bunch(_read_json(self._path('snapshots', '{0}.json'.format(state['snapshot_id']))))
+        if state.get('ami_id'):
+            self._ami = _image_record(_read_json(self._path('images', '{0}.json'.format(state['ami_id']))))
+            self._config.context.ami.image = self._ami
+
+    def resolve_base_ami(self):
+        self.connect()
+        self._resolve_baseami()
@@ -0,0 +1,145 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.state_poller
+================================
+Shared poller for in-flight EC2 volumes, snapshots and images: one describe call per
+resource kind covers every pending wait in the process. Bakes in forked workers (gator
+serve, batch and bench) each have their own poller
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+from time import time
+
+from gator.util.polling import Schedule
+from gator.util.trace import WAIT, span
+
+
+__all__ = ('StatePoller',)
+log = logging.getLogger(__name__)
+
+
+class _Waiter(object):
+    def __init__(self, kind, resource_id, check, describe, schedule):
+        self.kind = kind
+        self.resource_id = resource_id
+        self.check = check
+        self.describe = describe
+        # the watching bake's context (metrics, timeline), in which its describe calls run
+        self.context = contextvars.copy_context()
+        self.schedule = schedule
+        self.future = Future()
+        self.due = time()
+
+
+class StatePoller(object):
+    """
+    Background thread polling every pending wait in a region. Each wait keeps its own
+    adaptive Schedule and brings its own describe(kind, resource_ids), which returns id ->
+    record for the resources visible so far; whenever a wait is due, all pending
+    resources of its kind are described in a single call to the due wait's describe, in
+    the context it was watched from. A describe failure is retried on the next poll when
+    retryable(exception) says so and otherwise fails every wait of the call. The thread
+    exits when nothing is pending and starts again with the next wait.
+    """
+    def __init__(self, history=None, timeout=3600, min_interval=0.5, max_interval=15, retryable=None):
+        self._history = history
+        self._retryable = retryable or (lambda exception: True)
+        self._timeout = float(timeout)
+        self._min_interval = float(min_interval)
+        self._max_interval = float(max_interval)
+        self._waiters = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def watch(self, kind, resource_id, check, operation, describe, size=None, timeout=None):
+        """
+        Future resolved with the resource's latest record once check(record) returns
+        (True, progress), or with None on timeout. check gets None while the resource is
+        not visible yet; anything it raises fails the future
+        """
+        schedule = Schedule(operation, self._history, size, timeout or self._timeout, self._min_interval, self._max_interval)
+        waiter = _Waiter(kind, resource_id, check, describe, schedule)
+        with self._cond:
+            self._waiters.append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='gator-state-poller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        return waiter.future
+
+    def wait(self, kind, resource_id, check, operation, describe, size=None, timeout=None):
+        """ block on watch(); returns the record, None on timeout """
+        future = self.watch(kind, resource_id, check, operation, describe, size=size, timeout=timeout)
+        with span('poll {0}'.format(operation), WAIT, resource=resource_id):
+            return future.result()
+
+    def _finish(self, waiter, record=None, exception=None):
+        with self._cond:
+            self._waiters.remove(waiter)
+        try:
+            if exception is not None:
+                waiter.future.set_exception(exception)
+            else:
+                waiter.future.set_result(record)
+        except InvalidStateError:
+            # the watcher gave up on it, as cancelled coroutines do
+            log.debug('{0} {1} is no longer watched'.format(waiter.kind, waiter.resource_id))
+
+    def _reschedule(self, waiter, progress=None):
+        delay = waiter.schedule.next_delay(progress)
+        if delay is None:
+            self._finish(waiter)
+        else:
+            waiter.due = time() + delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._waiters:
+                        self._thread = None
+                        return
+                    now = time()
+                    due = min(waiter.due for waiter in self._waiters)
+                    if due <= now:
+                        break
+                    self._cond.wait(due - now)
+                pending = list(self._waiters)
+            for kind in set(waiter.kind for waiter in pending if waiter.due <= now):
+                # every pending wait of this kind rides along, due or not
+                waiters = [waiter for waiter in pending if waiter.kind == kind]
+                resource_ids = sorted(set(waiter.resource_id for waiter in waiters))
+                caller = next(waiter for waiter in waiters if waiter.due <= now)
+                try:
+                    records = caller.context.run(caller.describe, kind, resource_ids)
+                except Exception as e:
+                    if not self._retryable(e):
+                        log.debug('Describing {0}s {1} failed'.format(kind, ', '.join(resource_ids)), exc_info=True)
+                        for waiter in waiters:
+                            self._finish(waiter, exception=e)
+                        continue
+                    log.debug('Describing {0}s {1} failed, retrying'.format(kind, ', '.join(resource_ids)), exc_info=True)
+                    for waiter in waiters:
+                        self._reschedule(waiter)
+                    continue
+                log.debug('Polled {0} {1}(s) in one call'.format(len(resource_ids), kind))
+                for waiter in waiters:
+                    record = records.get(waiter.resource_id)
+                    try:
+                        done, progress = waiter.check(record)
+                    except Exception as e:
+                        self._finish(waiter, exception=e)
+                        continue
+                    if done:
+                        waiter.schedule.done()
+                        self._finish(waiter, record=record)
+                    else:
+                        self._reschedule(waiter, progress)
@@ -0,0 +1,119 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.plugins.cloud.volume_pool
+===============================
+Pool of ready-to-attach EBS volumes created from base AMI snapshots
+"""
+import logging
+import threading
+
+from gator.util.linux import flock
+
+
+__all__ = ('VolumePool',)
+log = logging.getLogger(__name__)
+
+
+def _filters(filters):
+    return [{'Name': name, 'Values': values if isinstance(values, list) else [values]} for name, values in filters.items()]
+
+
+def _tags(volume):
+    return dict((tag['Key'], tag['Value']) for tag in volume.get('Tags', []))
+
+
+def _tag_list(tags):
+    return [{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+
+
+class VolumePool(object):
+    """
+    Keeps up to `size` available volumes per (base AMI, volume type, size, zone). Pooled
+    volumes carry a gator-pool tag holding their key and status=pooled; taking one retags it
+    status=busy. Tags are eventually consistent, so they only suggest which volumes to try:
+    the claim itself is attaching the volume, which EC2 grants to one instance only. Claims
+    are also serialized per host with a lock file.
+    """
+    POOL_TAG = 'gator-pool'
+
+    def __init__(self, api, size=2, lock_file=None, purpose='amination'):
+        # api(operation, **params) makes one EC2 API call
+        self._api = api
+        self._size = int(size)
+        self._lock_file = lock_file
+        self._purpose = purpose
+        self._refills = []
+
+    @staticmethod
+    def key(base_ami, volume_type, volume_size, zone):
+        return '{0}:{1}:{2}:{3}'.format(base_ami.id, volume_type, volume_size, zone)
+
+    def _pooled(self, key, states=('available',)):
+        filters = {'tag:{0}'.format(self.POOL_TAG): key, 'tag:status': 'pooled', 'status': list(states)}
+        return self._api('describe_volumes', Filters=_filters(filters))['Volumes']
+
+    def take(self, base_ami, volume_type, volume_size, zone, claim):
+        """
+        claim an available pooled volume, returns its id or None. claim(volume_id) attaches
+        the volume, returning False when EC2 refused because another builder got it first
+        """
+        key = self.key(base_ami, volume_type, volume_size, zone)
+        with flock(self._lock_file):
+            for volume in self._pooled(key):
+                volume_id = volume['VolumeId']
+                if not claim(volume_id):
+                    log.debug('Volume {0} was claimed by another builder'.format(volume_id))
+                    continue
+                self._api('create_tags', Resources=[volume_id], Tags=_tag_list({'status': 'busy'}))
+                log.info('Took volume {0} from pool {1}'.format(volume_id, key))
+                return volume_id
+        log.info('Volume pool {0} is empty'.format(key))
+        return None
+
+    def expire(self, base_ami):
+        """ delete pooled volumes made from an older image that carried the same name """
+        filters = {'tag:{0}'.format(self.POOL_TAG): '*', 'tag:status': 'pooled', 'tag:ami-name': base_ami.name}
+        for volume in self._api('describe_volumes', Filters=_filters(filters))['Volumes']:
+            tags = _tags(volume)
+            if tags.get('ami') != base_ami.id and volume['State'] == 'available':
+                log.info('Expiring pooled volume {0} from superseded base AMI {1}'.format(volume['VolumeId'], tags.get('ami')))
+                self._api('delete_volume', VolumeId=volume['VolumeId'])
+
+    def refill(self, base_ami, volume_type, volume_size, zone, snapshot_id):
+        """ top the pool back up in the background. create_volume returns immediately, so
+        refilling costs a few API calls and never waits on volume availability """
+        refill = threading.Thread(target=self._refill, name='gator-volume-pool',
+                                  args=(base_ami, volume_type, volume_size, zone, snapshot_id))
+        refill.daemon = True
+        refill.start()
+        self._refills.append(refill)
+
+    def _refill(self, base_ami, volume_type, volume_size, zone, snapshot_id):
+        key = self.key(base_ami, volume_type, volume_size, zone)
+        try:
+            with flock(self._lock_file):
+                missing = self._size - len(self._pooled(key, states=('creating', 'available')))
+                for _ in range(missing):
+                    volume_id = self._api('create_volume', Size=volume_size, AvailabilityZone=zone,
+                                          VolumeType=volume_type, SnapshotId=snapshot_id,
+                                          TagSpecifications=[{'ResourceType': 'volume', 'Tags': _tag_list({
+                                              self.POOL_TAG: key,
+                                              'purpose': self._purpose,
+                                              'status': 'pooled',
+                                              'ami': base_ami.id,
+                                              'ami-name': base_ami.name,
+                                              'arch': base_ami.architecture,
+                                          })}])['VolumeId']
+                    log.debug('Added volume {0} to pool {1}'.format(volume_id, key))
+        except Exception:
+            log.warning('Refilling volume pool {0} failed'.format(key), exc_info=True)
+
+    def join(self):
+        for refill in self._refills:
+            refill.join()
+        self._refills = []
@@ -35,6 +35,7 @@ class TaggingBaseFinalizerPlugin(BaseFinalizerPlugin):
         tagging.add_argument('--enhanced-networking', dest='enhanced_networking', action=conf_action(context.ami, action='store_true'), help='enable enhanced networking (SR-IOV)')
         tagging.add_argument('--ena-networking', dest='ena_networking', action=conf_action(context.ami, action='store_true'), help='enable elastic network adapter support (ENA)')
         tagging.add_argument('--arch', dest='architecture', choices=["i386", "x86_64"], action=conf_action(context.ami), help='architecture to register image as')
+        tagging.add_argument('--replicate-regions', dest='replicate_regions', action=conf_action(context.ami), help='comma separated regions to copy the registered image to')
         return tagging
 
     def _set_metadata(self):
@@ -57,6 +58,8 @@ class TaggingBaseFinalizerPlugin(BaseFinalizerPlugin):
             suffix = config.suffix_format.format(datetime.utcnow())
 
         metadata['suffix'] = suffix
+        # kept so a resumed bake regenerates the same AMI name
+        context.ami.suffix = suffix
 
         for tag in config.tag_formats:
             try:
@@ -75,26 +78,56 @@ class TaggingBaseFinalizerPlugin(BaseFinalizerPlugin):
         context.ami.description = description
         context.snapshot.description = description
 
+    def _stamp_creation_time(self):
+        """ set the AMI's creation_time tag before registration, which tags the image; a
+        resumed bake keeps the one its registered image carries """
+        context = self._config.context
+        if 'creation_time' in context.ami.tags:
+            return
+        image = context.ami.get('image', None)
+        creation_time = image.tags.get('creation_time') if image is not None else None
+        context.ami.tags.creation_time = creation_time or '{0:%F %T UTC}'.format(datetime.utcnow())
+
     def _add_tags(self, resources):
+        self._stamp_creation_time()
+        try:
+            self._cloud.add_tags(*resources)
+        except FinalizerException:
+            errstr = 'Error adding tags to {0}'.format(', '.join(resources))
+            log.error(errstr)
+            log.debug(errstr, exc_info=True)
+            return False
+        log.info('Successfully tagged {0}'.format(', '.join(resources)))
+        return True
+
+    def _replicate_image(self):
         context = self._config.context
-        context.ami.tags.creation_time = '{0:%F %T UTC}'.format(datetime.utcnow())
-        for resource in resources:
-            try:
-                self._cloud.add_tags(resource)
-            except FinalizerException:
-                errstr = 'Error adding tags to {0}'.format(resource)
-                log.error(errstr)
-                log.debug(errstr, exc_info=True)
-                return False
-            log.info('Successfully tagged {0}'.format(resource))
-        log.info('Successfully tagged objects')
+        checkpoint = self._config.checkpoint
+        config = self._config.plugins[self.full_name]
+        regions = context.ami.get('replicate_regions', config.get('replicate_regions', []))
+        if isinstance(regions, str):
+            regions = [region.strip() for region in regions.split(',') if region.strip()]
+        if not regions:
+            return True
+        if checkpoint.done('replicate'):
+            context.ami.replicas = checkpoint.state['replicas']
+            log.info('Image already replicated, skipping')
+            return True
+        log.info('Replicating image to {0}'.format(', '.join(regions)))
+        replicas = self._cloud.replicate_image(regions)
+        if not replicas:
+            return False
+        context.ami.replicas = replicas
+        checkpoint.record('replicate', replicas=replicas)
+        for region, image_id in sorted(replicas.items()):
+            log.info('Replica {0}: {1}'.format(region, image_id))
         return True
 
     def _log_ami_metadata(self):
         context = self._config.context
         for attr in ('id', 'name', 'description', 'kernel_id', 'ramdisk_id', 'virtualization_type',):
             log.info('{0}: {1}'.format(attr, getattr(context.ami.image, attr)))
-        for tag_name, tag_value in context.ami.image.tags.iteritems():
+        for tag_name, tag_value in context.ami.image.tags.items():
             log.info('Tag {0} = {1}'.format(tag_name, tag_value))
 
     @abc.abstractmethod
@@ -15,6 +15,7 @@ from os import environ
 from gator.config import conf_action
 from gator.plugins.finalizer.tagging_base import TaggingBaseFinalizerPlugin
 from gator.util.linux import sanitize_metadata
+from gator.util.metrics import timer
 
 
 __all__ = ('TaggingEBSFinalizerPlugin',)
@@ -41,6 +42,7 @@ class TaggingEBSFinalizerPlugin(TaggingBaseFinalizerPlugin):
 
         context.ami.name = sanitize_metadata('{0}-ebs'.format(ami_name))
 
+    @timer("gator.finalizer.tagging_ebs.snapshot_volume.duration")
     def _snapshot_volume(self):
         log.info('Taking a snapshot of the target volume')
         if not self._cloud.snapshot_volume():
@@ -48,6 +50,7 @@ class TaggingEBSFinalizerPlugin(TaggingBaseFinalizerPlugin):
         log.info('Snapshot success')
         return True
 
+    @timer("gator.finalizer.tagging_ebs.register_image.duration")
     def _register_image(self, block_device_map=None, root_device=None):
         log.info('Registering image')
         config = self._config.plugins[self.full_name]
@@ -55,6 +58,7 @@ class TaggingEBSFinalizerPlugin(TaggingBaseFinalizerPlugin):
             block_device_map = config.default_block_device_map
         if root_device is None:
             root_device = config.default_root_device
+        self._stamp_creation_time()
         if not self._cloud.register_image(block_device_map, root_device):
             return False
         log.info('Registration success')
@@ -62,20 +66,38 @@ class TaggingEBSFinalizerPlugin(TaggingBaseFinalizerPlugin):
 
     def finalize(self):
         log.info('Finalizing image')
+        context = self._config.context
+        checkpoint = self._config.checkpoint
         self._set_metadata()
-
-        if not self._snapshot_volume():
+        if checkpoint.done('snapshot') and checkpoint.state.get('ami_name'):
+            # the name the snapshot was tagged under; deriving it again may not match, e.g. if the
+            # base AMI's tags changed since
+            context.ami.name = checkpoint.state['ami_name']
+
+        if checkpoint.done('snapshot'):
+            log.info('Snapshot {0} already taken, skipping'.format(checkpoint.state['snapshot_id']))
+        elif not self._snapshot_volume():
             log.critical('Error snapshotting volume')
             return False
+        else:
+            checkpoint.record('snapshot', ami_name=context.ami.name, suffix=context.ami.suffix, **self._cloud.checkpoint_state())
 
-        if not self._register_image():
+        if checkpoint.done('register'):
+            log.info('Image {0} already registered, skipping'.format(checkpoint.state['ami_id']))
+        elif not self._register_image():
             log.critical('Error registering image')
             return False
+        else:
+            checkpoint.record('register', **self._cloud.checkpoint_state())
 
         if not self._add_tags(['snapshot', 'ami']):
             log.critical('Error adding tags')
             return False
 
+        if not self._replicate_image():
+            log.critical('Error replicating image')
+            return False
+
         log.info('Image registered and tagged')
         self._log_ami_metadata()
         return True
@@ -118,10 +118,10 @@ class TaggingS3FinalizerPlugin(TaggingBaseFinalizerPlugin):
     def _upload_bundle(self):
         context = self._config.context
 
-        provider = self._cloud._connection.provider
-        ak = provider.get_access_key()
-        sk = provider.get_secret_key()
-        tk = provider.get_security_token()
+        credentials = self._cloud.credentials()
+        ak = credentials.access_key
+        sk = credentials.secret_key
+        tk = credentials.token
 
         cmd = ['ec2-upload-bundle']
         cmd.extend(['-b', context.ami.bucket])
@@ -133,10 +133,13 @@ class TaggingS3FinalizerPlugin(TaggingBaseFinalizerPlugin):
         cmd.extend(['--retry'])
         return monitor_command(cmd)
 
-    def _register_image(self):
-        context = self._config.context
+    def manifest(self):
+        return "{0}/{1}.manifest.xml".format(self._config.context.ami.bucket, self.unique_name())
+
+    def _register_image(self, manifest):
         log.info('Registering image')
-        if not self._cloud.register_image(manifest="{0}/{1}.manifest.xml".format(context.ami.bucket, self.unique_name())):
+        self._stamp_creation_time()
+        if not self._cloud.register_image(manifest=manifest):
             return False
         log.info('Registration success')
         return True
@@ -144,35 +147,50 @@ class TaggingS3FinalizerPlugin(TaggingBaseFinalizerPlugin):
     def finalize(self):
         log.info('Finalizing image')
         context = self._config.context
+        checkpoint = self._config.checkpoint
 
         self._set_metadata()
 
-        ret = self._copy_volume()
-        if not ret.success:
-            log.debug('Error copying volume, failure:{0.command} :{0.std_err}'.format(ret.result))
-            return False
-
-        if context.ami.get('break_copy_volume', False):
-            system("bash")
-
-        ret = self._bundle_image()
-        if not ret.success:
-            log.debug('Error bundling image, failure:{0.command} :{0.std_err}'.format(ret.result))
-            return False
-
-        ret = self._upload_bundle()
-        if not ret.success:
-            log.debug('Error uploading bundled volume, failure:{0.command} :{0.std_err}'.format(ret.result))
-            return False
-
-        if not self._register_image():
+        if checkpoint.done('upload'):
+            # the bundle is in S3 under the name it was uploaded with
+            context.ami.name = checkpoint.state['ami_name']
+            log.info('Bundle {0} already uploaded, skipping'.format(checkpoint.state['manifest']))
+        else:
+            ret = self._copy_volume()
+            if not ret.success:
+                log.debug('Error copying volume, failure:{0.command} :{0.std_err}'.format(ret.result))
+                return False
+
+            if context.ami.get('break_copy_volume', False):
+                system("bash")
+
+            ret = self._bundle_image()
+            if not ret.success:
+                log.debug('Error bundling image, failure:{0.command} :{0.std_err}'.format(ret.result))
+                return False
+
+            ret = self._upload_bundle()
+            if not ret.success:
+                log.debug('Error uploading bundled volume, failure:{0.command} :{0.std_err}'.format(ret.result))
+                return False
+            checkpoint.record('upload', ami_name=context.ami.name, suffix=context.ami.suffix, manifest=self.manifest())
+
+        if checkpoint.done('register'):
+            log.info('Image {0} already registered, skipping'.format(checkpoint.state['ami_id']))
+        elif not self._register_image(checkpoint.state['manifest']):
             log.critical('Error registering image')
             return False
+        else:
+            checkpoint.record('register', **self._cloud.checkpoint_state())
 
         if not self._add_tags(['ami']):
             log.critical('Error adding tags')
             return False
 
+        if not self._replicate_image():
+            log.critical('Error replicating image')
+            return False
+
         log.info('Image registered and tagged')
         self._log_ami_metadata()
         return True
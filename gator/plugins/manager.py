@@ -12,23 +12,24 @@ Base plugin manager(s) and utils
 import abc
 import logging
 
-from stevedore.dispatch import NameDispatchExtensionManager
+from stevedore.named import NamedExtensionManager
 
 
 log = logging.getLogger(__name__)
 
 
-class BasePluginManager(NameDispatchExtensionManager):
+class BasePluginManager(NamedExtensionManager):
     """
-    
+    Loads and instantiates only the named plugins of an entry point. stevedore keeps an
+    on-disk index of installed entry points, so lookups don't rescan every distribution
     """
     __metaclass__ = abc.ABCMeta
     _entry_point = None
     _check_func = None
 
-    def __init__(self, check_func=None, invoke_on_load=True, invoke_args=None, invoke_kwds=None):
+    def __init__(self, names, check_func=None, invoke_on_load=True, invoke_args=None, invoke_kwds=None):
         invoke_args = invoke_args or ()
-        invoke_kwds = invoke_kwds or ()
+        invoke_kwds = invoke_kwds or {}
 
         if self._entry_point is None:
             raise ArithmeticError('Plugin managers must declare their entry point in a class attribute _entry_point')
@@ -37,7 +38,12 @@ class BasePluginManager(NameDispatchExtensionManager):
         if check_func is None:
             check_func = lambda x: True
 
-        super(BasePluginManager, self).__init__(namespace=self.entry_point, check_func=check_func, invoke_on_load=invoke_on_load, invoke_args=invoke_args, invoke_kwds=invoke_kwds)
+        super(BasePluginManager, self).__init__(namespace=self.entry_point, names=names, invoke_on_load=invoke_on_load, invoke_args=invoke_args, invoke_kwds=invoke_kwds)
+        self.extensions = [extension for extension in self.extensions if check_func(extension)]
+
+    @property
+    def by_name(self):
+        return dict((extension.name, extension) for extension in self.extensions)
 
     @property
     def entry_point(self):
@@ -12,13 +12,14 @@ import abc
 import logging
 import os
 import shutil
+import tempfile
 
 from glob import glob
 
 from gator.config import conf_action
 from gator.plugins.base import BasePlugin
 from gator.util import download_file
-from gator.util.linux import Chroot, monitor_command
+from gator.util.linux import Chroot, mkdir_p, monitor_command
 from gator.util.metrics import fails, lapse
 
 __all__ = ('BaseProvisionerPlugin',)
@@ -133,6 +134,38 @@ class BaseProvisionerPlugin(BasePlugin):
                     return False
         return True
 
+    def prefetch(self):
+        """download a remote package to local disk before the chroot exists, so the
+        transfer overlaps cloud and volume setup. _stage_pkg then moves it into place
+        """
+        context = self._config.context
+        if not self._local_install() or not any(protocol in context.package.arg for protocol in ['http://', 'https://']):
+            return True
+        download_dir = os.path.join(self._config.aminator_root, 'downloads')
+        mkdir_p(download_dir)
+        self._prefetch_dir = tempfile.mkdtemp(dir=download_dir)
+        dst_file_path = os.path.join(self._prefetch_dir, os.path.basename(context.package.arg))
+        log.info('prefetching {0}'.format(context.package.arg))
+        try:
+            if not download_file(context.package.arg, dst_file_path, context.package.get('timeout', 1), verify_https=context.get('verify_https', False)):
+                log.critical('failed to download {0}'.format(context.package.arg))
+                return False
+        except Exception:
+            errstr = 'Exception encountered while prefetching package'
+            log.critical(errstr)
+            log.debug(errstr, exc_info=True)
+            return False
+        context.package.arg = dst_file_path
+        return True
+
+    def discard_prefetch(self):
+        """remove the prefetch download directory, along with the package if it was never staged
+        """
+        prefetch_dir, self._prefetch_dir = getattr(self, '_prefetch_dir', None), None
+        if prefetch_dir:
+            log.debug('removing prefetch directory {0}'.format(prefetch_dir))
+            shutil.rmtree(prefetch_dir, ignore_errors=True)
+
     def _local_install(self):
         """True if context.package.arg ends with a package extension
         """
@@ -9,9 +9,12 @@
 """
 import logging
 
+from gator.config import conf_action
+from gator.util.hydrate import Hydrator
 from gator.util.linux import resize2fs, fsck, growpart
 from gator.exceptions import VolumeException
 from gator.plugins.volume.base import BaseVolumePlugin
+from gator.util.metrics import timer
 
 
 __all__ = ('LinuxVolumePlugin',)
@@ -21,6 +24,19 @@ log = logging.getLogger(__name__)
 class LinuxVolumePlugin(BaseVolumePlugin):
     _name = 'linux'
 
+    def __init__(self):
+        super(LinuxVolumePlugin, self).__init__()
+        self._hydrator = None
+
+    def add_plugin_args(self, *args, **kwargs):
+        context = self._config.context
+        volume = self._parser.add_argument_group(title='Volume', description='Provisioning volume options')
+        volume.add_argument(
+            '--hydrate', dest='hydrate', choices=('block', 'background'),
+            action=conf_action(config=context.volume),
+            help='Read the volume ahead after attaching it, before provisioning (block) or alongside it (background)')
+
+    @timer("gator.volume.linux.attach.duration")
     def _attach(self, blockdevice):
         with blockdevice(self._cloud) as dev:
             self._dev = dev
@@ -31,9 +47,23 @@ class LinuxVolumePlugin(BaseVolumePlugin):
                 self.context.volume['dev'] = self._dev
             self._cloud.attach_volume(self._dev)
 
+    def _hydrate(self):
+        hydrate_config = self.plugin_config.get('hydrate', {})
+        mode = self.context.volume.get('hydrate', hydrate_config.get('mode', None))
+        if not mode:
+            return
+        self._hydrator = Hydrator(self.context.volume.dev, workers=hydrate_config.get('workers', 32),
+                                  chunk_size=hydrate_config.get('chunk_size', 1048576), full=hydrate_config.get('full', False),
+                                  metrics=self._config.metrics, metric_prefix='gator.volume.linux.hydrate')
+        if mode == 'background':
+            self._hydrator.start()
+        else:
+            self._hydrator.run()
+
     def _detach(self):
         self._cloud.detach_volume(self._dev)
 
+    @timer("gator.volume.linux.resize.duration")
     def _resize(self):
         log.info('Checking and repairing root volume as necessary')
         fsck_op = fsck(self.context.volume.dev)
@@ -59,6 +89,7 @@ class LinuxVolumePlugin(BaseVolumePlugin):
 
     def __enter__(self):
         self._attach(self._blockdevice)
+        self._hydrate()
         if self.plugin_config.get('resize_volume', False):
             self._resize()
         return self
@@ -67,6 +98,8 @@ class LinuxVolumePlugin(BaseVolumePlugin):
         if exc_type:
             log.debug('Exception encountered in linux volume plugin context manager',
                       exc_info=(exc_type, exc_value, trace))
+        if self._hydrator is not None:
+            self._hydrator.stop()
         if exc_type and self._config.context.get("preserve_on_error", False):
             return False
         self._detach()
@@ -0,0 +1,139 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.stages
+============
+Dependency-aware execution of bake stages. Independent stages run concurrently on a
+thread pool; context stages are unwound in reverse entry order, exactly as nested
+with blocks would be.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from gator.util.trace import span
+
+
+__all__ = ('Stage', 'StageGraph')
+log = logging.getLogger(__name__)
+
+
+class Stage(object):
+    """
+    A unit of pipeline work. func is called with the results of the stages it requires as
+    keyword arguments. Context stages return a context manager that is entered, and exited
+    when the graph unwinds or a later stage releases it. Checked stages stop the pipeline
+    by returning a falsy value.
+    """
+    def __init__(self, name, func, requires=(), context=False, releases=(), check=False):
+        self.name = name
+        self.func = func
+        self.releases = tuple(releases)
+        self.requires = tuple(requires) + tuple(dep for dep in self.releases if dep not in requires)
+        self.context = context
+        self.check = check
+
+    def __repr__(self):
+        return 'Stage({0})'.format(self.name)
+
+
+class StageGraph(object):
+    """
+    Stages must be added after the stages they require, which keeps the graph acyclic
+    """
+    def __init__(self, workers=4):
+        self._stages = OrderedDict()
+        self._workers = workers
+        self._entered = []
+        self._lock = threading.Lock()
+        self.results = {}
+
+    def add(self, name, func, **kwargs):
+        if name in self._stages:
+            raise ValueError('Duplicate stage {0}'.format(name))
+        stage = Stage(name, func, **kwargs)
+        for dep in stage.requires:
+            if dep not in self._stages:
+                raise ValueError('Stage {0} requires unknown stage {1}'.format(name, dep))
+        for dep in stage.releases:
+            if not self._stages[dep].context:
+                raise ValueError('Stage {0} releases {1}, which is not a context stage'.format(name, dep))
+        self._stages[name] = stage
+        return stage
+
+    def run(self):
+        """
+        Run every stage. Returns False if a checked stage failed; exceptions propagate
+        once running stages have finished and entered contexts have been unwound.
+        """
+        pending = list(self._stages.values())
+        running = {}
+        failed = False
+        exc_info = None
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='gator-stage') as pool:
+            while True:
+                if not failed and exc_info is None:
+                    for stage in [s for s in pending if all(dep in self.results for dep in s.requires)]:
+                        pending.remove(stage)
+                        running[pool.submit(self._run_stage, stage)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        self.results[stage.name] = result = future.result()
+                    except Exception:
+                        log.debug('Stage {0} raised'.format(stage.name), exc_info=True)
+                        exc_info = exc_info or sys.exc_info()
+                        continue
+                    if stage.check and not result:
+                        log.debug('Stage {0} failed, not starting further stages'.format(stage.name))
+                        failed = True
+        self._unwind(exc_info)
+        return not failed
+
+    def _run_stage(self, stage):
+        inputs = dict((dep, self.results[dep]) for dep in stage.requires)
+        for name in stage.releases:
+            self._release(name)
+        log.debug('Stage {0} starting'.format(stage.name))
+        with span(stage.name, 'stage', requires=list(stage.requires)):
+            result = stage.func(**inputs)
+            if stage.context:
+                manager = result
+                result = manager.__enter__()
+                with self._lock:
+                    self._entered.append((stage.name, manager))
+        log.debug('Stage {0} complete'.format(stage.name))
+        return result
+
+    def _release(self, name):
+        with self._lock:
+            entered = [entry for entry in self._entered if entry[0] == name]
+            if not entered:
+                return
+            self._entered.remove(entered[0])
+        log.debug('Releasing stage {0}'.format(name))
+        with span('{0} exit'.format(name), 'stage-exit'):
+            entered[0][1].__exit__(None, None, None)
+
+    def _unwind(self, exc_info):
+        exc_info = exc_info or (None, None, None)
+        while self._entered:
+            name, manager = self._entered.pop()
+            log.debug('Unwinding stage {0}'.format(name))
+            try:
+                with span('{0} exit'.format(name), 'stage-exit'):
+                    if manager.__exit__(*exc_info):
+                        exc_info = (None, None, None)
+            except Exception:
+                exc_info = sys.exc_info()
+        if exc_info[1] is not None:
+            raise exc_info[1]
@@ -9,47 +9,86 @@ gator.util
 ==========
 Utilities
 """
+import asyncio
 import functools
 import logging
-import requests
 from time import sleep
 
 from decorator import decorator
 
+from gator.util.ratelimit import decorrelated_jitter
+from gator.util.trace import WAIT, span
+
 
 log = logging.getLogger(__name__)
 
 
-def retry(ExceptionToCheck=None, tries=3, delay=0.5, backoff=1 logger=None, maxdelay=None):
+def backoff_delays(tries, delay=0.5, backoff=1, maxdelay=None, jitter=False):
+    """
+    the delays before each of tries retries: delay, lengthened by backoff after each
+    retry and capped at maxdelay. With jitter, each delay is drawn between delay and
+    three times the last one (decorrelated jitter), so concurrent callers don't retry in
+    lockstep
+    """
+    _delay = delay
+    for _ in range(tries):
+        yield _delay
+        _delay *= backoff
+        if jitter:
+            _delay = decorrelated_jitter(_delay, delay, maxdelay or delay * 3 ** tries)
+        if maxdelay and _delay > maxdelay:
+            _delay = maxdelay
+
+
+def retry(ExceptionToCheck=None, tries=3, delay=0.5, backoff=1, logger=None, maxdelay=None, jitter=False):
     """
     Retries a function or method until it returns True.
 
     delay sets the initial delay in seconds, and backoff sets the factor by which
     the delay should lengthen after each failure. backoff must be greater than 1,
     or else it isn't really a backoff. tries must be at least 0, and delay
-    greater than 0.
+    greater than 0. With jitter, each delay is drawn between delay and three times the
+    last one (decorrelated jitter), so concurrent callers don't retry in lockstep.
     """
     if logger is None:
         logger = log
 
     @decorator
     def _retry(f, *args, **kwargs):
-        _tries, _delay = tries, delay
-
-        while _tries > 0:
+        for _delay in backoff_delays(tries, delay, backoff, maxdelay, jitter):
             try:
                 return f(*args, **kwargs)
             except ExceptionToCheck as e:
                 logger.debug(e)
-                sleep(_delay)
-                _tries -= 1
-                _delay *= backoff
-                if maxdelay and _delay > maxdelay:
-                    _delay = maxdelay
+                with span('retry {0}'.format(f.__name__), WAIT, delay=_delay):
+                    sleep(_delay)
         return f(*args, **kwargs)
     return _retry
 
 
+def retry_async(ExceptionToCheck=None, tries=3, delay=0.5, backoff=1, logger=None, maxdelay=None, jitter=False):
+    """
+    retry for coroutine functions: the same schedule, awaited with asyncio.sleep so
+    waiting holds no thread
+    """
+    if logger is None:
+        logger = log
+
+    def _retry(f):
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            for _delay in backoff_delays(tries, delay, backoff, maxdelay, jitter):
+                try:
+                    return await f(*args, **kwargs)
+                except ExceptionToCheck as e:
+                    logger.debug(e)
+                    with span('retry {0}'.format(f.__name__), WAIT, delay=_delay):
+                        await asyncio.sleep(_delay)
+            return await f(*args, **kwargs)
+        return wrapper
+    return _retry
+
+
 def memoize(obj=None):
     """
     """
@@ -63,29 +102,34 @@ def memoize(obj=None):
     return memoizer
 
 
-@retry(requests.HTTPError, tries=5, delay=1, backoff=2)
 def download_file(url, dst, timeout=1, verify_https=False):
-    try:
-        response = requests.get(url, timeout=timeout, verify=verify_https)
-    except requests.RequestException as e:
-        if isinstance(e, requests.Timeout):
-            raise requests.HTTPError('Timeout exceeded.')
-        else:
-            raise e
+    # requests is slow to import and only needed for remote packages
+    import requests
+
+    @retry(requests.HTTPError, tries=5, delay=1, backoff=2)
+    def _download():
+        try:
+            response = requests.get(url, timeout=timeout, verify=verify_https)
+        except requests.RequestException as e:
+            if isinstance(e, requests.Timeout):
+                raise requests.HTTPError('Timeout exceeded.')
+            else:
+                raise e
 
-    if response.status_code >= 500:
-        raise requests.HTTPError('{0.status_code} {0.reason}'.format(response))
+        if response.status_code >= 500:
+            raise requests.HTTPError('{0.status_code} {0.reason}'.format(response))
 
-    if response.status_code != 200:
-        return False
+        if response.status_code != 200:
+            return False
 
-    with open(dst, 'w') as dst_fp:
-        dst_fp.write(response.content)
+        with open(dst, 'wb') as dst_fp:
+            dst_fp.write(response.content)
 
-    return True
+        return True
+    return _download()
 
 
 def randword(length):
     import random
     import string
-    return ''.join(random.choice(string.lowercase) for _ in xrange(length))
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
@@ -0,0 +1,183 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.hydrate
+==================
+Volume hydration: volumes created from a snapshot fetch each block on its first read,
+so reading them ahead, with many readers and the filesystem's used blocks first, takes
+that latency off fsck, resize and provisioning
+"""
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from gator.util.linux import monitor_command
+from gator.util.trace import span
+
+
+__all__ = ('Hydrator', 'used_extents')
+log = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+_BLOCK_SIZE = re.compile(r'^Block size:\s+(\d+)', re.MULTILINE)
+_FREE_BLOCKS = re.compile(r'^\s+Free blocks: (.*)$', re.MULTILINE)
+_BLOCK_COUNT = re.compile(r'^Block count:\s+(\d+)', re.MULTILINE)
+
+
+def _device_size(dev):
+    fd = os.open(dev, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+
+def _complement(extents, size):
+    """ the (offset, length) extents of [0, size) not covered by extents, which are sorted """
+    gaps = []
+    position = 0
+    for offset, length in extents:
+        if offset > position:
+            gaps.append((position, offset - position))
+        position = max(position, offset + length)
+    if position < size:
+        gaps.append((position, size - position))
+    return gaps
+
+
+def used_extents(dev):
+    """
+    (offset, length) byte extents in use by the ext2/3/4 filesystem on dev, from its
+    block bitmaps. None when dev holds no filesystem dumpe2fs can read
+    """
+    result = monitor_command(['dumpe2fs', dev])
+    if not result.success:
+        log.debug('Unable to read the block bitmaps of {0}: {1}'.format(dev, result.result.std_err))
+        return None
+    output = result.result.std_out.decode('utf-8')
+    block_size = _BLOCK_SIZE.search(output)
+    block_count = _BLOCK_COUNT.search(output)
+    if block_size is None or block_count is None:
+        return None
+    block_size = int(block_size.group(1))
+    free = []
+    for ranges in _FREE_BLOCKS.findall(output):
+        for free_range in ranges.split(','):
+            free_range = free_range.strip()
+            if free_range:
+                first, _, last = free_range.partition('-')
+                free.append((int(first) * block_size, (int(last or first) - int(first) + 1) * block_size))
+    return _complement(sorted(free), int(block_count.group(1)) * block_size)
+
+
+class Hydrator(object):
+    """
+    Reads every used extent of dev, then (with full) the rest of it, in chunk_size
+    pieces from workers concurrent readers. run() blocks; start() reads in a background
+    thread until wait() or stop(). Progress is logged and reported to metrics (a metrics
+    plugin) under metric_prefix: a progress gauge every tenth of the way, then bytes
+    read, duration and throughput
+    """
+    def __init__(self, dev, workers=32, chunk_size=MB, full=False, metrics=None, metric_prefix='gator.volume.hydrate'):
+        self._dev = dev
+        self._workers = int(workers)
+        self._chunk_size = int(chunk_size)
+        self._full = full
+        self._metrics = metrics
+        self._metric_prefix = metric_prefix
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._error = None
+        self.total = 0
+        self.done = 0
+
+    def extents(self):
+        """ the extents to read, in order: used ones first """
+        size = _device_size(self._dev)
+        used = used_extents(self._dev)
+        if used is None:
+            return [(0, size)]
+        # the filesystem may not fill the device (before it is resized)
+        used = [(offset, min(length, size - offset)) for offset, length in used if offset < size]
+        return used + _complement(used, size) if self._full else used
+
+    def _chunks(self, extents):
+        for offset, length in extents:
+            end = offset + length
+            while offset < end:
+                yield offset, min(self._chunk_size, end - offset)
+                offset += self._chunk_size
+
+    def _read(self, fd, chunk):
+        if self._stopped.is_set():
+            return
+        offset, length = chunk
+        os.pread(fd, length, offset)
+        with self._lock:
+            before = self.done * 10 // self.total
+            self.done += length
+            step = self.done * 10 // self.total
+        if step > before:
+            log.debug('Hydrated {0}% of {1}'.format(step * 10, self._dev))
+            self._gauge('progress', step * 10)
+
+    def _gauge(self, name, value):
+        if self._metrics is not None:
+            self._metrics.gauge('{0}.{1}'.format(self._metric_prefix, name), value)
+
+    def run(self):
+        """ read the extents; returns the bytes read """
+        start = time()
+        extents = self.extents()
+        self.total = sum(length for _, length in extents) or 1
+        log.info('Hydrating {0}: {1:.1f} MB with {2} readers'.format(self._dev, self.total / float(MB), self._workers))
+        fd = os.open(self._dev, os.O_RDONLY)
+        try:
+            with span('hydrate {0}'.format(self._dev), 'call', bytes=self.total):
+                with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                    for _ in executor.map(lambda chunk: self._read(fd, chunk), self._chunks(extents)):
+                        pass
+        finally:
+            os.close(fd)
+        elapsed = time() - start
+        log.info('Hydrated {0:.1f} MB of {1} in {2:.1f}s ({3:.1f} MB/s){4}'.format(
+            self.done / float(MB), self._dev, elapsed, self.done / float(MB) / max(elapsed, 1e-6),
+            ', stopped early' if self._stopped.is_set() else ''))
+        if self._metrics is not None:
+            self._metrics.increment('{0}.bytes'.format(self._metric_prefix), self.done)
+            self._metrics.timer('{0}.duration'.format(self._metric_prefix), elapsed)
+            self._gauge('throughput', self.done / max(elapsed, 1e-6))
+        return self.done
+
+    def _run_background(self):
+        try:
+            self.run()
+        except Exception as e:
+            self._error = e
+            log.warning('Hydrating {0} failed: {1}'.format(self._dev, e))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_background, name='gator-hydrate')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def wait(self):
+        """ block until a background hydration finishes; returns the bytes read """
+        if self._thread is not None:
+            self._thread.join()
+        return self.done
+
+    def stop(self):
+        """ abandon the remaining reads and wait for those in flight """
+        self._stopped.set()
+        return self.wait()
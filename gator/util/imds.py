@@ -0,0 +1,226 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.imds
+===============
+EC2 instance metadata: single keys fetched on demand with one IMDSv2 session token,
+reused until it expires, and values cached for the life of the process. The endpoint
+can be pointed elsewhere, such as a MetadataStub, with AWS_EC2_METADATA_SERVICE_ENDPOINT
+"""
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from time import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+
+__all__ = ('InstanceMetadata', 'MetadataStub', 'instance_metadata')
+log = logging.getLogger(__name__)
+
+IMDS_ENDPOINT = 'http://169.254.169.254'
+TOKEN_PATH = '/latest/api/token'
+METADATA_PATH = '/latest/meta-data/'
+TOKEN_TTL_HEADER = 'X-aws-ec2-metadata-token-ttl-seconds'
+TOKEN_HEADER = 'X-aws-ec2-metadata-token'
+
+
+class InstanceMetadata(object):
+    """
+    Instance metadata client. get() fetches only the key asked for. The session token is
+    renewed a minute before it expires; when the service only speaks IMDSv1, requests go
+    without one
+    """
+    def __init__(self, endpoint=None, token_ttl=21600, timeout=2, attempts=3):
+        self._endpoint = (endpoint or os.environ.get('AWS_EC2_METADATA_SERVICE_ENDPOINT') or IMDS_ENDPOINT).rstrip('/')
+        self._token_ttl = int(token_ttl)
+        self._timeout = timeout
+        self._attempts = attempts
+        self._token = None
+        self._token_expires = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _request(self, path, method='GET', headers=None):
+        error = None
+        for _ in range(self._attempts):
+            try:
+                response = urlopen(Request(self._endpoint + path, method=method, headers=headers or {}), timeout=self._timeout)
+                with response:
+                    return response.read().decode('utf-8')
+            except HTTPError:
+                raise
+            except (URLError, OSError) as e:
+                error = e
+        raise error
+
+    def _session_token(self):
+        if self._token_expires > time() + 60:
+            return self._token
+        try:
+            self._token = self._request(TOKEN_PATH, method='PUT', headers={TOKEN_TTL_HEADER: str(self._token_ttl)})
+            self._token_expires = time() + self._token_ttl
+            log.debug('Acquired instance metadata token for {0}s'.format(self._token_ttl))
+        except HTTPError as e:
+            if e.code not in (403, 404, 405):
+                raise
+            log.debug('Instance metadata service does not issue tokens ({0}), using IMDSv1'.format(e.code))
+            self._token = None
+            self._token_expires = float('inf')
+        return self._token
+
+    def _fetch(self, key):
+        for retry in (True, False):
+            token = self._session_token()
+            try:
+                return self._request(METADATA_PATH + key, headers={TOKEN_HEADER: token} if token else {})
+            except HTTPError as e:
+                if e.code == 404:
+                    return None
+                if e.code == 401 and retry:
+                    # token revoked or expired early
+                    self._token_expires = 0
+                    continue
+                raise
+
+    def get(self, key, default=None):
+        """ the value of a meta-data key such as instance-id or placement/availability-zone """
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = self._fetch(key)
+            value = self._cache[key]
+        return default if value is None else value
+
+    @property
+    def instance_id(self):
+        return self.get('instance-id')
+
+    @property
+    def availability_zone(self):
+        return self.get('placement/availability-zone')
+
+    @property
+    def region(self):
+        """ the region, from the availability zone where the service predates placement/region """
+        region = self.get('placement/region')
+        if region:
+            return region
+        zone = self.availability_zone
+        return zone[:-1] if zone else None
+
+    @property
+    def hostname(self):
+        """ public hostname, or the private IP where there is none """
+        return self.get('public-hostname') or self.get('local-ipv4')
+
+
+_instance_metadata = None
+
+
+def instance_metadata():
+    """ the process-wide client, whose cache forked bake workers inherit """
+    global _instance_metadata
+    if _instance_metadata is None:
+        _instance_metadata = InstanceMetadata()
+    return _instance_metadata
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        log.debug('imds stub: ' + format % args)
+
+    def _reply(self, status, body=''):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.server.stub.requests.append(('PUT', self.path))
+        if not self.server.stub.issues_tokens:
+            return self._reply(403)
+        if self.path != TOKEN_PATH or not self.headers.get(TOKEN_TTL_HEADER):
+            return self._reply(400)
+        self._reply(200, self.server.stub.issue_token(int(self.headers[TOKEN_TTL_HEADER])))
+
+    def do_GET(self):
+        self.server.stub.requests.append(('GET', self.path))
+        if not self.server.stub.valid_token(self.headers.get(TOKEN_HEADER)):
+            return self._reply(401)
+        if not self.path.startswith(METADATA_PATH):
+            return self._reply(404)
+        value = self.server.stub.metadata
+        for part in self.path[len(METADATA_PATH):].strip('/').split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return self._reply(404)
+            value = value[part]
+        if isinstance(value, dict):
+            value = '\n'.join(key + '/' if isinstance(child, dict) else key for key, child in sorted(value.items()))
+        self._reply(200, str(value))
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetadataStub(object):
+    """
+    Local stand-in for the instance metadata service, serving a nested dict over HTTP
+    with IMDSv2 tokens. Point InstanceMetadata (or AWS_EC2_METADATA_SERVICE_ENDPOINT) at
+    its endpoint; requests records every (method, path). With require_token=False, IMDSv1
+    requests are accepted too; with issues_tokens=False, the service only speaks IMDSv1
+    and refuses token requests
+    """
+    def __init__(self, metadata, host='127.0.0.1', port=0, require_token=True, issues_tokens=True):
+        self.metadata = metadata
+        self.requests = []
+        self.issues_tokens = issues_tokens
+        self._require_token = require_token and issues_tokens
+        self._tokens = {}
+        self._server = _StubServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://{0}:{1}'.format(*self._server.server_address[:2])
+
+    def issue_token(self, ttl):
+        token = os.urandom(16).hex()
+        self._tokens[token] = time() + ttl
+        return token
+
+    def revoke_tokens(self):
+        """ invalidate every issued token, as an instance restart does """
+        self._tokens.clear()
+
+    def valid_token(self, token):
+        if token is None:
+            return not self._require_token
+        return self._tokens.get(token, 0) > time()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='gator-imds-stub')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, val, trc):
+        self.stop()
+        return False
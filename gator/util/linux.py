@@ -32,6 +32,8 @@ from subprocess import Popen, PIPE
 
 from decorator import decorator
 
+from gator.util.trace import span
+
 
 log = logging.getLogger(__name__)
 MountSpec = namedtuple('MountSpec', 'dev fstype mountpoint options')
@@ -76,6 +78,11 @@ def monitor_command(cmd, timeout=None):
     if hasattr(sys, "real_prefix"):
         env["PATH"] = string.replace(env["PATH"], "{0}/bin:".format(sys.prefix), "")
 
+    with span(cmdStr, 'subprocess'):
+        return _monitor_command(cmd, cmdStr, shell, env, timeout)
+
+
+def _monitor_command(cmd, cmdStr, shell, env, timeout):
     proc = Popen(cmd, stdout=PIPE, stderr=PIPE, close_fds=True, shell=shell, env=env)
     set_nonblocking(proc.stdout)
     set_nonblocking(proc.stderr)
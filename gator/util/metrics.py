@@ -11,13 +11,16 @@ Metrics utility functions
 """
 from time import time
 
+from gator.util.trace import span
+
 
 def timer(metric_name, context_obj=None):
     def func_1(func):
         def func_2(obj, *args, **kwargs):
             start = time()
             try:
-                retval = func(obj, *args, **kwargs)
+                with span(metric_name, 'call'):
+                    retval = func(obj, *args, **kwargs)
                 (context_obj or obj)._config.metrics.timer(metric_name, time() - start)
             except:
                 (context_obj or obj)._config.metrics.timer(metric_name, time() - start)
@@ -32,7 +35,8 @@ def lapse(metric_name, context_obj=None):
         def func_2(obj, *args, **kwargs):
             (context_obj or obj)._config.metrics.start_timer(metric_name)
             try:
-                retval = func(obj, *args, **kwargs)
+                with span(metric_name, 'call'):
+                    retval = func(obj, *args, **kwargs)
                 (context_obj or obj)._config.metrics.stop_timer(metric_name)
             except:
                 (context_obj or obj)._config.metrics.stop_timer(metric_name)
@@ -0,0 +1,148 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.polling
+==================
+Adaptive polling for cloud resource state. Completion is predicted from the progress a
+resource reports and from how long the same operation took before (scaled by size), so
+polls are sparse early on and dense around the expected finish
+"""
+import json
+import logging
+import os
+from time import sleep, time
+
+from gator.util.linux import flock, mkdir_p
+from gator.util.trace import WAIT, span
+
+
+__all__ = ('PollHistory', 'Schedule', 'poll')
+log = logging.getLogger(__name__)
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+class PollHistory(object):
+    """
+    Recent (size, seconds) samples per operation, shared by every bake on the host
+    through a JSON file
+    """
+    def __init__(self, filename, samples=50):
+        self._filename = filename
+        self._samples = samples
+        self._history = None
+
+    def _load(self):
+        try:
+            with open(self._filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def predict(self, operation, size=None):
+        """ expected seconds for operation, None without history """
+        if self._history is None:
+            self._history = self._load()
+        samples = self._history.get(operation, [])
+        if not samples:
+            return None
+        rates = [seconds / sample_size for sample_size, seconds in samples if sample_size]
+        if size and rates:
+            return _median(rates) * size
+        return _median([seconds for _, seconds in samples])
+
+    def record(self, operation, size, seconds):
+        try:
+            mkdir_p(os.path.dirname(self._filename))
+            with flock('{0}.lock'.format(self._filename)):
+                history = self._load()
+                samples = history.setdefault(operation, [])
+                samples.append((size, round(seconds, 3)))
+                del samples[:-self._samples]
+                tmp_filename = '{0}.{1}.tmp'.format(self._filename, os.getpid())
+                with open(tmp_filename, 'w') as f:
+                    json.dump(history, f)
+                os.rename(tmp_filename, self._filename)
+            self._history = history
+        except (IOError, OSError) as e:
+            log.debug('Unable to record {0} duration in {1}: {2}'.format(operation, self._filename, e))
+
+
+def _eta(elapsed, progress, expected):
+    """ seconds until completion: from reported progress once it means something, else history """
+    if progress and 5 <= progress < 100:
+        return elapsed * (100 - progress) / progress
+    if expected is not None:
+        return expected - elapsed
+    return None
+
+
+class Schedule(object):
+    """
+    When to look again at one pending operation. The next poll comes after half the
+    estimated remaining time, clamped to [min_interval, max_interval]; without an
+    estimate, or once overdue, the interval backs off from min_interval
+    """
+    def __init__(self, operation, history=None, size=None, timeout=3600, min_interval=0.5, max_interval=15):
+        self.operation = operation
+        self._history = history
+        self._size = size
+        self._timeout = timeout
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = min_interval
+        self.expected = history.predict(operation, size) if history is not None else None
+        self.start = time()
+        self.eta = None
+
+    @property
+    def elapsed(self):
+        return time() - self.start
+
+    def next_delay(self, progress=None):
+        """ seconds until the next poll, None once timed out """
+        elapsed = self.elapsed
+        if elapsed >= self._timeout:
+            log.debug('{0} not done after {1:.1f}s, giving up'.format(self.operation, elapsed))
+            return None
+        self.eta = eta = _eta(elapsed, progress, self.expected)
+        if eta is None or eta <= 0:
+            delay = self._backoff
+            self._backoff = min(self._backoff * 1.5, self._max_interval)
+        else:
+            delay = eta / 2.0
+            log.debug('Waiting for {0}: progress {1}, ETA {2:.1f}s'.format(self.operation, progress if progress is not None else '-', eta))
+        return max(self._min_interval, min(delay, self._max_interval, self._timeout - elapsed))
+
+    def done(self):
+        elapsed = self.elapsed
+        log.debug('{0} done after {1:.1f}s{2}'.format(
+            self.operation, elapsed, ' (expected {0:.1f}s)'.format(self.expected) if self.expected is not None else ''))
+        if self._history is not None:
+            self._history.record(self.operation, self._size, elapsed)
+
+
+def poll(check, operation, history=None, size=None, timeout=3600, min_interval=0.5, max_interval=15):
+    """
+    Call check, which returns (done, progress) with progress a percentage or None, on a
+    Schedule until it reports done. Returns True when done, False on timeout
+    """
+    schedule = Schedule(operation, history, size, timeout, min_interval, max_interval)
+    while True:
+        done, progress = check()
+        if done:
+            schedule.done()
+            return True
+        delay = schedule.next_delay(progress)
+        if delay is None:
+            return False
+        with span('poll {0}'.format(operation), WAIT, eta=schedule.eta, progress=progress, delay=delay):
+            sleep(delay)
@@ -0,0 +1,166 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.ratelimit
+====================
+Host-wide API rate limiting: a token bucket per family of API actions, shared by every
+thread and gator process on the host through a locked state file that processes lease
+tokens from a few at a time, with a shared decorrelated-jitter pause after throttling so
+concurrent bakes back off together instead of retrying in lockstep
+"""
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+from collections import defaultdict
+from time import sleep, time
+
+from gator.util.linux import mkdir_p
+from gator.util.trace import WAIT, span
+
+
+__all__ = ('RateLimiter', 'decorrelated_jitter', 'family')
+log = logging.getLogger(__name__)
+
+# family -> (tokens per second, burst)
+DEFAULT_FAMILIES = {
+    'describe': (20, 100),
+    'mutate': (5, 50),
+    'tag': (5, 50),
+    'register': (1, 5),
+}
+
+
+def decorrelated_jitter(previous, base, cap):
+    """ the next backoff: random between base and three times the previous one, at most cap """
+    return min(cap, random.uniform(base, max(base, previous) * 3))
+
+
+def family(operation):
+    """ the rate limit family of an API operation, given in snake_case """
+    if operation in ('create_tags', 'delete_tags'):
+        return 'tag'
+    if operation in ('register_image', 'copy_image', 'deregister_image'):
+        return 'register'
+    if operation.startswith(('describe_', 'list_', 'get_')):
+        return 'describe'
+    return 'mutate'
+
+
+class RateLimiter(object):
+    """
+    Token buckets keyed by family, with rates and bursts from families (family ->
+    {rate, burst}). acquire() reserves a token, possibly in the future, and sleeps until
+    it is due; throttled() pauses the family for a decorrelated-jitter backoff between
+    base and cap seconds. State lives in filename, locked per update, so the budget is
+    shared host-wide; when the file is unusable, buckets are kept per process. To keep
+    the file off the path of every call, a process takes up to `lease` tokens per update
+    and spends them from memory; a throttle is written through at once and drops the
+    lease, while pauses from other processes are seen at the next lease. waited holds the
+    seconds spent waiting per family, also reported to metrics
+    """
+    def __init__(self, filename=None, families=None, base=1, cap=30, metrics=None, lease=10):
+        self._filename = filename
+        self._families = dict((name, {'rate': float(rate), 'burst': float(burst)}) for name, (rate, burst) in DEFAULT_FAMILIES.items())
+        for name, limits in (families or {}).items():
+            self._families.setdefault(name, {}).update(dict((key, float(value)) for key, value in limits.items()))
+        self._base = float(base)
+        self._cap = float(cap)
+        self._lease = max(1, int(lease))
+        self._lock = threading.Lock()
+        self._local = {}
+        # family -> tokens leased from the shared state and not spent yet, and the pause
+        # the shared state held when they were leased
+        self._leased = defaultdict(int)
+        self._blocked_until = defaultdict(float)
+        self.waited = defaultdict(float)
+        self.metrics = metrics
+
+    def _update(self, change):
+        """ apply change(state, now) to the shared state, returning its result """
+        with self._lock:
+            now = time()
+            if self._filename:
+                try:
+                    mkdir_p(os.path.dirname(self._filename))
+                    with open(self._filename, 'a+') as f:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                        f.seek(0)
+                        try:
+                            state = json.loads(f.read() or '{}')
+                        except ValueError:
+                            state = {}
+                        result = change(state, now)
+                        f.seek(0)
+                        f.truncate()
+                        f.write(json.dumps(state))
+                        return result
+                except (IOError, OSError) as e:
+                    log.debug('Rate limit state {0} unusable, limiting per process: {1}'.format(self._filename, e))
+                    self._filename = None
+            return change(self._local, now)
+
+    def _bucket(self, state, name, now):
+        limits = self._families[name]
+        bucket = state.setdefault(name, {'tokens': limits['burst'], 'updated': now, 'blocked_until': 0, 'backoff': 0})
+        bucket['tokens'] = min(limits['burst'], bucket['tokens'] + (now - bucket['updated']) * limits['rate'])
+        bucket['updated'] = now
+        return bucket
+
+    def acquire(self, name):
+        """ take a token from family name, sleeping until one is available; returns seconds waited """
+        if name not in self._families:
+            return 0.0
+
+        def lease(state, now):
+            bucket = self._bucket(state, name, now)
+            # up to a lease of the tokens there are now; with none left, one reserved ahead
+            tokens = max(1, min(self._lease, int(bucket['tokens'])))
+            bucket['tokens'] -= tokens
+            self._leased[name] += tokens - 1
+            self._blocked_until[name] = bucket['blocked_until']
+            wait = -bucket['tokens'] / self._families[name]['rate'] if bucket['tokens'] < 0 else 0.0
+            return max(wait, bucket['blocked_until'] - now)
+
+        with self._lock:
+            leased = self._leased[name] > 0
+            if leased:
+                self._leased[name] -= 1
+                wait = max(0.0, self._blocked_until[name] - time())
+        if not leased:
+            wait = self._update(lease)
+        if wait > 0:
+            with span('rate limit {0}'.format(name), WAIT, delay=wait):
+                sleep(wait)
+            self.waited[name] += wait
+            if self.metrics is not None:
+                self.metrics.timer('gator.ratelimit.{0}.wait'.format(name), wait)
+        return wait
+
+    def throttled(self, name):
+        """ the service throttled a call of family name: pause the family host-wide """
+        if name not in self._families:
+            return 0.0
+
+        def pause(state, now):
+            bucket = self._bucket(state, name, now)
+            # a throttle long after the last pause starts the backoff over
+            previous = bucket['backoff'] if now < bucket['blocked_until'] + self._cap else 0
+            bucket['backoff'] = decorrelated_jitter(previous, self._base, self._cap)
+            bucket['blocked_until'] = max(bucket['blocked_until'], now + bucket['backoff'])
+            bucket['tokens'] = min(bucket['tokens'], 0)
+            self._leased[name] = 0
+            self._blocked_until[name] = bucket['blocked_until']
+            return bucket['backoff']
+
+        backoff = self._update(pause)
+        log.debug('Throttled on {0} calls, pausing them for {1:.1f}s'.format(name, backoff))
+        if self.metrics is not None:
+            self.metrics.increment('gator.ratelimit.{0}.throttled'.format(name))
+        return backoff
@@ -0,0 +1,96 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.startup
+==================
+Startup profiling for --profile-startup: time spent importing each module (cumulative,
+including the modules it imports, and self) and in each initialization phase
+"""
+import sys
+from importlib.abc import MetaPathFinder
+from time import time
+
+from gator.util.trace import Timeline, activate, active, span
+
+
+__all__ = ('StartupProfiler',)
+
+# span categories
+IMPORT = 'import'
+INIT = 'init'
+
+
+class _TimedLoader(object):
+    """ proxy for a module loader that records exec_module on the active timeline """
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with span(module.__name__, IMPORT):
+            self._loader.exec_module(module)
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _TimingFinder(MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+class StartupProfiler(object):
+    def __init__(self):
+        self._finder = _TimingFinder()
+        self._previous = None
+        self.timeline = Timeline()
+        self.start = None
+        self.end = None
+
+    def begin(self):
+        self.start = time()
+        self._previous = active()
+        activate(self.timeline)
+        sys.meta_path.insert(0, self._finder)
+        return self
+
+    def finish(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        activate(self._previous)
+        self.end = time()
+
+    def report(self, limit=25):
+        events = self.timeline.events
+        imports = sorted((e for e in events if e['cat'] == IMPORT), key=lambda e: e['start'])
+        rows = [('MODULE', 'CUMULATIVE', 'SELF')]
+        # self time: cumulative minus the directly nested imports
+        for event in sorted(imports, key=lambda e: e['start'] - e['end'])[:limit]:
+            nested = [e for e in imports if e is not event and event['start'] <= e['start'] and e['end'] <= event['end']]
+            direct = [e for e in nested if not any(o is not e and o['start'] <= e['start'] and e['end'] <= o['end'] for o in nested)]
+            cumulative = event['end'] - event['start']
+            own = cumulative - sum(e['end'] - e['start'] for e in direct)
+            rows.append((event['name'], '{0:.1f}ms'.format(cumulative * 1e3), '{0:.1f}ms'.format(own * 1e3)))
+        rows.append(('', '', ''))
+        rows.append(('PHASE', 'SECONDS', ''))
+        for event in sorted((e for e in events if e['cat'] == INIT), key=lambda e: e['start']):
+            rows.append((event['name'], '{0:.3f}'.format(event['end'] - event['start']), ''))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ['  '.join(col.ljust(width) for col, width in zip(row, widths)).rstrip() for row in rows]
+        lines.append('')
+        lines.append('{0} modules imported, startup took {1:.3f}s'.format(len(imports), (self.end or time()) - self.start))
+        return '\n'.join(lines)
@@ -0,0 +1,159 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+gator.util.trace
+================
+Bake timeline: nested spans for stages, cloud calls, subprocesses and waits, exported
+as Chrome trace-event JSON (chrome://tracing, Perfetto) plus a summary table
+"""
+import contextvars
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import time
+
+
+__all__ = ('Timeline', 'activate', 'active', 'recording', 'span')
+
+# category of spans where the bake is idle: retry sleeps and state polling
+WAIT = 'wait'
+
+_active = None
+# the timeline of the bake an asyncio task (or a call it hands to an executor) works for
+_bake = contextvars.ContextVar('gator_timeline', default=None)
+
+
+def activate(timeline):
+    """ make timeline the process-wide recorder for span(); None disables recording """
+    global _active
+    _active = timeline
+    return timeline
+
+
+def active():
+    timeline = _bake.get()
+    return _active if timeline is None else timeline
+
+
+@contextmanager
+def recording(timeline):
+    """
+    record the spans of the current context on timeline rather than the process-wide
+    one, so bakes driven from one event loop each keep their own timeline
+    """
+    token = _bake.set(timeline)
+    try:
+        yield timeline
+    finally:
+        _bake.reset(token)
+
+
+@contextmanager
+def span(name, category='gator', **args):
+    """ record the enclosed block on the active timeline, if any """
+    timeline = active()
+    if timeline is None:
+        yield
+        return
+    start = time()
+    try:
+        yield
+    finally:
+        timeline.add(name, category, start, time(), **args)
+
+
+class Timeline(object):
+    def __init__(self):
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self.start = time()
+
+    def add(self, name, category, start, end, **args):
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self._events.append({
+                'name': name,
+                'cat': category,
+                'start': start,
+                'end': end,
+                'tid': thread.ident,
+                'args': args,
+            })
+
+    @property
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in self._threads.items()]
+        for event in self.events:
+            trace.append({
+                'name': event['name'],
+                'cat': event['cat'],
+                'ph': 'X',
+                'ts': int((event['start'] - self.start) * 1e6),
+                'dur': int((event['end'] - event['start']) * 1e6),
+                'pid': pid,
+                'tid': event['tid'],
+                'args': event['args'],
+            })
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def stages(self):
+        """ stage name -> (start, end) """
+        return dict((e['name'], (e['start'], e['end'])) for e in self.events if e['cat'] == 'stage')
+
+    def critical_path(self):
+        """
+        chain of stages that determined the end of the bake: from the stage that finished
+        last, repeatedly follow the required stage that finished last
+        """
+        stages = dict((e['name'], e) for e in self.events if e['cat'] == 'stage')
+        if not stages:
+            return []
+        path = []
+        current = max(stages.values(), key=lambda e: e['end'])
+        while current is not None:
+            path.append(current['name'])
+            requires = [stages[dep] for dep in current['args'].get('requires', ()) if dep in stages]
+            current = max(requires, key=lambda e: e['end']) if requires else None
+        return list(reversed(path))
+
+    def summary(self):
+        events = self.events
+        total = (max(e['end'] for e in events) - self.start) if events else 0.0
+        by_name = defaultdict(lambda: [0, 0.0])
+        for event in events:
+            entry = by_name[(event['cat'], event['name'])]
+            entry[0] += 1
+            entry[1] += event['end'] - event['start']
+        stages = self.stages()
+        critical = self.critical_path()
+        critical_time = sum(stages[name][1] - stages[name][0] for name in critical)
+        waited = sum(e['end'] - e['start'] for e in events if e['cat'] == WAIT)
+
+        rows = [('CATEGORY', 'NAME', 'COUNT', 'SECONDS')]
+        for (category, name), (count, seconds) in sorted(by_name.items(), key=lambda item: -item[1][1]):
+            rows.append((category, name, str(count), '{0:.3f}'.format(seconds)))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ['  '.join(col.ljust(width) for col, width in zip(row, widths)).rstrip() for row in rows]
+        lines.append('')
+        lines.append('wall clock: {0:.3f}s'.format(total))
+        lines.append('critical path: {0} ({1:.3f}s)'.format(' > '.join(critical) or '-', critical_time))
+        lines.append('waiting (retry sleeps, polling): {0:.3f}s'.format(waited))
+        return '\n'.join(lines)
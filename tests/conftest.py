@@ -0,0 +1,151 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.conftest
+==============
+Shared fixtures: a packaged-defaults configuration rooted in a temporary directory and
+an in-memory stand-in for the pooled EC2 clients
+"""
+import itertools
+
+import pytest
+from bunch import Bunch
+
+import gator.config
+from gator.config import build_config, init_parser
+from gator.plugins.cloud import ec2
+from gator.plugins.cloud.instrumentation import bake_metrics
+from gator.util import trace
+
+
+class StubClient(object):
+    """
+    The EC2 calls gator makes, answered from memory. Every call is recorded with the
+    bake metrics and timeline it was made for; errors holds, per operation, exceptions
+    to raise on its next calls
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, region):
+        self.region = region
+        self.calls = []
+        self.errors = {}
+        self.snapshots = {}
+        self.images = {}
+        self.volumes = {}
+
+    def _call(self, operation, params):
+        self.calls.append((operation, params, bake_metrics.get(), trace.active()))
+        if self.errors.get(operation):
+            raise self.errors[operation].pop(0)
+
+    @staticmethod
+    def _filtered(params):
+        return params['Filters'][0]['Values'] if 'Filters' in params else None
+
+    @staticmethod
+    def _tagged(params):
+        return [tag for spec in params.get('TagSpecifications', []) for tag in spec['Tags']]
+
+    def describe_images(self, **params):
+        self._call('describe_images', params)
+        if 'ImageIds' in params:
+            return {'Images': [{'ImageId': image_id, 'Name': 'base-{0}'.format(image_id), 'State': 'available',
+                                'RootDeviceName': '/dev/sda1', 'BlockDeviceMappings': []}
+                               for image_id in params['ImageIds']]}
+        return {'Images': [self.images[image_id] for image_id in self._filtered(params) if image_id in self.images]}
+
+    def create_volume(self, **params):
+        self._call('create_volume', params)
+        volume_id = 'vol-{0}'.format(next(self._ids))
+        self.volumes[volume_id] = {'VolumeId': volume_id, 'Size': params['Size'], 'State': 'available',
+                                   'AvailabilityZone': params['AvailabilityZone'], 'SnapshotId': params['SnapshotId'],
+                                   'Tags': self._tagged(params)}
+        return dict(self.volumes[volume_id], State='creating')
+
+    def describe_volumes(self, **params):
+        self._call('describe_volumes', params)
+        return {'Volumes': [self.volumes[volume_id] for volume_id in self._filtered(params) if volume_id in self.volumes]}
+
+    def attach_volume(self, **params):
+        self._call('attach_volume', params)
+        self.volumes[params['VolumeId']]['State'] = 'in-use'
+
+    def delete_volume(self, **params):
+        self._call('delete_volume', params)
+        del self.volumes[params['VolumeId']]
+
+    def create_snapshot(self, **params):
+        self._call('create_snapshot', params)
+        snapshot_id = 'snap-{0}'.format(next(self._ids))
+        self.snapshots[snapshot_id] = {'SnapshotId': snapshot_id, 'VolumeId': params['VolumeId'], 'VolumeSize': 8,
+                                       'State': 'completed', 'Progress': '100%', 'Description': params['Description'],
+                                       'Tags': self._tagged(params)}
+        return dict(self.snapshots[snapshot_id], State='pending', Progress='0%')
+
+    def describe_snapshots(self, **params):
+        self._call('describe_snapshots', params)
+        return {'Snapshots': [self.snapshots[snapshot_id] for snapshot_id in self._filtered(params) if snapshot_id in self.snapshots]}
+
+    def describe_instances(self, **params):
+        self._call('describe_instances', params)
+        return {'Reservations': [{'Instances': [{'InstanceId': instance_id, 'Placement': {'AvailabilityZone': self.region + 'a'}}
+                                                for instance_id in params['InstanceIds']]}]}
+
+    def copy_image(self, **params):
+        self._call('copy_image', params)
+        image_id = 'ami-{0}'.format(next(self._ids))
+        self.images[image_id] = {'ImageId': image_id, 'Name': params['Name'], 'State': 'available', 'Tags': self._tagged(params)}
+        return {'ImageId': image_id}
+
+    def register_image(self, **params):
+        self._call('register_image', params)
+        image_id = 'ami-{0}'.format(next(self._ids))
+        self.images[image_id] = {'ImageId': image_id, 'Name': params['Name'], 'State': 'available', 'Tags': self._tagged(params)}
+        return {'ImageId': image_id}
+
+    def create_tags(self, **params):
+        self._call('create_tags', params)
+        for resource_id in params['Resources']:
+            for resources in (self.images, self.snapshots, self.volumes):
+                if resource_id in resources:
+                    tags = dict((tag['Key'], tag['Value']) for tag in resources[resource_id]['Tags'])
+                    tags.update((tag['Key'], tag['Value']) for tag in params['Tags'])
+                    resources[resource_id]['Tags'] = [{'Key': key, 'Value': value} for key, value in tags.items()]
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """ region -> StubClient, for every EC2 client gator asks for """
+    clients = {}
+
+    def get_client(region, **kwargs):
+        return clients.setdefault(region, StubClient(region))
+
+    monkeypatch.setattr(ec2, '_get_client', get_client)
+    monkeypatch.setattr(ec2, '_rate_limiter', None)
+    monkeypatch.setattr(ec2, '_image_caches', {})
+    monkeypatch.setattr(ec2, '_pollers', {})
+    return clients
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(gator.config, '_config_caches', {})
+    config = build_config()
+    config.aminator_root = str(tmp_path)
+    return config
+
+
+@pytest.fixture
+def cloud(config, clients, monkeypatch):
+    """ an EC2 plugin on instance i-1234 in us-west-2, polling quickly """
+    monkeypatch.setattr(ec2, 'instance_metadata', lambda: Bunch(instance_id='i-1234', region='us-west-2'))
+    cloud = ec2.EC2CloudPlugin()
+    cloud.configure(config, init_parser(config, argv=[]))
+    config.plugins[cloud.full_name].polling.update(min_interval=0.01, max_interval=0.05)
+    return cloud
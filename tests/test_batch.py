@@ -0,0 +1,118 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_batch
+================
+Fan-out bakes from a manifest, against a stand-in bake runner
+"""
+import pytest
+from bunch import Bunch
+
+from gator import batch
+from gator.batch import BatchBake, load_manifest
+from gator.daemon import BakeJob
+
+MANIFEST = """
+environment: ec2_yum_linux
+args: [-B, ami-12345678]
+packages:
+  - mypkg
+  - name: otherpkg
+    args: [-n, otherpkg-custom]
+  - failingpkg
+"""
+
+
+class Runner(object):
+    """ finishes every job as soon as it is submitted; failingpkg fails """
+    started = []
+
+    def __init__(self, config, concurrency=None):
+        self.concurrency = concurrency
+        self.submitted = []
+
+    def start(self):
+        Runner.started.append(self)
+        return self
+
+    def stop(self):
+        pass
+
+    def submit(self, argv, environment=None):
+        self.submitted.append((argv, environment))
+        job = BakeJob(argv, environment)
+        job.started = job.submitted
+        if argv[-1] == 'failingpkg':
+            job.finish(1)
+        else:
+            job.ami_id, job.ami_name = 'ami-{0}'.format(len(self.submitted)), '{0}-ebs'.format(argv[-1])
+            job.finish(0)
+        return job
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    filename = tmp_path / 'manifest.yml'
+    filename.write_text(MANIFEST)
+    return load_manifest(str(filename))
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    Runner.started = []
+    monkeypatch.setattr(batch, 'BakeRunner', Runner)
+    return Runner
+
+
+def test_manifest_without_packages(tmp_path):
+    filename = tmp_path / 'manifest.yml'
+    filename.write_text('environment: ec2_yum_linux\n')
+    with pytest.raises(ValueError):
+        load_manifest(str(filename))
+
+
+def test_bakes_every_package(config, manifest, runner):
+    bake = BatchBake(config, manifest, concurrency=8)
+
+    assert not bake.run()
+    runner, = Runner.started
+    # never more workers than packages
+    assert runner.concurrency == 3
+    assert runner.submitted == [
+        (['-B', 'ami-12345678', 'mypkg'], 'ec2_yum_linux'),
+        (['-B', 'ami-12345678', '-n', 'otherpkg-custom', 'otherpkg'], 'ec2_yum_linux'),
+        (['-B', 'ami-12345678', 'failingpkg'], 'ec2_yum_linux'),
+    ]
+
+
+def test_concurrency_defaults_to_free_block_devices(config, manifest, runner, monkeypatch):
+    found = []
+
+    class PluginManager(object):
+        def __init__(self, config, parser, plugins=None):
+            self._plugins = plugins
+
+        def find_by_kind(self, kind, name):
+            found.append((kind, name))
+            return Bunch(obj=Bunch(available_devices=lambda: 2))
+
+    monkeypatch.setattr(batch, 'PluginManager', PluginManager)
+    BatchBake(config, manifest).run()
+
+    assert found == [('blockdevice', config.environments.ec2_yum_linux.blockdevice)]
+    assert Runner.started[0].concurrency == 2
+
+
+def test_report(config, manifest, runner):
+    bake = BatchBake(config, manifest, concurrency=1)
+    bake.run()
+    lines = bake.report().splitlines()
+
+    assert lines[0].split() == ['PACKAGE', 'STATUS', 'RC', 'SECONDS', 'AMI']
+    assert lines[1].split() == ['mypkg', 'succeeded', '0', '0.0', 'ami-1', 'mypkg-ebs']
+    assert lines[2].split() == ['otherpkg', 'succeeded', '0', '0.0', 'ami-2', 'otherpkg-ebs']
+    assert lines[3].split()[:3] == ['failingpkg', 'failed', '1'] and lines[3].split()[-1] == '-'
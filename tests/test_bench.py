@@ -0,0 +1,138 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_bench
+================
+The bake benchmark: stage timings from bake timelines, baseline comparison and
+repeated bakes through a stand-in runner
+"""
+import os
+import shutil
+import subprocess
+
+import pytest
+from bunch import Bunch
+
+from gator import bench
+from gator.bench import Benchmark, build_fixture, compare, report, stage_durations
+from gator.util import trace
+
+
+def _timeline(durations):
+    """ a bake timeline with one span per stage, back to back """
+    timeline = trace.Timeline()
+    start = timeline.start
+    for name, seconds in durations:
+        timeline.add(name, 'stage', start, start + seconds)
+        start += seconds
+    return timeline
+
+
+def _results(**medians):
+    return {'stages': {stage: {'median': median} for stage, median in medians.items()}}
+
+
+class _Runner(object):
+    """ stands in for BakeRunner: every bake writes a timeline and succeeds unless told otherwise """
+    submitted = []
+    returncodes = []
+
+    def __init__(self, config, concurrency=None):
+        self.config = config
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def submit(self, argv, environment=None):
+        self.submitted.append((argv, environment, os.path.exists(argv[-1])))
+        returncode = self.returncodes.pop(0) if self.returncodes else 0
+        bake = len(self.submitted)
+        _timeline([('gator.volume.linux.attach.duration', 0.5 * bake),
+                   ('gator.provisioner.yum.provision_package.duration', 2.0)]).write_chrome_trace(
+            os.path.join(self.config.trace.directory, 'bake{0}.trace.json'.format(bake)))
+        return Bunch(wait=lambda: None, returncode=returncode, ami_id='ami-{0}'.format(bake))
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(_Runner, 'submitted', [])
+    monkeypatch.setattr(_Runner, 'returncodes', [])
+    monkeypatch.setattr(bench, 'BakeRunner', _Runner)
+    return _Runner
+
+
+def test_stage_durations_from_a_trace():
+    timeline = _timeline([('gator.volume.linux.attach.duration', 0.25),
+                          ('gator.provisioner.apt.provision_package.duration', 1.0),
+                          ('gator.provisioner.provision_scripts.duration', 0.5),
+                          ('gator.cloud.ec2.client.describe_images', 0.25)])
+
+    assert stage_durations(timeline.to_chrome_trace()) == {'attach': 0.25, 'install': 1.0, 'provision_scripts': 0.5, 'total': 2.0}
+
+
+def test_regressions_need_tolerance_and_noise():
+    baseline = _results(attach=1.0, install=0.1, snapshot=10.0, total=20.0)
+    current = _results(attach=1.5, install=0.14, snapshot=9.0, register=1.0, total=21.0)
+
+    rows, regressions = compare(current, baseline, tolerance=0.1, noise=0.05)
+
+    # install is 40% slower but only by 0.04s; register has no baseline
+    assert regressions == ['attach']
+    assert [row[0] for row in rows] == ['attach', 'install', 'snapshot', 'total']
+    assert rows[0] == ('attach', 1.0, 1.5, 0.5, True)
+
+
+def test_report():
+    rows, _ = compare(_results(attach=1.5), _results(attach=1.0))
+
+    assert report(_results(attach=1.5), rows).splitlines() == [
+        'STAGE   BASELINE  CURRENT  CHANGE',
+        'attach  1.000     1.500    +50.0%  REGRESSION',
+    ]
+
+
+def test_runs_are_timed_and_summarized(config, runner, tmp_path, monkeypatch):
+    def fixture(kind, directory, size, files):
+        os.makedirs(directory)
+        package = os.path.join(directory, 'fixture.rpm')
+        open(package, 'w').close()
+        return package
+
+    monkeypatch.setattr(bench, 'build_fixture', fixture)
+    runner.returncodes = [0, 0, 1, 0]
+    benchmark = Benchmark(config, 'local_yum_linux', ['-b', 'base'], 'rpm', 1024, 4, 4, str(tmp_path))
+
+    results = benchmark.run()
+
+    # every bake gets a fresh copy of the package and its own timeline
+    assert [argv[:4] for argv, _, _ in runner.submitted] == [['-b', 'base', '--trace', '-n']] * 4
+    assert all(environment == 'local_yum_linux' and copied for _, environment, copied in runner.submitted)
+    assert [run['stages']['attach'] for run in results['runs']] == [0.5, 1.0, 1.5, 2.0]
+    # the failed bake is left out of the medians
+    assert results['stages']['attach'] == {'median': 1.0, 'min': 0.5, 'max': 2.0}
+    assert results['stages']['install']['median'] == 2.0
+    assert results['fixture'] == {'kind': 'rpm', 'size': 1024, 'files': 4}
+    # the benchmark's own copy of the configuration
+    assert not config.trace.get('enabled')
+
+
+@pytest.mark.skipif(not shutil.which('dpkg-deb'), reason='needs dpkg-deb')
+def test_deb_fixture(tmp_path):
+    package = build_fixture('deb', str(tmp_path / 'fixtures'), 10000, 3)
+
+    contents = subprocess.check_output(['dpkg-deb', '-c', package]).decode()
+    assert contents.count('./opt/gator-bench-fixture/data-') == 3
+    assert './var/local/gator-bench-fixture.sh' in contents
+    assert os.listdir(str(tmp_path / 'fixtures')) == [os.path.basename(package)]
+
+
+def test_unknown_fixture_kind(tmp_path):
+    with pytest.raises(ValueError):
+        build_fixture('tgz', str(tmp_path), 10, 1)
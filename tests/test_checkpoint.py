@@ -0,0 +1,104 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_checkpoint
+=====================
+Per-bake checkpoints for --resume
+"""
+import pytest
+from bunch import Bunch
+
+from gator.checkpoint import Checkpoint
+from gator.config import init_parser
+from gator.exceptions import CheckpointException
+from gator.plugins.finalizer.tagging_s3 import TaggingS3FinalizerPlugin
+
+
+def test_round_trip(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.record('snapshot', ami_name='mypkg-ebs', suffix='202210181200', snapshot_id='snap-1', ami_id=None)
+
+    loaded = Checkpoint.load(str(tmp_path), checkpoint.bake_id)
+    assert loaded.done('snapshot') and not loaded.done('register')
+    assert loaded.state == {'ami_name': 'mypkg-ebs', 'suffix': '202210181200', 'snapshot_id': 'snap-1'}
+
+
+def test_missing_checkpoint(tmp_path):
+    with pytest.raises(CheckpointException):
+        Checkpoint.load(str(tmp_path), 'nosuchbake')
+
+
+def test_corrupt_checkpoint(tmp_path):
+    (tmp_path / 'truncated.json').write_text('{"stages": ["snap')
+    with pytest.raises(CheckpointException, match='corrupt'):
+        Checkpoint.load(str(tmp_path), 'truncated')
+
+
+class _Cloud(object):
+    """ registration fails once, as a throttled or interrupted bake's would """
+    def __init__(self, config):
+        self._config = config
+        self.manifests = []
+
+    def register_image(self, manifest):
+        self.manifests.append(manifest)
+        if len(self.manifests) == 1:
+            return False
+        self._config.context.ami.image = Bunch(id='ami-1', name=self._config.context.ami.name, description='',
+                                               kernel_id=None, ramdisk_id=None, virtualization_type='hvm', tags={})
+        return True
+
+    def checkpoint_state(self):
+        return {'ami_id': 'ami-1'} if 'image' in self._config.context.ami else {}
+
+    def add_tags(self, *resources):
+        pass
+
+
+def test_s3_bake_resumes_after_upload(config, tmp_path):
+    config.metrics = Bunch(timer=lambda name, duration: None, increment=lambda name, value=1: None)
+    config.checkpoint = Checkpoint(str(tmp_path / 'checkpoints'))
+    config.context.package.attributes = {'name': 'mypkg', 'version': '1.0', 'release': '1'}
+    config.context.base_ami = Bunch(id='ami-base', name='base', architecture='x86_64', tags={})
+    config.context.ami.bucket = 'images'
+    finalizer = TaggingS3FinalizerPlugin()
+    finalizer.configure(config, init_parser(config, argv=[]))
+    cloud = _Cloud(config)
+    steps = []
+    for step in ('copy_volume', 'bundle_image', 'upload_bundle'):
+        setattr(finalizer, '_' + step, lambda step=step: steps.append(step) or Bunch(success=True))
+
+    assert not finalizer(cloud).finalize()
+    ami_name = config.context.ami.name
+    # a resumed bake starts from a fresh configuration and plugin
+    config.checkpoint = Checkpoint.load(str(tmp_path / 'checkpoints'), config.checkpoint.bake_id)
+    config.context.ami = Bunch(bucket='images', tags=Bunch(), suffix=config.checkpoint.state['suffix'])
+    finalizer = TaggingS3FinalizerPlugin()
+    finalizer.configure(config, init_parser(config, argv=[]))
+    for step in ('copy_volume', 'bundle_image', 'upload_bundle'):
+        setattr(finalizer, '_' + step, lambda step=step: steps.append(step) or Bunch(success=True))
+
+    assert finalizer(cloud).finalize()
+
+    assert steps == ['copy_volume', 'bundle_image', 'upload_bundle']
+    assert cloud.manifests[0] == cloud.manifests[1] and cloud.manifests[0].startswith('images/{0}-'.format(ami_name))
+    assert config.context.ami.name == ami_name
+    assert config.checkpoint.done('register') and config.checkpoint.state['ami_id'] == 'ami-1'
+
+
+def test_resumed_bake_keeps_the_images_creation_time(config):
+    finalizer = TaggingS3FinalizerPlugin()
+    finalizer.configure(config, init_parser(config, argv=[]))
+    config.context.ami.tags = Bunch()
+    finalizer._stamp_creation_time()
+    assert config.context.ami.tags.creation_time.endswith(' UTC')
+
+    # a resumed bake restores the registered image, which carries the tag from registration
+    config.context.ami.tags = Bunch()
+    config.context.ami.image = Bunch(id='ami-1', tags={'creation_time': '2022-10-01 00:00:00 UTC'})
+    finalizer._stamp_creation_time()
+    assert config.context.ami.tags.creation_time == '2022-10-01 00:00:00 UTC'
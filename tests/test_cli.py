@@ -0,0 +1,25 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_cli
+==============
+Command dispatch
+"""
+import sys
+
+from gator import cli
+from gator.util import trace
+
+
+def test_startup_profile_is_reported_before_a_command(monkeypatch, capsys):
+    active = []
+    monkeypatch.setattr(sys, 'argv', ['gator', '--profile-startup', 'batch', 'manifest.yml'])
+    monkeypatch.setattr(cli, 'batch', lambda: active.append(trace.active()) or 0)
+
+    assert cli.run() == 0
+    assert active == [None]
+    assert 'MODULE' in capsys.readouterr().err
@@ -0,0 +1,86 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_cloud_async
+======================
+Bakes driven from one event loop through the EC2 plugin's coroutines, against stubbed
+EC2 clients
+"""
+import asyncio
+from copy import deepcopy
+
+import pytest
+from bunch import Bunch
+
+from gator.config import init_parser
+from gator.util import trace
+
+from conftest import StubClient
+
+ClientError = pytest.importorskip('botocore.exceptions').ClientError
+
+
+def _bake_config(cloud, config, name, metrics):
+    """ the configuration of one bake, as the daemon prepares it """
+    bake_config = deepcopy(config)
+    parser = init_parser(bake_config, argv=['-B', 'ami-base', 'mypkg'])
+    cloud.configure(bake_config, parser)
+    parser.parse_args()
+    bake_config.context.ami.update(name=name, description=name, vm_type='hvm')
+    bake_config.metrics = metrics
+    return bake_config
+
+
+def test_two_bakes_on_one_loop(cloud, config, clients):
+    metrics = {'a': object(), 'b': object()}
+
+    async def bake(name):
+        with trace.recording(trace.Timeline()) as timeline:
+            async with cloud.for_bake(_bake_config(cloud, config, name, metrics[name])) as plugin:
+                plugin._volume = Bunch(id='vol-{0}'.format(name))
+                assert await plugin.snapshot_volume_async()
+                assert await plugin.register_image_async(manifest='s3://images/{0}'.format(name))
+        return plugin, timeline
+
+    async def bakes():
+        return await asyncio.gather(bake('a'), bake('b'))
+
+    (a, timeline_a), (b, timeline_b) = asyncio.run(bakes())
+
+    assert (a._snapshot.volume_id, b._snapshot.volume_id) == ('vol-a', 'vol-b')
+    assert (a._ami.name, b._ami.name) == ('a', 'b')
+    assert a._config.context.ami.image is a._ami and b._config.context.ami.image is b._ami
+    calls = clients['us-west-2'].calls
+    assert [metrics_ for operation, params, metrics_, _ in calls if operation == 'create_snapshot'] in (
+        [metrics['a'], metrics['b']], [metrics['b'], metrics['a']])
+    for operation, params, metrics_, timeline in calls:
+        if operation == 'describe_images' and 'Filters' in params:
+            assert params['Owners'] == ['self']
+        if operation == 'register_image':
+            assert (metrics_, timeline) == (metrics[params['Name']], {'a': timeline_a, 'b': timeline_b}[params['Name']])
+    for plugin, timeline in ((a, timeline_a), (b, timeline_b)):
+        waits = dict((event['name'], event['args']['resource']) for event in timeline.events if event['cat'] == trace.WAIT)
+        assert waits == {'poll snapshot_completed': plugin._snapshot.id, 'poll image_available': plugin._ami.id}
+
+
+def test_registration_gives_up_without_a_last_sleep(cloud, config, clients, monkeypatch):
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    client = clients['us-west-2'] = StubClient('us-west-2')
+    client.errors['register_image'] = [ClientError({'Error': {'Code': 'RequestLimitExceeded'}}, 'RegisterImage')
+                                       for _ in range(3)]
+    plugin = cloud.for_bake(_bake_config(cloud, config, 'a', None))
+    plugin.__enter__()
+    plugin.resolve_base_ami()
+
+    assert asyncio.run(plugin.register_image_async(manifest='s3://images/a')) is False
+    assert len([call for call in client.calls if call[0] == 'register_image']) == 3
+    assert len(sleeps) == 2
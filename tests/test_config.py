@@ -0,0 +1,47 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_config
+=================
+The pickled configuration cache
+"""
+import os
+
+from gator.config import Config, ConfigCache, config_cache
+
+
+def _cache(tmp_path, *sources):
+    cache = ConfigCache(str(tmp_path / 'cache' / 'config.cache'))
+    cache.put('plugin', sources, cache.fingerprint(sources), Config(value=1))
+    return ConfigCache(cache.filename)
+
+
+def test_entry_matches_its_sources_only(tmp_path):
+    first, second = str(tmp_path / 'first.yml'), str(tmp_path / 'second.yml')
+    cache = _cache(tmp_path, first)
+
+    assert cache.get('plugin', (first,)) == {'value': 1}
+    assert cache.get('plugin', (second,)) is None
+    assert cache.get('plugin', (first, second)) is None
+
+
+def test_cache_is_private(tmp_path):
+    source = str(tmp_path / 'plugin.yml')
+    cache = _cache(tmp_path, source)
+
+    assert os.stat(os.path.dirname(cache.filename)).st_mode & 0o777 == 0o700
+    assert os.stat(cache.filename).st_mode & 0o777 == 0o600
+    os.chmod(os.path.dirname(cache.filename), 0o777)
+    assert ConfigCache(cache.filename).get('plugin', (source,)) is None
+
+
+def test_cache_follows_aminator_root(config, tmp_path):
+    assert config_cache(config).filename == str(tmp_path / 'config-cache' / 'config.cache')
+    assert config_cache(config) is config_cache(config)
+
+    config.config_cache = str(tmp_path / 'elsewhere' / 'config.cache')
+    assert config_cache(config).filename == config.config_cache
@@ -0,0 +1,55 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_daemon
+=================
+Bake job preparation in the daemon process, against a stubbed EC2 client
+"""
+from bunch import Bunch
+
+from gator.daemon import BakeRunner
+from gator.plugins.cloud.ec2 import EC2CloudPlugin
+
+
+class Aminator(object):
+    """ the parts of gator.core.Aminator job preparation uses, around one shared cloud plugin """
+    cloud = EC2CloudPlugin()
+
+    def __init__(self, config, parser, envname=None, plugin_manager=None):
+        self.config = config
+        self.plugin_manager = plugin_manager
+        self.cloud.configure(config, parser)
+        parser.parse_args()
+        self.environment = lambda config, plugin_manager: Bunch(cloud=self.cloud)
+
+
+def test_prepare_before_metrics(config, clients):
+    runner = BakeRunner(config, concurrency=1, aminator=Aminator)
+    aminator = runner._prepare(runner.submit(['-B', 'ami-12345678', '-r', 'us-west-2', 'mypkg']))
+
+    assert 'metrics' not in aminator.config
+    assert aminator.config.context.base_ami.id == 'ami-12345678'
+    assert [call[0] for call in clients['us-west-2'].calls] == ['describe_images']
+
+
+def test_prepare_connects_per_job(config, clients):
+    runner = BakeRunner(config, concurrency=1, aminator=Aminator)
+    for region in ('us-west-2', 'eu-west-1'):
+        runner._prepare(runner.submit(['-B', 'ami-12345678', '-r', region, 'mypkg']))
+        assert Aminator.cloud._region == region
+        assert Aminator.cloud._connection is clients[region]
+    assert sorted(clients) == ['eu-west-1', 'us-west-2']
+
+
+def test_finished_jobs_expire(config):
+    config.daemon.finished_jobs = 2
+    runner = BakeRunner(config, concurrency=1)
+    jobs = [runner.submit(['mypkg']) for _ in range(4)]
+    for job in jobs:
+        job.finish(0)
+
+    assert runner.jobs() == jobs[2:]
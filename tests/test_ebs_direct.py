@@ -0,0 +1,81 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_ebs_direct
+=====================
+The EBS direct cloud: its share of the site's EC2 settings, and a snapshot baked
+block by block through EBSDirectStub
+"""
+import os
+
+import pytest
+from bunch import Bunch
+
+from gator.config import init_parser
+from gator.plugins.cloud import ec2
+from gator.plugins.cloud.ebs_direct import BLOCK_SIZE, EBSDirectCloudPlugin, EBSDirectStub
+
+
+def _plugin(config):
+    plugin = EBSDirectCloudPlugin()
+    plugin.configure(config, init_parser(config, argv=[]))
+    return plugin
+
+
+def test_site_ec2_overrides_apply(config, tmp_path):
+    config.plugins.config_root = str(tmp_path / 'plugins')
+    os.makedirs(config.plugins.config_root)
+    with open(os.path.join(config.plugins.config_root, 'gator.plugins.cloud.ec2.yml'), 'w') as f:
+        f.write('polling:\n  max_interval: 7\n')
+    with open(os.path.join(config.plugins.config_root, 'gator.plugins.cloud.ebs_direct.yml'), 'w') as f:
+        f.write('workers: 3\n')
+
+    plugin_config = _plugin(config).plugin_config
+
+    assert plugin_config.polling.max_interval == 7
+    assert plugin_config.workers == 3
+    # the packaged EC2 defaults still fill in what neither file sets
+    assert 'min_interval' in plugin_config.polling
+
+
+def test_snapshot_holds_changed_blocks_only(config, tmp_path, monkeypatch):
+    pytest.importorskip('boto3')
+    for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(key, 'stub')
+    monkeypatch.setattr(ec2, '_clients', {})
+    monkeypatch.setattr(ec2, '_rate_limiter', None)
+    config.metrics = Bunch(timer=lambda name, duration: None, increment=lambda name, value=1: None)
+
+    base = tmp_path / 'base.img'
+    with open(str(base), 'wb') as f:
+        f.write(b'\1' * BLOCK_SIZE)
+        f.seek(3 * BLOCK_SIZE)
+        f.write(b'\2' * BLOCK_SIZE)
+        f.truncate(8 * BLOCK_SIZE)
+
+    with EBSDirectStub() as stub:
+        parent = stub.seed(str(base), volume_size=1)
+        plugin = _plugin(config)
+        plugin._region = 'us-west-2'
+        config.context.cloud.update(ebs_direct_endpoint=stub.endpoint, ebs_direct_volume_dir=str(tmp_path / 'volumes'))
+        config.context.base_ami = Bunch(root_device_name='/dev/sda1', block_device_mapping={
+            '/dev/sda1': Bunch(size=1, snapshot_id=parent)})
+
+        plugin.allocate_base_volume()
+        with open(plugin._volume.path, 'r+b') as f:
+            assert f.read(BLOCK_SIZE) == b'\1' * BLOCK_SIZE
+            f.seek(3 * BLOCK_SIZE)
+            f.write(b'\3' * BLOCK_SIZE)
+            f.seek(5 * BLOCK_SIZE)
+            f.write(b'\4' * BLOCK_SIZE)
+        assert plugin.snapshot_volume(description='child')
+
+        child = stub.snapshots[plugin._snapshot.id]
+        assert (child['parent'], child['status']) == (parent, 'completed')
+        assert child['changed'] == {3, 5}
+        assert stub.blocks(plugin._snapshot.id) == {0: b'\1' * BLOCK_SIZE, 3: b'\3' * BLOCK_SIZE, 5: b'\4' * BLOCK_SIZE}
+        assert plugin.delete_volume() and not os.path.exists(plugin._volume.path)
@@ -0,0 +1,133 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_ec2
+==============
+The EC2 cloud plugin's blocking operations, against stubbed EC2 clients
+"""
+import pytest
+from bunch import Bunch
+
+from conftest import StubClient
+from gator.config import init_parser
+from gator.plugins.cloud import ec2
+
+pytest.importorskip('botocore.exceptions')
+
+
+def test_replicas_copy_from_the_registration_region(cloud, config, clients):
+    config.metrics = Bunch(timer=lambda name, duration: None)
+    cloud.connect()
+    source = clients['eu-west-1'] = StubClient('eu-west-1')
+    source.images['ami-1'] = {'ImageId': 'ami-1', 'Name': 'mypkg', 'State': 'available'}
+    cloud.restore({'ami_id': 'ami-1', 'ami_region': 'eu-west-1'})
+
+    replicas = cloud.replicate_image(['us-east-1', 'ap-south-1'])
+
+    assert sorted(replicas) == ['ap-south-1', 'us-east-1']
+    assert cloud.checkpoint_state() == {'ami_id': 'ami-1', 'ami_region': 'eu-west-1'}
+    for region, image_id in replicas.items():
+        calls = [(operation, params) for operation, params, _, _ in clients[region].calls]
+        assert calls[0][0] == 'copy_image' and calls[0][1]['SourceRegion'] == 'eu-west-1'
+        # waited on through the region's state poller, not by image id
+        assert [params['Filters'][0]['Values'] for operation, params in calls[1:]] == [[image_id]]
+
+
+def _allocating(cloud, config):
+    config.metrics = Bunch(timer=lambda name, duration: None, start_timer=lambda name: None, stop_timer=lambda name: None)
+    config.context.base_ami = Bunch(id='ami-base', name='base', architecture='x86_64', root_device_name='/dev/sda1',
+                                    block_device_mapping={'/dev/sda1': Bunch(size=8, snapshot_id='snap-base')})
+    cloud.connect()
+    cloud._instance = Bunch(id='i-1234', placement='us-west-2a')
+
+
+def test_allocated_volume_is_attached_not_reallocated(cloud, config, clients, monkeypatch):
+    _allocating(cloud, config)
+    monkeypatch.setattr(cloud, 'is_volume_attached', lambda blockdevice: True)
+
+    with cloud.allocated_volume() as allocated:
+        assert allocated
+        cloud.attach_volume('/dev/xvdf')
+
+    operations = [operation for operation, _, _, _ in clients['us-west-2'].calls]
+    assert operations.count('create_volume') == 1 and 'delete_volume' not in operations
+    assert clients['us-west-2'].volumes[cloud._volume.id]['State'] == 'in-use'
+
+
+def test_unattached_volume_is_deleted(cloud, config, clients):
+    _allocating(cloud, config)
+
+    with pytest.raises(RuntimeError):
+        with cloud.allocated_volume():
+            raise RuntimeError('no block device')
+
+    assert clients['us-west-2'].volumes == {}
+
+
+def test_pooled_volumes_are_not_allocated_ahead(cloud, config, clients):
+    _allocating(cloud, config)
+    config.context.cloud.volume_pool = True
+
+    with cloud.allocated_volume() as allocated:
+        assert not allocated
+    assert 'us-west-2' not in clients
+
+
+def test_configure_skips_instance_metadata_without_web_logs(config, monkeypatch):
+    lookups = []
+    monkeypatch.setattr(ec2, 'instance_metadata', lambda: lookups.append(1) or Bunch(hostname='build-1'))
+    ec2.EC2CloudPlugin().configure(config, init_parser(config, argv=[]))
+    assert not lookups and 'host' not in config.context.web_log
+
+    config.logging.gator.web_log_url_template = 'http://{host}/log/{logfile}'
+    ec2.EC2CloudPlugin().configure(config, init_parser(config, argv=[]))
+    assert config.context.web_log.host == 'build-1'
+
+
+def _baked(cloud, config, clients):
+    """ allocate, snapshot and register; (operation, params) for every call made """
+    _allocating(cloud, config)
+    config.context.base_ami.update(kernel_id=None, ramdisk_id=None)
+    config.context.ami.update(name='mypkg', description='mypkg image', vm_type='hvm')
+    cloud.allocate_base_volume()
+    assert cloud.snapshot_volume()
+    assert cloud.register_image([], '/dev/sda1')
+    return [(operation, params) for operation, params, _, _ in clients['us-west-2'].calls]
+
+
+def test_resources_are_tagged_on_creation(cloud, config, clients):
+    config.context.snapshot.tags = {'name': 'mypkg'}
+    config.context.ami.tags = {'name': 'mypkg', 'creation_time': '2022-10-01 00:00:00 UTC'}
+    calls = _baked(cloud, config, clients)
+
+    assert cloud.add_tags('snapshot', 'ami')
+
+    created = dict((operation, params['TagSpecifications']) for operation, params in calls if 'TagSpecifications' in params)
+    assert [spec['ResourceType'] for specs in created.values() for spec in specs] == ['volume', 'snapshot', 'image']
+    assert created['register_image'][0]['Tags'] == [{'Key': 'name', 'Value': 'mypkg'},
+                                                    {'Key': 'creation_time', 'Value': '2022-10-01 00:00:00 UTC'}]
+    assert cloud._volume.tags['status'] == 'busy' and cloud._ami.tags['name'] == 'mypkg'
+    assert 'create_tags' not in [operation for operation, _, _, _ in clients['us-west-2'].calls]
+
+
+def test_remaining_tags_are_batched(cloud, config, clients):
+    _baked(cloud, config, clients)
+    config.context.snapshot.tags = {'name': 'mypkg'}
+    config.context.ami.tags = {'name': 'mypkg'}
+    assert cloud.add_tags('snapshot', 'ami')
+    config.context.ami.tags['creation_time'] = '2022-10-01 00:00:00 UTC'
+    config.context.snapshot.tags['owner'] = 'builds'
+    assert cloud.add_tags('snapshot', 'ami')
+
+    tagged = [(params['Resources'], params['Tags']) for operation, params, _, _ in clients['us-west-2'].calls
+              if operation == 'create_tags']
+    # one call for the shared tags, then one per distinct set of missing tags
+    assert tagged[0] == ([cloud._snapshot.id, cloud._ami.id], [{'Key': 'name', 'Value': 'mypkg'}])
+    assert sorted(tagged[1:]) == [([cloud._ami.id], [{'Key': 'creation_time', 'Value': '2022-10-01 00:00:00 UTC'}]),
+                                  ([cloud._snapshot.id], [{'Key': 'owner', 'Value': 'builds'}])]
+    assert cloud._snapshot.tags == {'name': 'mypkg', 'owner': 'builds'}
+    assert clients['us-west-2'].images[cloud._ami.id]['Tags'][-1] == {'Key': 'creation_time', 'Value': '2022-10-01 00:00:00 UTC'}
@@ -0,0 +1,135 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_environment
+======================
+Package prefetch as a bake stage, and the order the bake's stages run in
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from gator.config import init_parser
+from gator.environment import Environment
+from gator.plugins.cloud.base import BaseCloudPlugin
+from gator.plugins.provisioner import base
+from gator.plugins.provisioner.yum import YumProvisionerPlugin
+
+
+@pytest.fixture
+def environment(config, monkeypatch):
+    def download_file(url, dst, timeout=1, verify_https=False):
+        with open(dst, 'wb') as package:
+            package.write(b'rpm')
+        return True
+
+    monkeypatch.setattr(base, 'download_file', download_file)
+    provisioner = YumProvisionerPlugin()
+    provisioner.configure(config, init_parser(config, argv=[]))
+    config.context.package.arg = 'http://packages.example.com/mypkg.rpm'
+    environment = Environment()
+    environment.provisioner = provisioner
+    return environment
+
+
+def test_prefetch_directory_is_removed_on_unwind(config, environment):
+    with environment._prefetch(None) as success:
+        assert success
+        assert open(config.context.package.arg, 'rb').read() == b'rpm'
+        prefetch_dir = os.path.dirname(config.context.package.arg)
+    assert not os.path.exists(prefetch_dir)
+    assert os.listdir(os.path.join(config.aminator_root, 'downloads')) == []
+
+
+def test_failed_prefetch_leaves_no_directory(config, environment, monkeypatch):
+    monkeypatch.setattr(base, 'download_file', lambda *args, **kwargs: False)
+    with environment._prefetch(None) as success:
+        assert not success
+    assert os.listdir(os.path.join(config.aminator_root, 'downloads')) == []
+
+
+class _Plugin(object):
+    """ a context manager plugin recording when it is entered and exited """
+    def __init__(self, name, events, fail=False):
+        self._name = name
+        self._events = events
+        self._fail = fail
+
+    def __call__(self, *args):
+        return self
+
+    def __enter__(self):
+        self._events.append('{0} entered'.format(self._name))
+        if self._fail:
+            raise RuntimeError('{0} failed'.format(self._name))
+        return self
+
+    def __exit__(self, typ, val, trc):
+        self._events.append('{0} exited'.format(self._name))
+        return False
+
+
+class _Cloud(_Plugin):
+    def __init__(self, events):
+        super(_Cloud, self).__init__('cloud', events)
+        self.resolved = threading.Event()
+
+    def __enter__(self):
+        # deadlocks unless the base AMI is resolved alongside
+        assert self.resolved.wait(5)
+        return super(_Cloud, self).__enter__()
+
+    def resolve_base_ami(self):
+        self._events.append('base ami resolved')
+        self.resolved.set()
+
+    @contextmanager
+    def allocated_volume(self, tag=True):
+        self._events.append('volume allocated')
+        try:
+            yield True
+        finally:
+            self._events.append('allocation released')
+
+    checkpoint_state = BaseCloudPlugin.checkpoint_state
+
+
+def _bake(config, environment, volume_fails=False):
+    events = []
+    environment._config = config
+    environment.metrics = _Plugin('metrics', events)
+    environment.cloud = _Cloud(events)
+    environment.finalizer = _Plugin('finalizer', events)
+    environment.finalizer.finalize = lambda: True
+    environment.volume = _Plugin('volume', events, fail=volume_fails)
+    environment.blockdevice = None
+    environment.distro = _Plugin('distro', events)
+    environment.provisioner.provision = lambda: True
+    config.context.package.attributes = {}
+    return events
+
+
+def test_volume_is_allocated_once_base_ami_is_known(config, environment):
+    events = _bake(config, environment)
+
+    assert environment.provision()
+
+    assert events.index('volume allocated') > max(events.index('base ami resolved'), events.index('cloud entered'))
+    assert events.index('volume allocated') < events.index('volume entered')
+    # unwound like nested with blocks: the volume plugin gives up the volume first
+    assert events.index('volume exited') < events.index('allocation released') < events.index('cloud exited')
+
+
+def test_allocation_is_released_when_volume_setup_fails(config, environment):
+    events = _bake(config, environment, volume_fails=True)
+
+    with pytest.raises(RuntimeError):
+        environment.provision()
+
+    assert 'allocation released' in events and 'volume exited' not in events
@@ -0,0 +1,134 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_hydrate
+==================
+Volume hydration: the extents read from dumpe2fs output, and the readers, against a
+temporary file
+"""
+import os
+import threading
+
+import pytest
+from bunch import Bunch
+
+from gator.util import hydrate
+from gator.util.hydrate import Hydrator, _complement, used_extents
+
+DUMPE2FS = b"""Filesystem volume name:   <none>
+Block count:              64
+Block size:               1024
+Group 0: (Blocks 1-32)
+  Free blocks: 10-19, 25
+Group 1: (Blocks 33-63)
+  Free blocks: 40-63
+"""
+
+
+class _Metrics(object):
+    def __init__(self):
+        self.gauges = []
+        self.increments = []
+        self.timers = []
+
+    def gauge(self, name, value):
+        self.gauges.append((name, value))
+
+    def increment(self, name, value=1):
+        self.increments.append((name, value))
+
+    def timer(self, name, duration):
+        self.timers.append(name)
+
+
+def _command(success, std_out=b'', std_err=b''):
+    return Bunch(success=success, result=Bunch(std_out=std_out, std_err=std_err))
+
+
+@pytest.fixture
+def dev(tmp_path):
+    path = str(tmp_path / 'volume.img')
+    with open(path, 'wb') as f:
+        f.truncate(64 * 1024)
+    return path
+
+
+def test_complement():
+    assert _complement([(10, 5), (12, 8), (30, 10)], 50) == [(0, 10), (20, 10), (40, 10)]
+    assert _complement([(0, 50)], 50) == []
+    assert _complement([], 50) == [(0, 50)]
+
+
+def test_used_extents_from_free_blocks(monkeypatch):
+    monkeypatch.setattr(hydrate, 'monitor_command', lambda cmd: _command(True, DUMPE2FS))
+
+    assert used_extents('/dev/xvdf') == [(0, 10 * 1024), (20 * 1024, 5 * 1024), (26 * 1024, 14 * 1024)]
+
+
+def test_used_extents_without_a_filesystem(monkeypatch):
+    monkeypatch.setattr(hydrate, 'monitor_command', lambda cmd: _command(False, std_err=b'Bad magic number'))
+
+    assert used_extents('/dev/xvdf') is None
+
+
+def test_used_extents_first_then_the_rest(dev, monkeypatch):
+    monkeypatch.setattr(hydrate, 'used_extents', lambda dev: [(0, 8192), (32768, 8192), (65536, 8192)])
+
+    # the filesystem's extents are clipped to the device
+    assert Hydrator(dev).extents() == [(0, 8192), (32768, 8192)]
+    assert Hydrator(dev, full=True).extents() == [(0, 8192), (32768, 8192), (8192, 24576), (40960, 24576)]
+
+
+def test_unreadable_filesystem_reads_the_whole_device(dev, monkeypatch):
+    monkeypatch.setattr(hydrate, 'used_extents', lambda dev: None)
+
+    assert Hydrator(dev).extents() == [(0, 64 * 1024)]
+
+
+def test_chunks_and_progress(dev, monkeypatch):
+    monkeypatch.setattr(hydrate, 'used_extents', lambda dev: None)
+    reads = []
+    pread = os.pread
+
+    def recorded(fd, length, offset):
+        reads.append((offset, length))
+        return pread(fd, length, offset)
+
+    monkeypatch.setattr(os, 'pread', recorded)
+    metrics = _Metrics()
+
+    assert Hydrator(dev, workers=4, chunk_size=6400, metrics=metrics, metric_prefix='hydrate').run() == 64 * 1024
+
+    assert sorted(reads) == [(offset, min(6400, 65536 - offset)) for offset in range(0, 65536, 6400)]
+    progress = [value for name, value in metrics.gauges if name == 'hydrate.progress']
+    assert sorted(progress) == [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+    assert metrics.increments == [('hydrate.bytes', 64 * 1024)]
+    assert metrics.timers == ['hydrate.duration'] and metrics.gauges[-1][0] == 'hydrate.throughput'
+
+
+def test_stop_abandons_remaining_reads(dev, monkeypatch):
+    monkeypatch.setattr(hydrate, 'used_extents', lambda dev: None)
+    reading, release = threading.Event(), threading.Event()
+    pread = os.pread
+
+    def blocking(fd, length, offset):
+        reading.set()
+        assert release.wait(5)
+        return pread(fd, length, offset)
+
+    monkeypatch.setattr(os, 'pread', blocking)
+    hydrator = Hydrator(dev, workers=1, chunk_size=4096).start()
+    assert reading.wait(5)
+
+    stopper = threading.Thread(target=hydrator.stop)
+    stopper.start()
+    assert hydrator._stopped.wait(5)
+    release.set()
+    stopper.join(5)
+
+    # only the read in flight when stop() was called finished
+    assert hydrator.wait() == 4096 and hydrator.total == 64 * 1024
@@ -0,0 +1,105 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_image_cache
+======================
+The base AMI catalog shared by gator processes
+"""
+import multiprocessing
+
+from gator.plugins.cloud import image_cache
+from gator.plugins.cloud.image_cache import ImageCache
+
+
+def _image(image_id, name, date):
+    return {'ImageId': image_id, 'Name': name, 'CreationDate': date}
+
+
+class _Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _put_images(filename, worker, count):
+    cache = ImageCache(filename)
+    for index in range(count):
+        cache.put('us-west-2', [_image('ami-{0}-{1}'.format(worker, index), 'base-{0}-{1}'.format(worker, index),
+                                       '2022-10-01T00:00:00.000Z')])
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'image-cache.db')
+    clock = _Clock()
+    monkeypatch.setattr(image_cache, 'time', clock)
+    cache = ImageCache(filename, ttl=60)
+    cache.put('us-west-2', [_image('ami-1', 'base', '2022-10-01T00:00:00.000Z')])
+
+    clock.now += 59
+    # the in-memory tier and a process that only has the file both still hold it
+    assert cache.get_by_id('us-west-2', 'ami-1')['ImageId'] == 'ami-1'
+    assert ImageCache(filename, ttl=60).get_by_name('us-west-2', 'base')['ImageId'] == 'ami-1'
+
+    clock.now += 2
+    assert cache.get_by_id('us-west-2', 'ami-1') is None
+    assert cache.get_by_name('us-west-2', 'base') is None
+    assert ImageCache(filename, ttl=60).get_by_id('us-west-2', 'ami-1') is None
+
+
+def test_name_resolves_to_newest_image(tmp_path):
+    cache = ImageCache(str(tmp_path / 'image-cache.db'))
+    cache.put('us-west-2', [_image('ami-2', 'base', '2022-10-17T00:00:00.000Z'),
+                            _image('ami-1', 'base', '2022-10-01T00:00:00.000Z')])
+
+    assert cache.get_by_name('us-west-2', 'base')['ImageId'] == 'ami-2'
+    assert ImageCache(cache._filename).get_by_name('us-west-2', 'base')['ImageId'] == 'ami-2'
+    assert cache.get_by_name('us-east-1', 'base') is None
+
+
+def test_processes_write_concurrently(tmp_path):
+    filename = str(tmp_path / 'image-cache.db')
+    # created before the workers fork, as the daemon's cache is
+    parent = ImageCache(filename)
+    parent.put('us-west-2', [_image('ami-parent', 'parent', '2022-10-01T00:00:00.000Z')])
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_put_images, args=(filename, worker, 20)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    assert [worker.exitcode for worker in workers] == [0] * 4
+
+    reader = ImageCache(filename)
+    assert all(reader.get_by_id('us-west-2', 'ami-{0}-{1}'.format(worker, index)) is not None
+               for worker in range(4) for index in range(20))
+    assert parent.get_by_name('us-west-2', 'base-3-19')['ImageId'] == 'ami-3-19'
+
+
+def test_catalog_refreshed_by_another_process(tmp_path):
+    filename = str(tmp_path / 'image-cache.db')
+    # two processes sharing the cache file, one of them long-lived
+    refresher, daemon = ImageCache(filename), ImageCache(filename, refresh=0)
+    refresher.update_catalog('us-west-2', '123', [_image('ami-1', 'base-1', '2022-10-01T00:00:00.000Z')], full=True)
+    assert [image['ImageId'] for image in daemon.find('us-west-2', '123', 'base-*')] == ['ami-1']
+
+    refresher.update_catalog('us-west-2', '123', [_image('ami-2', 'base-2', '2022-10-17T00:00:00.000Z')])
+
+    assert daemon.catalog_status('us-west-2', '123') == refresher.catalog_status('us-west-2', '123')
+    assert [image['ImageId'] for image in daemon.find('us-west-2', '123', 'base-*')] == ['ami-2', 'ami-1']
+
+
+def test_catalog_status_is_kept_until_refresh(tmp_path):
+    filename = str(tmp_path / 'image-cache.db')
+    refresher, daemon = ImageCache(filename), ImageCache(filename)
+    refresher.update_catalog('us-west-2', '123', [_image('ami-1', 'base-1', '2022-10-01T00:00:00.000Z')], full=True)
+    status = daemon.catalog_status('us-west-2', '123')
+
+    refresher.update_catalog('us-west-2', '123', [_image('ami-2', 'base-2', '2022-10-17T00:00:00.000Z')])
+
+    assert daemon.catalog_status('us-west-2', '123') is status
@@ -0,0 +1,74 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_imds
+===============
+The instance metadata client, against a MetadataStub
+"""
+import pytest
+
+from gator.util.imds import TOKEN_PATH, InstanceMetadata, MetadataStub
+
+METADATA = {'instance-id': 'i-0123', 'local-ipv4': '10.0.0.1', 'placement': {'availability-zone': 'us-east-1a'}}
+
+
+@pytest.fixture
+def stub():
+    with MetadataStub(METADATA) as stub:
+        yield stub
+
+
+def _puts(stub):
+    return [path for method, path in stub.requests if method == 'PUT']
+
+
+def test_one_token_for_every_key(stub):
+    metadata = InstanceMetadata(endpoint=stub.endpoint)
+
+    assert (metadata.instance_id, metadata.availability_zone) == ('i-0123', 'us-east-1a')
+    assert _puts(stub) == [TOKEN_PATH]
+
+
+def test_values_are_cached_per_key(stub):
+    metadata = InstanceMetadata(endpoint=stub.endpoint)
+
+    assert metadata.instance_id == metadata.instance_id == 'i-0123'
+    assert metadata.get('no-such-key', 'default') == metadata.get('no-such-key', 'default') == 'default'
+    assert [path for method, path in stub.requests if method == 'GET'] == [
+        '/latest/meta-data/instance-id', '/latest/meta-data/no-such-key']
+
+
+def test_token_renewed_after_401(stub):
+    metadata = InstanceMetadata(endpoint=stub.endpoint)
+    assert metadata.instance_id == 'i-0123'
+
+    stub.revoke_tokens()
+
+    assert metadata.hostname == '10.0.0.1'
+    assert _puts(stub) == [TOKEN_PATH, TOKEN_PATH]
+
+
+def test_token_renewed_before_it_expires(stub):
+    # renewed a minute before it expires, so a 30 second token is renewed for every key
+    metadata = InstanceMetadata(endpoint=stub.endpoint, token_ttl=30)
+
+    assert metadata.instance_id and metadata.availability_zone
+    assert _puts(stub) == [TOKEN_PATH, TOKEN_PATH]
+
+
+def test_imdsv1_fallback():
+    with MetadataStub(METADATA, issues_tokens=False) as stub:
+        metadata = InstanceMetadata(endpoint=stub.endpoint)
+
+        assert (metadata.instance_id, metadata.region) == ('i-0123', 'us-east-1')
+        # no token is asked for again
+        assert _puts(stub) == [TOKEN_PATH]
+
+
+def test_region_without_placement():
+    with MetadataStub({'instance-id': 'i-0123'}) as stub:
+        assert InstanceMetadata(endpoint=stub.endpoint).region is None
@@ -0,0 +1,156 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_instrumentation
+==========================
+Per-operation API metrics and rate limiting from botocore client events, against
+stubbed responses and a local endpoint that throttles
+"""
+import contextvars
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from gator.plugins.cloud.instrumentation import ClientInstrumentation, ClientRateLimit, bake_metrics
+from gator.util import trace
+
+stub = pytest.importorskip('botocore.stub')
+from botocore.config import Config  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+from botocore.session import get_session  # noqa: E402
+
+METRIC = 'gator.cloud.ec2.client.describe_images'
+THROTTLED = (b'<?xml version="1.0" encoding="UTF-8"?><Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+             b'<Message>Request limit exceeded.</Message></Error></Errors><RequestID>1</RequestID></Response>')
+IMAGES = (b'<?xml version="1.0" encoding="UTF-8"?><DescribeImagesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+          b'<requestId>2</requestId><imagesSet/></DescribeImagesResponse>')
+
+
+class _Metrics(object):
+    def __init__(self):
+        self.increments = []
+        self.timers = []
+
+    def increment(self, name, value=1):
+        self.increments.append((name, value))
+
+    def timer(self, name, duration):
+        self.timers.append(name)
+
+
+class _Limiter(object):
+    def __init__(self):
+        self.acquired = []
+        self.throttled_families = []
+
+    def acquire(self, family):
+        self.acquired.append(family)
+
+    def throttled(self, family):
+        self.throttled_families.append(family)
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """ throttles the first request, answers the rest """
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        status, body = (503, THROTTLED) if self.server.requests == 1 else (200, IMAGES)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _client(endpoint_url=None):
+    # botocore binds its backoff jitter when the client is created
+    return get_session().create_client('ec2', region_name='us-west-2', endpoint_url=endpoint_url,
+                                       aws_access_key_id='stub', aws_secret_access_key='stub',
+                                       config=Config(retries={'mode': 'standard', 'max_attempts': 3}))
+
+
+@pytest.fixture
+def throttling_endpoint(monkeypatch):
+    monkeypatch.setattr(random, 'random', lambda: 0.0)
+    server = HTTPServer(('127.0.0.1', 0), _ThrottlingHandler)
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://{0}:{1}'.format(*server.server_address[:2])
+    server.shutdown()
+    server.server_close()
+
+
+def test_calls_and_errors_are_counted():
+    client, metrics = _client(), _Metrics()
+    # registered when the pooled client is created, ahead of the stubber
+    ClientInstrumentation(metrics).register(client)
+    with stub.Stubber(client) as stubber:
+        stubber.add_response('describe_images', {'Images': []})
+        stubber.add_client_error('describe_images', 'InvalidAMIID.Malformed', http_status_code=400)
+
+        client.describe_images(ImageIds=['ami-1'])
+        with pytest.raises(ClientError):
+            client.describe_images(ImageIds=['bad'])
+
+    assert metrics.increments == [(METRIC + '.count', 1), (METRIC + '.error', 1)]
+    assert metrics.timers == [METRIC + '.duration', METRIC + '.duration']
+
+
+def test_retries_and_throttles_are_counted(throttling_endpoint):
+    client, metrics, limiter = _client(throttling_endpoint), _Metrics(), _Limiter()
+    ClientInstrumentation(metrics).register(client)
+    ClientRateLimit(limiter).register(client)
+
+    client.describe_images(ImageIds=['ami-1'])
+
+    assert metrics.increments == [(METRIC + '.throttles', 1), (METRIC + '.count', 1), (METRIC + '.retries', 1)]
+    # every attempt goes through the limiter, and the throttle pauses the family
+    assert limiter.acquired == ['describe', 'describe']
+    assert limiter.throttled_families == ['describe']
+
+
+def test_calls_report_to_the_calling_bake():
+    client, created, calling = _client(), _Metrics(), _Metrics()
+    ClientInstrumentation(created).register(client)
+
+    def bake():
+        bake_metrics.set(calling)
+        with trace.recording(trace.Timeline()) as timeline:
+            client.describe_images(ImageIds=['ami-1'])
+        return timeline
+
+    with stub.Stubber(client) as stubber:
+        stubber.add_response('describe_images', {'Images': []})
+        stubber.add_response('describe_images', {'Images': []})
+        timeline = contextvars.copy_context().run(bake)
+        client.describe_images(ImageIds=['ami-2'])
+
+    assert calling.increments == [(METRIC + '.count', 1)]
+    assert created.increments == [(METRIC + '.count', 1)]
+    assert [(event['name'], event['cat']) for event in timeline.events] == [(METRIC, 'call')]
+
+
+def test_registration_is_idempotent(throttling_endpoint):
+    client, metrics, limiter = _client(throttling_endpoint), _Metrics(), _Limiter()
+    # every plugin sharing the pooled client registers it again
+    for _ in range(2):
+        ClientInstrumentation(metrics).register(client)
+        ClientRateLimit(limiter).register(client)
+
+    client.describe_images(ImageIds=['ami-1'])
+
+    assert metrics.increments == [(METRIC + '.throttles', 1), (METRIC + '.count', 1), (METRIC + '.retries', 1)]
+    assert len(metrics.timers) == 1
+    assert limiter.acquired == ['describe', 'describe'] and limiter.throttled_families == ['describe']
@@ -0,0 +1,140 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_local_cloud
+======================
+The local stand-in cloud, against a catalog in a temporary directory
+"""
+import json
+import os
+import subprocess
+
+import pytest
+
+from gator.config import init_parser
+from gator.plugins.cloud.local import LocalCloudPlugin, import_image
+
+MB = 1024 ** 2
+
+
+def _raw_image(path, data=b'ext4'):
+    with open(str(path), 'wb') as f:
+        f.write(data)
+        f.truncate(MB)
+    return str(path)
+
+
+def _catalog(root, directory, record_id, extension='json'):
+    return os.path.join(root, directory, '{0}.{1}'.format(record_id, extension))
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / 'cloud')
+
+
+@pytest.fixture
+def local(config, root):
+    plugin = LocalCloudPlugin()
+    plugin.configure(config, init_parser(config, argv=[]))
+    config.context.cloud.local_cloud_root = root
+    return plugin
+
+
+def test_import_image(root, tmp_path):
+    image = import_image(root, _raw_image(tmp_path / 'base.img'), 'base')
+
+    assert (image.name, image.size, image.root_device_name) == ('base', 1, '/dev/sda1')
+    assert json.load(open(_catalog(root, 'images', image.id)))['snapshot_id'] == image.snapshot_id
+    with open(_catalog(root, 'snapshots', image.snapshot_id, 'img'), 'rb') as f:
+        assert f.read(4) == b'ext4'
+
+
+def test_base_ami_by_id(config, local, root, tmp_path):
+    image = import_image(root, _raw_image(tmp_path / 'base.img'), 'base')
+    config.context.ami.base_ami_id = image.id
+
+    local.resolve_base_ami()
+
+    assert config.context.base_ami.id == image.id
+
+
+def test_base_ami_newest_by_name(config, local, root, tmp_path):
+    older, newer = [import_image(root, _raw_image(tmp_path / 'base.img'), 'base') for _ in range(2)]
+    record = json.load(open(_catalog(root, 'images', older.id)))
+    record['creation_date'] = '2022-10-01T00:00:00.000Z'
+    with open(_catalog(root, 'images', older.id), 'w') as f:
+        json.dump(record, f)
+    config.context.ami.base_ami_name = 'base'
+
+    local.resolve_base_ami()
+
+    assert config.context.base_ami.id == newer.id
+
+
+def test_missing_base_ami(config, local):
+    config.context.ami.base_ami_name = 'base'
+    with pytest.raises(RuntimeError):
+        local.resolve_base_ami()
+
+
+def test_snapshot_and_registration_are_cataloged(config, local, root, tmp_path):
+    image = import_image(root, _raw_image(tmp_path / 'base.img'), 'base')
+    config.context.ami.update(base_ami_id=image.id, name='mypkg', description='mypkg image')
+    local.resolve_base_ami()
+    local.allocate_base_volume()
+    with open(local._volume.path, 'r+b') as f:
+        f.write(b'mypkg')
+
+    assert local.snapshot_volume()
+    assert local.register_image([], '/dev/sda1')
+    config.context.ami.tags = {'name': 'mypkg'}
+    assert local.add_tags('ami')
+
+    with open(_catalog(root, 'snapshots', local._snapshot.id, 'img'), 'rb') as f:
+        assert f.read(5) == b'mypkg'
+    registered = json.load(open(_catalog(root, 'images', local._ami.id)))
+    assert (registered['name'], registered['snapshot_id'], registered['tags']) == ('mypkg', local._snapshot.id, {'name': 'mypkg'})
+    assert config.context.ami.image is local._ami
+    assert local.delete_volume() and not os.path.exists(local._volume.path)
+
+
+def test_checkpoint_state_restores(config, local, root, tmp_path):
+    image = import_image(root, _raw_image(tmp_path / 'base.img'), 'base')
+    config.context.ami.update(base_ami_id=image.id, name='mypkg', description='mypkg image')
+    local.resolve_base_ami()
+    local.allocate_base_volume()
+    local.snapshot_volume()
+    local.register_image([], '/dev/sda1')
+    state = local.checkpoint_state()
+
+    resumed = LocalCloudPlugin()
+    resumed.configure(config, init_parser(config, argv=[]))
+    resumed.restore(state)
+
+    assert state == {'snapshot_id': local._snapshot.id, 'ami_id': local._ami.id}
+    assert (resumed._snapshot.id, resumed._ami.id) == (local._snapshot.id, local._ami.id)
+    assert resumed.checkpoint_state() == state
+
+
+def test_volume_attaches_as_a_loop_device(config, local, root, tmp_path):
+    if os.geteuid() != 0:
+        pytest.skip('loop devices need root')
+    try:
+        blockdevice = subprocess.check_output(['losetup', '-f'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('no free loop device')
+    image = import_image(root, _raw_image(tmp_path / 'base.img'), 'base')
+    config.context.ami.base_ami_id = image.id
+    local.resolve_base_ami()
+
+    local.attach_volume(blockdevice)
+    try:
+        assert local.is_volume_attached(blockdevice)
+    finally:
+        local.detach_volume(blockdevice)
+    assert not local.is_volume_attached(blockdevice)
@@ -0,0 +1,107 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_plugins
+==================
+Plugin loading: only the plugins an environment names are instantiated and configured,
+through stand-in plugin managers
+"""
+import sys
+import types
+
+import pytest
+from bunch import Bunch
+
+import gator.plugins
+from gator.config import Config
+from gator.plugins import PluginManager
+
+INSTALLED = {
+    'gatortest.widget': ('plain', 'fancy'),
+    'gatortest.metrics': ('logger', 'statsd'),
+}
+
+
+class _Plugin(object):
+    def __init__(self, entry_point, name):
+        self.name = '{0}.{1}'.format(entry_point, name)
+        self.configured = 0
+
+    def configure(self, config, parser):
+        self.configured += 1
+
+
+def _manager(entry_point, instantiated):
+    class Manager(object):
+        """ the NamedExtensionManager interface PluginManager uses """
+        def __init__(self, names):
+            self.by_name = {}
+            for name in names:
+                if name in INSTALLED[entry_point]:
+                    instantiated.append('{0}.{1}'.format(entry_point, name))
+                    self.by_name[name] = Bunch(name=name, obj=_Plugin(entry_point, name))
+    return Manager
+
+
+@pytest.fixture
+def instantiated(monkeypatch):
+    instantiated = []
+    monkeypatch.setattr(PluginManager, '_registry', {})
+    for entry_point in INSTALLED:
+        module = types.ModuleType(entry_point + '.manager')
+        module.Manager = _manager(entry_point, instantiated)
+        monkeypatch.setitem(sys.modules, entry_point, types.ModuleType(entry_point))
+        monkeypatch.setitem(sys.modules, entry_point + '.manager', module)
+    monkeypatch.setattr(gator.plugins, 'entry_points',
+                        lambda group: [Bunch(name=name) for name in INSTALLED[group]])
+    return instantiated
+
+
+@pytest.fixture
+def config():
+    return Config(plugins=Config(entry_points=Config(
+        widget=Config(entry_point='gatortest.widget', **{'class': 'Manager'}),
+        metrics=Config(entry_point='gatortest.metrics', **{'class': 'Manager'}),
+    )), environments=Config())
+
+
+def test_only_the_environments_plugins_load(config, instantiated):
+    manager = PluginManager(config, None, plugins=Config(widget='fancy', metrics='statsd'))
+
+    assert instantiated == ['gatortest.widget.fancy', 'gatortest.metrics.statsd']
+    assert manager.find_by_kind('widget', 'fancy').obj.configured == 1
+    with pytest.raises(KeyError):
+        manager.find_by_kind('widget', 'plain')
+
+
+def test_metrics_default_to_the_logger(config, instantiated):
+    manager = PluginManager(config, None, plugins=Config(widget='plain'))
+
+    assert instantiated == ['gatortest.widget.plain', 'gatortest.metrics.logger']
+    assert manager.find_by_entry_point('gatortest.metrics', 'logger').obj.configured == 1
+
+
+def test_later_bakes_reuse_loaded_plugins(config, instantiated):
+    plugins = Config(widget='fancy', metrics='logger')
+    PluginManager(config, None, plugins=plugins)
+    manager = PluginManager(config, None, plugins=plugins)
+
+    # instantiated once, configured for every bake
+    assert instantiated == ['gatortest.widget.fancy', 'gatortest.metrics.logger']
+    assert manager.find_by_kind('widget', 'fancy').obj.configured == 2
+
+
+def test_unknown_plugin(config, instantiated):
+    with pytest.raises(ValueError):
+        PluginManager(config, None, plugins=Config(widget='missing'))
+
+
+def test_without_an_environment_everything_loads(config, instantiated):
+    PluginManager(config, None)
+
+    assert sorted(instantiated) == ['gatortest.metrics.logger', 'gatortest.metrics.statsd',
+                                    'gatortest.widget.fancy', 'gatortest.widget.plain']
@@ -0,0 +1,119 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_polling
+==================
+Poll schedules and the duration history bakes on a host share
+"""
+import multiprocessing
+import threading
+
+import pytest
+
+from gator.util import polling
+from gator.util.polling import PollHistory, Schedule, poll
+
+
+class _Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(polling, 'time', clock)
+    monkeypatch.setattr(polling, 'sleep', clock.sleep)
+    return clock
+
+
+def _record(filename, worker, count):
+    history = PollHistory(filename)
+    for index in range(count):
+        history.record('snapshot_completed', worker + 1, index)
+
+
+def test_backoff_without_an_estimate(clock):
+    schedule = Schedule('volume_available', min_interval=0.5, max_interval=2)
+
+    assert [schedule.next_delay() for _ in range(6)] == [0.5, 0.75, 1.125, 1.6875, 2, 2]
+
+
+def test_delay_halves_the_remaining_time(clock):
+    schedule = Schedule('snapshot_completed', min_interval=0.5, max_interval=15)
+    clock.now += 10
+
+    # half done after 10s: 10s to go
+    assert schedule.next_delay(progress=50) == 5
+    assert schedule.eta == 10
+    # progress below 5% says too little, so the interval backs off
+    assert schedule.next_delay(progress=2) == 0.5
+
+
+def test_delay_from_history_scaled_by_size(clock, tmp_path):
+    history = PollHistory(str(tmp_path / 'history.json'))
+    history.record('snapshot_completed', 10, 20)
+    history.record('snapshot_completed', 10, 40)
+    schedule = Schedule('snapshot_completed', history=history, size=5, min_interval=0.5, max_interval=60)
+
+    # a median of 3s per GB, for 5 GB
+    assert schedule.expected == 15
+    assert schedule.next_delay() == 7.5
+    clock.now += 20
+    # overdue: back to backing off
+    assert schedule.next_delay() == 0.5
+
+
+def test_timeout_caps_the_last_delay(clock):
+    schedule = Schedule('image_available', timeout=10, min_interval=0.5, max_interval=15)
+    clock.now += 9.8
+
+    assert schedule.next_delay() == 0.5
+    clock.now += 0.2
+    assert schedule.next_delay() is None
+
+
+def test_poll_records_the_duration(clock, tmp_path):
+    history = PollHistory(str(tmp_path / 'history.json'))
+    checks = iter([(False, None), (False, 40), (True, 100)])
+
+    assert poll(lambda: next(checks), 'snapshot_completed', history=history, size=8)
+
+    assert PollHistory(str(tmp_path / 'history.json')).predict('snapshot_completed', 8) == clock.now - 1000.0
+
+
+def test_poll_times_out(clock):
+    assert not poll(lambda: (False, None), 'image_available', timeout=5)
+    assert clock.now >= 1005
+
+
+def test_concurrent_records_are_all_kept(tmp_path):
+    filename = str(tmp_path / 'history' / 'history.json')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_record, args=(filename, worker, 10)) for worker in range(4)]
+    workers.append(threading.Thread(target=_record, args=(filename, 4, 10)))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    samples = PollHistory(filename, samples=100)._load()['snapshot_completed']
+    assert sorted(samples) == sorted([size, seconds] for size in range(1, 6) for seconds in range(10))
+
+
+def test_history_keeps_the_newest_samples(tmp_path):
+    history = PollHistory(str(tmp_path / 'history.json'), samples=3)
+    for seconds in range(5):
+        history.record('volume_available', None, seconds)
+
+    assert PollHistory(str(tmp_path / 'history.json')).predict('volume_available') == 3
@@ -0,0 +1,46 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_ratelimit
+====================
+Host-wide token buckets
+"""
+import json
+
+from gator.util import ratelimit
+from gator.util.ratelimit import RateLimiter
+
+
+def _limiter(tmp_path, rate, **kwargs):
+    limiter = RateLimiter(str(tmp_path / 'rate-limit.json'), families={'describe': {'rate': rate, 'burst': 100}}, **kwargs)
+    updates = []
+    update = limiter._update
+    limiter._update = lambda change: updates.append(change) or update(change)
+    return limiter, updates
+
+
+def test_tokens_are_leased_a_few_at_a_time(tmp_path):
+    # refilling too slowly to matter here
+    limiter, updates = _limiter(tmp_path, 0.01, lease=10)
+    for _ in range(25):
+        assert limiter.acquire('describe') == 0.0
+
+    assert len(updates) == 3
+    state = json.loads((tmp_path / 'rate-limit.json').read_text())
+    assert 69 < state['describe']['tokens'] < 71
+
+
+def test_throttle_drops_the_lease(tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ratelimit, 'sleep', sleeps.append)
+    limiter, updates = _limiter(tmp_path, 1000, lease=10)
+    limiter.acquire('describe')
+    backoff = limiter.throttled('describe')
+    waited = limiter.acquire('describe')
+
+    assert len(updates) == 3
+    assert 0 < waited <= backoff and sleeps == [waited]
@@ -0,0 +1,72 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_state_poller
+=======================
+The shared poller for in-flight volumes, snapshots and images
+"""
+import contextvars
+from time import sleep
+
+import pytest
+
+from gator.plugins.cloud.state_poller import StatePoller
+
+bake = contextvars.ContextVar('bake')
+
+
+def _done(record):
+    return record is not None, None
+
+
+def _poller(**kwargs):
+    return StatePoller(min_interval=0.01, max_interval=0.05, timeout=5, **kwargs)
+
+
+def test_describe_runs_as_the_watching_bake():
+    calls = []
+
+    def describe(kind, resource_ids):
+        calls.append((kind, resource_ids, bake.get()))
+        return dict((resource_id, {'id': resource_id}) for resource_id in resource_ids)
+
+    def watch(name):
+        bake.set(name)
+        return poller.watch('image', 'ami-{0}'.format(name), _done, 'image_available', describe)
+
+    poller = _poller()
+    futures = [contextvars.copy_context().run(watch, name) for name in ('a', 'b')]
+
+    assert [future.result(5) for future in futures] == [{'id': 'ami-a'}, {'id': 'ami-b'}]
+    assert set(bake_ for _, _, bake_ in calls) <= {'a', 'b'}
+
+
+def test_describe_failures_retry_only_when_retryable():
+    failures = [IOError('reset'), ValueError('InvalidAMIID.NotFound')]
+
+    def describe(kind, resource_ids):
+        raise failures.pop(0)
+
+    poller = _poller(retryable=lambda e: isinstance(e, IOError))
+    future = poller.watch('image', 'ami-a', _done, 'image_available', describe)
+
+    with pytest.raises(ValueError):
+        future.result(5)
+    assert failures == []
+
+
+def test_cancelled_watch_leaves_the_poller_running():
+    def describe(kind, resource_ids):
+        return dict((resource_id, {'id': resource_id}) for resource_id in resource_ids)
+
+    poller = _poller()
+    # no record yet: polled until its deadline
+    cancelled = poller.watch('volume', 'vol-a', lambda record: (False, None), 'volume_available', describe, timeout=0.1)
+    assert cancelled.cancel()
+    sleep(0.3)
+
+    assert poller.watch('image', 'ami-b', _done, 'image_available', describe).result(5) == {'id': 'ami-b'}
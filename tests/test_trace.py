@@ -0,0 +1,104 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_trace
+================
+Bake timelines: span recording, the Chrome trace export and the summary
+"""
+import contextvars
+import json
+import os
+from time import sleep
+
+import pytest
+
+from gator.environment import Environment
+from gator.stages import StageGraph
+from gator.util import trace
+
+
+@pytest.fixture
+def timeline():
+    timeline = trace.activate(trace.Timeline())
+    yield timeline
+    trace.activate(None)
+
+
+def test_spans_need_a_timeline():
+    with trace.span('nothing'):
+        pass
+    assert trace.active() is None
+
+
+def test_nested_spans(timeline):
+    with trace.span('outer', 'stage'):
+        with trace.span('inner', trace.WAIT, delay=1):
+            pass
+
+    inner, outer = timeline.events
+    assert (inner['name'], inner['cat'], inner['args']) == ('inner', trace.WAIT, {'delay': 1})
+    assert outer['start'] <= inner['start'] <= inner['end'] <= outer['end']
+
+
+def test_recording_keeps_a_bake_to_its_own_timeline(timeline):
+    def bake():
+        with trace.recording(trace.Timeline()) as own:
+            with trace.span('bake call', 'call'):
+                pass
+        return own
+
+    own = contextvars.copy_context().run(bake)
+    with trace.span('process call', 'call'):
+        pass
+
+    assert [event['name'] for event in own.events] == ['bake call']
+    assert [event['name'] for event in timeline.events] == ['process call']
+
+
+def test_chrome_trace_export(timeline, tmp_path):
+    timeline.add('snapshot', 'call', timeline.start + 0.5, timeline.start + 0.75, resource='snap-1')
+    filename = str(tmp_path / 'bake.trace.json')
+
+    timeline.write_chrome_trace(filename)
+
+    with open(filename) as f:
+        exported = json.load(f)
+    metadata, event = exported['traceEvents']
+    assert (metadata['ph'], metadata['name'], metadata['tid']) == ('M', 'thread_name', event['tid'])
+    assert (event['ph'], event['ts'], event['dur'], event['pid']) == ('X', 500000, 250000, os.getpid())
+    assert (event['name'], event['cat'], event['args']) == ('snapshot', 'call', {'resource': 'snap-1'})
+
+
+def test_critical_path_and_summary(timeline):
+    graph = StageGraph(workers=2)
+    graph.add('slow', lambda: sleep(0.05) or True)
+    graph.add('fast', lambda: True)
+    graph.add('last', lambda slow, fast: True, requires=('slow', 'fast'))
+    assert graph.run()
+    with trace.span('poll image_available', trace.WAIT):
+        sleep(0.01)
+
+    assert timeline.critical_path() == ['slow', 'last']
+    summary = timeline.summary()
+    assert summary.splitlines()[0].split() == ['CATEGORY', 'NAME', 'COUNT', 'SECONDS']
+    assert 'critical path: slow > last' in summary
+    waited = float(summary.rsplit('waiting (retry sleeps, polling): ', 1)[1].rstrip('s'))
+    assert waited >= 0.01
+
+
+def test_bake_writes_its_timeline(config, tmp_path, timeline):
+    config.trace.directory = str(tmp_path)
+    config.context.trace = True
+    environment = Environment()
+    environment._config = config
+    with trace.span('provision', 'stage'):
+        pass
+
+    environment._write_timeline(timeline, 'bake1')
+
+    with open(str(tmp_path / 'bake1.trace.json')) as f:
+        assert [event['name'] for event in json.load(f)['traceEvents'] if event['ph'] == 'X'] == ['provision']
@@ -0,0 +1,49 @@
+#
+#
+# Copyright 2022 Hale Terminal LLC
+#
+#
+
+"""
+tests.test_volume_pool
+======================
+Claiming pooled volumes
+"""
+from bunch import Bunch
+
+from gator.plugins.cloud.volume_pool import VolumePool
+
+
+class PoolApi(object):
+    """ two pooled volumes whose tags still read pooled, the first already attached elsewhere """
+    def __init__(self):
+        self.tags = []
+
+    def __call__(self, operation, **params):
+        if operation == 'describe_volumes':
+            return {'Volumes': [{'VolumeId': volume_id, 'State': 'available'} for volume_id in ('vol-1', 'vol-2')]}
+        if operation == 'create_tags':
+            self.tags.append((params['Resources'], params['Tags']))
+            return {}
+        raise AssertionError(operation)
+
+
+def test_the_attach_is_the_claim(tmp_path):
+    api = PoolApi()
+    pool = VolumePool(api, lock_file=str(tmp_path / 'volume-pool'))
+    claims = []
+
+    def claim(volume_id):
+        claims.append(volume_id)
+        return volume_id != 'vol-1'
+
+    volume_id = pool.take(Bunch(id='ami-1'), 'gp3', 8, 'us-west-2a', claim)
+
+    assert volume_id == 'vol-2'
+    assert claims == ['vol-1', 'vol-2']
+    assert api.tags == [(['vol-2'], [{'Key': 'status', 'Value': 'busy'}])]
+
+
+def test_empty_pool(tmp_path):
+    pool = VolumePool(PoolApi(), lock_file=str(tmp_path / 'volume-pool'))
+    assert pool.take(Bunch(id='ami-1'), 'gp3', 8, 'us-west-2a', lambda volume_id: False) is None